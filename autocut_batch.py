@@ -0,0 +1,190 @@
+# autocut_batch.py
+import os, sys, csv, json, time, traceback, contextlib, psutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import autocut_core
+
+MEDIA_EXTENSIONS = ('.mp3', '.wav', '.m4a', '.flac', '.aac', '.mp4')
+JOB_MEMORY = 512 * 1024**2  # 每个并发任务预留的内存，用于估算进程池大小
+DEFAULT_RETRIES = 2
+
+def discover_jobs(directory, output_dir, output_format="mp3"):
+    """扫描目录: 每个音视频文件与同名 .srt 组成一个任务，处理全部字幕"""
+    jobs = []
+    for name in sorted(os.listdir(directory)):
+        stem, ext = os.path.splitext(name)
+        srt_path = os.path.join(directory, stem + ".srt")
+        if ext.lower() in MEDIA_EXTENSIONS and os.path.exists(srt_path):
+            jobs.append({'input': os.path.join(directory, name), 'srt': srt_path, 'format': output_format})
+    return normalize_jobs(jobs, output_dir, output_format)
+
+def load_manifest(path, output_dir, output_format="mp3"):
+    """
+    读取任务清单 (JSON 数组或带表头的 CSV)。字段: input, 以及可选的
+    srt (缺省时用语音检测只剪掉静音), output, output_srt, start, end, format, quality, filter, engine
+    """
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        if path.lower().endswith('.csv'):
+            jobs = [{k: v for k, v in row.items() if v not in (None, '')} for row in csv.DictReader(f)]
+        else:
+            jobs = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    for job in jobs:
+        for key in ('input', 'srt', 'filter'):
+            if job.get(key) and not os.path.isabs(job[key]):
+                job[key] = os.path.join(base, job[key])
+    return normalize_jobs(jobs, output_dir, output_format)
+
+def normalize_jobs(jobs, output_dir, output_format):
+    """
+    补全默认值: 输出文件名取自输入文件名，范围缺省为全部字幕 (end 为 None)。
+    多个输入同名不同扩展名 (如 a.mp3 与 a.wav) 时，默认输出名带上源扩展名，仍重名时再加序号，
+    避免并发的任务互相覆盖输出、字幕与日志
+    """
+    exts = {}
+    for job in jobs:
+        if not job.get('output') or not job.get('output_srt'):
+            stem, ext = os.path.splitext(os.path.basename(job['input']))
+            exts.setdefault(stem, set()).add(ext.lower())
+    used = set()
+    normalized = []
+    for job in jobs:
+        job = dict(job)
+        job.setdefault('format', output_format)
+        stem, ext = os.path.splitext(os.path.basename(job['input']))
+        if not job.get('output') or not job.get('output_srt'):
+            if len(exts[stem]) > 1:
+                stem = f"{stem}_{ext.lstrip('.').lower()}"
+            name, n = stem, 1
+            while name in used:
+                n += 1
+                name = f"{stem}_{n}"
+            used.add(name)
+            stem = name
+        job.setdefault('output', os.path.join(output_dir, f"{stem}_cut.{job['format']}"))
+        job.setdefault('output_srt', os.path.join(output_dir, f"{stem}_cut.srt"))
+        job['start'] = int(job.get('start') or 1)
+        job['end'] = int(job['end']) if job.get('end') else None
+        normalized.append(job)
+    return normalized
+
+def pool_size(requested=None):
+    """按 CPU 核数和可用内存确定并发进程数"""
+    if requested:
+        return max(1, requested)
+    by_memory = psutil.virtual_memory().available // JOB_MEMORY
+    return max(1, min(os.cpu_count() or 1, by_memory))
+
+def _init_worker(use_cache=False, memory_budget=None):
+    """
+    工作进程启动时预热: ffmpeg 能力探测与缓存实例在进程内复用，之后的任务不再重复。
+    memory_budget 为分给本进程的内存预算 (字节)，各进程合计不超过总预算
+    """
+    if memory_budget:
+        autocut_core.MEMORY_BUDGET = str(memory_budget)
+    autocut_core.get_ffmpeg_capabilities()
+    if use_cache:
+        autocut_core.get_media_cache()
+
+def run_job(job, inner_workers, retries, use_cache=False):
+    """在工作进程中执行单个任务，失败时重试；日志写入输出文件旁的 .log"""
+    os.makedirs(os.path.dirname(os.path.abspath(job['output'])), exist_ok=True)
+    log_path = os.path.splitext(job['output'])[0] + ".log"
+    result = {'input': job['input'], 'output': job['output'], 'status': 'failed', 'attempts': 0, 'error': None}
+    started = time.time()
+    with open(log_path, 'w', encoding='utf-8') as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        for attempt in range(1, retries + 2):
+            result['attempts'] = attempt
+            ctx = autocut_core.JobContext(max_workers=inner_workers, quality=job.get('quality', 'high'),
+                                          cache=autocut_core.get_media_cache() if use_cache else None)
+            try:
+                autocut_core.main(job['input'], job.get('srt'), job['output'], job['output_srt'],
+                                  job.get('filter', ''), job['start'], job['end'],
+                                  output_format=job['format'], quality=job.get('quality', 'high'),
+                                  ctx=ctx, engine=job.get('engine', 'stream'))
+                result.update(status='ok', error=None)
+                break
+            except (FileNotFoundError, ValueError) as e:
+                # 输入或参数错误，重试也不会成功
+                result['error'] = str(e)
+                break
+            except Exception as e:
+                result['error'] = str(e)
+                traceback.print_exc()
+                time.sleep(min(2 ** attempt, 30))
+            finally:
+                ctx.close()
+    result['elapsed'] = round(time.time() - started, 2)
+    result['size'] = os.path.getsize(job['output']) if result['status'] == 'ok' else 0
+    result['log'] = log_path
+    return result
+
+def run_batch(jobs, workers=None, retries=DEFAULT_RETRIES, report_path=None, use_cache=False):
+    """把任务分派到进程池，全部结束后写出汇总报告并返回结果列表"""
+    workers = min(pool_size(workers), max(1, len(jobs)))
+    inner_workers = max(1, (os.cpu_count() or 1) // workers)
+    # 总预算在工作进程间平分，否则每个进程都会各自按可用内存的一半计算
+    total_budget = (autocut_core.parse_size(autocut_core.MEMORY_BUDGET) if autocut_core.MEMORY_BUDGET
+                    else psutil.virtual_memory().available // 2)
+    print(f"🚀 批处理: {len(jobs)} 个任务, {workers} 个进程 (每个任务 {inner_workers} 线程)")
+    autocut_core.get_ffmpeg_capabilities()  # 主进程先探测一次并写入磁盘缓存，工作进程直接读取
+
+    results, started = [], time.time()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(use_cache, total_budget // workers)) as executor:
+        futures = {executor.submit(run_job, job, inner_workers, retries, use_cache): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # 工作进程异常退出 (如被系统杀掉)
+                result = {'input': job['input'], 'output': job['output'], 'status': 'failed',
+                          'attempts': 0, 'error': str(e), 'elapsed': 0, 'size': 0, 'log': None}
+            results.append(result)
+            mark = "✅" if result['status'] == 'ok' else "❌"
+            print(f"{mark} [{len(results)}/{len(jobs)}] {os.path.basename(result['input'])} "
+                  f"({result['elapsed']}s, 尝试 {result['attempts']} 次){'' if result['status'] == 'ok' else ': ' + str(result['error'])}")
+
+    summary = {
+        'total': len(results),
+        'succeeded': sum(1 for r in results if r['status'] == 'ok'),
+        'failed': sum(1 for r in results if r['status'] != 'ok'),
+        'elapsed': round(time.time() - started, 2),
+        'workers': workers,
+        'jobs': sorted(results, key=lambda r: r['input']),
+    }
+    if report_path:
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        print(f"📝 汇总报告: {report_path}")
+    print(f"🏁 完成 {summary['succeeded']}/{summary['total']}，失败 {summary['failed']}，耗时 {summary['elapsed']}s")
+    return summary
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='AutoCut 批处理: 处理整个目录或任务清单',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('source', help='输入目录 (音视频与同名SRT配对) 或任务清单 (.json/.csv)')
+    parser.add_argument('--output-dir', required=True, help='输出目录')
+    parser.add_argument('--format', choices=['mp3', 'm4a', 'wav', 'mp4'], default='mp3', help='默认输出格式')
+    parser.add_argument('--workers', type=int, default=None, help='并发进程数 (默认按CPU与内存自动确定)')
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES, help='失败任务的重试次数')
+    parser.add_argument('--report', default=None, help='汇总报告路径 (默认 输出目录/batch_report.json)')
+    parser.add_argument('--cache', action='store_true', help='读写持久缓存 (解码结果与输出在重跑时复用)')
+
+    args = parser.parse_args()
+    os.makedirs(args.output_dir, exist_ok=True)
+    if os.path.isdir(args.source):
+        jobs = discover_jobs(args.source, args.output_dir, args.format)
+    else:
+        jobs = load_manifest(args.source, args.output_dir, args.format)
+    if not jobs:
+        print("⚠️ 没有找到任务")
+        sys.exit(1)
+
+    summary = run_batch(jobs, args.workers, args.retries,
+                        args.report or os.path.join(args.output_dir, "batch_report.json"), args.cache)
+    sys.exit(0 if summary['failed'] == 0 else 1)
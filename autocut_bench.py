@@ -0,0 +1,308 @@
+# autocut_bench.py
+import os, sys, json, time, random, shutil, tempfile, threading, platform, subprocess, multiprocessing, statistics
+from concurrent.futures import ProcessPoolExecutor
+try:
+    import resource  # 仅 POSIX 提供峰值内存统计
+except ImportError:
+    resource = None
+
+import autocut_core
+
+# 规模预设: (字幕行数, 音频时长秒)
+SIZES = {
+    'xs': (1000, 600),
+    's': (5000, 1800),
+    'm': (10000, 3600),
+    'l': (50000, 3 * 3600),
+    'xl': (100000, 5 * 3600),
+}
+TARGETS = ('parse_srt', 'process_subtitles', 'numpy_cut', 'cut_by_segments', 'main_stream', 'main_numpy')
+FILTER_WORDS = ["嗯", "啊", "那", "哦", "呃", "对吧", "是不是", "明白吗", "OK"]
+DEFAULT_FILTER_RATIO = 0.2
+DEFAULT_TOLERANCE = 0.10  # 相对基线慢出此比例即判为退化
+DEFAULT_MIN_DELTA = 0.05  # 同时还要慢出此秒数才判为退化，短测试项的几毫秒抖动不算
+TEMP_SAMPLE_INTERVAL = 0.2  # 临时目录占用的采样间隔 (秒)
+
+def fixture_name(lines, seconds, filter_ratio, audio_kind):
+    return f"{audio_kind}_{seconds}s_{lines}l_{int(filter_ratio * 100)}f"
+
+def generate_audio(path, seconds, kind="sine", sample_rate=autocut_core.STREAM_SAMPLE_RATE,
+                   channels=autocut_core.STREAM_CHANNELS):
+    """用 lavfi 生成测试音频: sine 为 440Hz 正弦波, noise 为粉红噪声；编码格式由扩展名决定"""
+    if kind == "noise":
+        source = f"anoisesrc=d={seconds}:c=pink:r={sample_rate}:a=0.1"
+    else:
+        source = f"sine=frequency=440:sample_rate={sample_rate}:duration={seconds}"
+    cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-f", "lavfi", "-i", source,
+           "-ac", str(channels)]
+    if path.lower().endswith(".mp3"):
+        cmd += ["-c:a", "libmp3lame", "-b:a", "128k"]
+    else:
+        cmd += ["-c:a", "pcm_s16le", "-rf64", "auto"]
+    subprocess.run(cmd + [path], check=True)
+
+def _srt_time(seconds):
+    ms = int(round(seconds * 1000))
+    return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d},{ms % 1000:03d}"
+
+def generate_subtitles(path, lines, seconds, filter_ratio=DEFAULT_FILTER_RATIO, seed=0):
+    """
+    均匀铺满整段音频的字幕，每条占时间槽的 60%-95%；filter_ratio 比例的行内容取自过滤词，
+    扩展名为 .ass 时另存为 ASS
+    """
+    rng = random.Random(seed)
+    slot = seconds / lines
+    blocks = []
+    for i in range(lines):
+        start = i * slot + rng.uniform(0, slot * 0.05)
+        end = min(seconds, start + slot * rng.uniform(0.6, 0.95))
+        text = rng.choice(FILTER_WORDS) if rng.random() < filter_ratio else f"第{i + 1}句 测试字幕内容"
+        blocks.append(f"{i + 1}\n{_srt_time(start)} --> {_srt_time(end)}\n{text}\n")
+    content = "\n".join(blocks)
+    if path.lower().endswith(".ass"):
+        import pysubs2
+        pysubs2.SSAFile.from_string(content, format_="srt").save(path)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+
+def prepare_fixtures(fixture_dir, lines, seconds, filter_ratio=DEFAULT_FILTER_RATIO, audio_kind="sine"):
+    """生成 (或复用已生成的) 一组测试输入，返回各文件路径"""
+    name = fixture_name(lines, seconds, filter_ratio, audio_kind)
+    os.makedirs(fixture_dir, exist_ok=True)
+    paths = {
+        'mp3': os.path.join(fixture_dir, f"{name}.mp3"),
+        'wav': os.path.join(fixture_dir, f"{name}.wav"),
+        'srt': os.path.join(fixture_dir, f"{name}.srt"),
+        'ass': os.path.join(fixture_dir, f"{name}.ass"),
+        'filter': os.path.join(fixture_dir, "filter.txt"),
+    }
+    for key in ('wav', 'mp3'):
+        if not os.path.exists(paths[key]):
+            print(f"🎵 生成测试音频: {os.path.basename(paths[key])}")
+            # 先写临时文件再改名，中断后不会留下不完整的输入
+            partial = paths[key] + ".part" + os.path.splitext(paths[key])[1]
+            generate_audio(partial, seconds, audio_kind)
+            os.replace(partial, paths[key])
+    for key in ('srt', 'ass'):
+        if not os.path.exists(paths[key]):
+            generate_subtitles(paths[key], lines, seconds, filter_ratio)
+    if not os.path.exists(paths['filter']):
+        with open(paths['filter'], "w", encoding="utf-8") as f:
+            f.write("\n".join(FILTER_WORDS))
+    paths.update(lines=lines, seconds=seconds, filter_ratio=filter_ratio, audio_kind=audio_kind)
+    return paths
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+class _TempMonitor:
+    """后台线程定期统计临时目录大小，记录峰值"""
+    def __init__(self, path):
+        self.path = path
+        self.peak = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self.stopped.wait(TEMP_SAMPLE_INTERVAL):
+            self.peak = max(self.peak, _dir_size(self.path))
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+        self.peak = max(self.peak, _dir_size(self.path))
+
+def _setup_target(target, fx, workdir):
+    """准备输入 (不计时)，返回被测调用与需要附加到结果里的信息"""
+    filter_words = autocut_core.read_filter_file(fx['filter'])
+    if target == 'parse_srt':
+        return (lambda: autocut_core.parse_srt(fx['srt'])), {}
+
+    if target == 'numpy_cut':
+        subtitles = [s for s in autocut_core.parse_srt(fx['srt']) if s[3].strip() not in filter_words]
+        out = os.path.join(workdir, "numpy_cut.wav")
+        return (lambda: autocut_core.cut_audio_segments_with_numpy_parallel(fx['wav'], subtitles, out, 0.0)), {}
+
+    if target in ('main_stream', 'main_numpy'):
+        engine = target.split('_', 1)[1]
+        report = os.path.join(workdir, f"{target}_report.json")
+        def run():
+            autocut_core.main(fx['mp3'], fx['srt'], os.path.join(workdir, f"{target}.mp3"),
+                              os.path.join(workdir, f"{target}.srt"), fx['filter'], 1, fx['lines'],
+                              engine=engine, use_cache=False, report_path=report)
+        return run, {'stage_report': report}
+
+    import pysubs2
+    from autocut_with_sub import SubtitleProcessor, AUDIO_FORMATS
+    subs = pysubs2.load(fx['ass'], encoding="utf-8")
+    if target == 'process_subtitles':
+        return (lambda: SubtitleProcessor.process_subtitles(subs, 1, fx['lines'], filter_words)), {}
+    if target == 'cut_by_segments':
+        _, segments = SubtitleProcessor.process_subtitles(subs, 1, fx['lines'], filter_words)
+        out = os.path.join(workdir, "cut_by_segments.mp3")
+        def run():
+            if not SubtitleProcessor.cut_audio_by_segments(fx['mp3'], out, segments, AUDIO_FORMATS["MP3 (高质量)"]):
+                raise RuntimeError("cut_audio_by_segments 返回失败")
+        return run, {}
+    raise ValueError(f"未知的测试项: {target}")
+
+def _run_case(target, fx, workdir):
+    """在独立子进程中执行单个测试项，峰值内存只反映这一项"""
+    temp_root = os.path.join(workdir, "tmp")
+    os.makedirs(temp_root, exist_ok=True)
+    tempfile.tempdir = temp_root  # JobContext 与 TemporaryDirectory 都建在这里，便于统计磁盘占用
+    sys.stdout = open(os.path.join(workdir, f"{target}.log"), "w", encoding="utf-8")
+    sys.stderr = sys.stdout
+
+    run, extra = _setup_target(target, fx, workdir)
+    wall, cpu = time.perf_counter(), time.process_time()
+    with _TempMonitor(temp_root) as monitor:
+        run()
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+    result = {'wall': round(wall, 4), 'cpu': round(cpu, 4), 'peak_temp_mb': round(monitor.peak / 1024**2, 1)}
+    if resource:
+        scale = 1024 if platform.system() == 'Darwin' else 1  # macOS 的 ru_maxrss 单位为字节
+        self_usage = resource.getrusage(resource.RUSAGE_SELF)
+        child_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        result.update(peak_rss_mb=round(self_usage.ru_maxrss / scale / 1024, 1),
+                      child_peak_rss_mb=round(child_usage.ru_maxrss / scale / 1024, 1),
+                      child_cpu=round(child_usage.ru_utime + child_usage.ru_stime, 4))
+    if extra.get('stage_report') and os.path.exists(extra['stage_report']):
+        with open(extra['stage_report'], encoding='utf-8') as f:
+            result['stages'] = {name: entry['wall'] for name, entry in json.load(f)['totals'].items()}
+    sys.stdout.close()
+    return result
+
+def run_benchmarks(sizes, targets, fixture_dir, filter_ratio=DEFAULT_FILTER_RATIO, audio_kind="sine", repeat=1):
+    """
+    逐个规模、逐个测试项运行，每次都在新的子进程中执行；同一项重复多次时取最快的一次，
+    并记录各次墙钟时间的中位数 (wall_median) 供基线对比
+    """
+    results = []
+    spawn = multiprocessing.get_context("spawn")
+    for size in sizes:
+        lines, seconds = SIZES[size] if isinstance(size, str) else size
+        fx = prepare_fixtures(fixture_dir, lines, seconds, filter_ratio, audio_kind)
+        for target in targets:
+            best, walls = None, []
+            for _ in range(repeat):
+                workdir = tempfile.mkdtemp(prefix=f"bench_{target}_", dir=fixture_dir)
+                try:
+                    with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as executor:
+                        result = executor.submit(_run_case, target, fx, workdir).result()
+                except Exception as e:
+                    result = {'error': str(e)}
+                finally:
+                    shutil.rmtree(workdir, ignore_errors=True)
+                if 'error' in result or best is None or result['wall'] < best['wall']:
+                    best = result
+                if 'error' in result:
+                    break
+                walls.append(result['wall'])
+            best.update(target=target, size=size if isinstance(size, str) else f"{lines}l_{seconds}s",
+                        lines=lines, audio_seconds=seconds)
+            if 'wall' in best:
+                best['wall_median'] = round(statistics.median(walls), 4)
+                best['throughput'] = round(seconds / best['wall'], 2) if best['wall'] else None
+                best['lines_per_second'] = round(lines / best['wall'], 1) if best['wall'] else None
+            print(format_result(best))
+            results.append(best)
+    return results
+
+def format_result(r):
+    if 'error' in r:
+        return f"❌ {r['size']:>4} {r['target']:<18} 失败: {r['error']}"
+    # 墙钟时间为 0 (计时精度不足) 时没有吞吐量
+    throughput = f"{r['throughput']:>9.1f}x" if r.get('throughput') is not None else f"{'n/a':>10}"
+    return (f"⏱️ {r['size']:>4} {r['target']:<18} {r['wall']:>9.3f}s  "
+            f"{throughput} 实时  {r.get('peak_rss_mb', 0):>7.1f}MB RSS  "
+            f"{r.get('child_peak_rss_mb', 0):>7.1f}MB ffmpeg  {r['peak_temp_mb']:>8.1f}MB 临时")
+
+def compare_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE, min_delta=DEFAULT_MIN_DELTA):
+    """
+    与基线逐项对比墙钟时间 (两边都有多次重复的中位数时用中位数)，返回退化项列表。
+    相对变慢超过 tolerance 且绝对变慢超过 min_delta 秒才算退化
+    """
+    previous = {(r['size'], r['target']): r for r in baseline.get('results', []) if 'wall' in r}
+    regressions = []
+    print(f"\n📊 与基线对比 (容差 {tolerance:.0%}，且至少 {min_delta * 1000:.0f}ms):")
+    for r in results:
+        old = previous.get((r['size'], r['target']))
+        if not old or 'wall' not in r:
+            continue
+        key = 'wall_median' if 'wall_median' in r and 'wall_median' in old else 'wall'
+        delta = r[key] - old[key]
+        ratio = r[key] / old[key] if old[key] else 1.0
+        slower = ratio > 1 + tolerance and delta > min_delta
+        faster = ratio < 1 - tolerance and -delta > min_delta
+        mark = "🔴" if slower else ("🟢" if faster else "⚪")
+        print(f"{mark} {r['size']:>4} {r['target']:<18} {old[key]:>9.3f}s → {r[key]:>9.3f}s ({ratio:.2f}x)")
+        if slower:
+            regressions.append({'size': r['size'], 'target': r['target'], 'baseline': old[key],
+                                'wall': r[key], 'ratio': round(ratio, 3)})
+    return regressions
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='AutoCut 性能基准: 生成合成音频/字幕并测量各处理环节',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('--sizes', default='xs',
+                        help=f'规模预设, 逗号分隔 ({", ".join(f"{k}={v[0]}行/{v[1] // 60}分钟" for k, v in SIZES.items())})，'
+                             f'也可写成 行数x秒数, 如 2000x900')
+    parser.add_argument('--targets', default=','.join(TARGETS), help='测试项, 逗号分隔')
+    parser.add_argument('--fixtures', default=os.path.join(autocut_core.CACHE_ROOT, 'bench'),
+                        help='测试输入目录 (生成后复用)')
+    parser.add_argument('--filter-ratio', type=float, default=DEFAULT_FILTER_RATIO, help='字幕命中过滤词的比例')
+    parser.add_argument('--audio', choices=['sine', 'noise'], default='sine', help='测试音频类型')
+    parser.add_argument('--repeat', type=int, default=1, help='每项重复次数 (取最快一次，对比基线时用中位数)')
+    parser.add_argument('--output', default=None, help='结果 JSON 路径')
+    parser.add_argument('--baseline', default=None, help='基线 JSON (此前 --output 的结果)，用于对比')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='判为退化的相对变慢比例')
+    parser.add_argument('--min-delta', type=float, default=DEFAULT_MIN_DELTA, help='判为退化的最小绝对变慢秒数')
+
+    args = parser.parse_args()
+    sizes = []
+    for item in args.sizes.split(','):
+        item = item.strip()
+        if item in SIZES:
+            sizes.append(item)
+        else:
+            lines, seconds = item.lower().split('x')
+            sizes.append((int(lines), int(seconds)))
+    targets = [t.strip() for t in args.targets.split(',') if t.strip()]
+    unknown = set(targets) - set(TARGETS)
+    if unknown:
+        parser.error(f"未知的测试项: {', '.join(sorted(unknown))}")
+
+    print(f"🚀 基准测试: 规模 {args.sizes}, 测试项 {', '.join(targets)}")
+    print("🖥️ 系统信息:", autocut_core.get_system_info())
+    results = run_benchmarks(sizes, targets, args.fixtures, args.filter_ratio, args.audio, args.repeat)
+    summary = {'created_at': time.time(), 'system': autocut_core.get_system_info(),
+               'filter_ratio': args.filter_ratio, 'audio': args.audio, 'results': results}
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare_baseline(results, json.load(f), args.tolerance, args.min_delta)
+        summary['regressions'] = regressions
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        print(f"📝 结果已保存: {args.output}")
+    failed = any('error' in r for r in results)
+    sys.exit(1 if failed or regressions else 0)
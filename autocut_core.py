@@ -1,15 +1,389 @@
 # autocut_core.py v2.4.5
-import os, subprocess, wave, srt, numpy as np, shutil, tempfile, atexit
-import ctypes, time, psutil, platform
+import os, subprocess, srt, numpy as np, shutil, tempfile, atexit
+import ctypes, time, psutil, platform, threading, weakref, signal, struct, json, re, hashlib, contextlib
+import unicodedata
+try:
+    import resource  # 仅 POSIX 提供子进程资源统计
+except ImportError:
+    resource = None
+try:
+    import ahocorasick  # 可选: pyahocorasick，过滤词子串匹配用 Aho-Corasick 自动机
+except ImportError:
+    ahocorasick = None
+try:
+    import av  # 可选: PyAV，DecodeSession 在进程内解码，不启动 ffmpeg
+except ImportError:
+    av = None
+from collections import namedtuple
+from array import array
 from tqdm import tqdm
 from concurrent.futures import ThreadPoolExecutor
 
 BATCH_SIZE = 500
 MAX_WORKERS = min(4, os.cpu_count() or 2)
-TEMP_DIR = tempfile.mkdtemp(prefix="autocut_")
 FFMPEG_TIMEOUT = 600
+TERMINATE_GRACE = 5  # SIGTERM 之后等待多久再 SIGKILL (秒)
+MEMORY_BUDGET = os.environ.get('AUTOCUT_MEMORY_BUDGET')  # 如 "2G"；未设置时取首次使用时可用内存的一半
+MAX_BATCH_BYTES = 64 * 1024**2  # 单个切割批次的样本字节数上限
+CACHE_ROOT = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'autocut')
+CAPABILITY_CACHE_FILE = os.path.join(CACHE_ROOT, 'ffmpeg_caps.json')
+MEDIA_CACHE_DIR = os.environ.get('AUTOCUT_CACHE_DIR') or os.path.join(CACHE_ROOT, 'media')
+MEDIA_CACHE_BYTES = int(os.environ.get('AUTOCUT_CACHE_BYTES') or 20 * 1024**3)  # 超出后按最近使用时间淘汰
+FINGERPRINT_SAMPLE = 1 << 20  # 源文件指纹读取首尾各多少字节
+STREAM_SAMPLE_RATE = 44100
+STREAM_CHANNELS = 2
+STREAM_CHUNK_BYTES = 1 << 20  # 流式剪辑的读缓冲区大小，约 6 秒的 44.1kHz 立体声
+STREAM_END_TOLERANCE = 0.05   # 流式剪辑时解码结果比最后一个保留区间允许短缺的时长(秒)，吸收时长取整误差
+WINDOW_MERGE_GAP = 2.0  # 保留区间间隔小于此值(秒)时合并为同一个解码窗口，避免频繁seek
+WINDOW_PADDING = 0.05   # 解码窗口两端的余量(秒)
+WINDOW_MAX_SECONDS = 120  # 单个解码窗口的最长时长(秒)，更长的窗口拆开，使并行解码有活可分
+SNAP_HOP = 0.01         # 切点对齐时短时能量的分析帧长(秒)
+SNAP_QUIET_DB = 6.0     # 比对齐窗口内最低能量高出不超过此值(dB)的分析帧都算作安静
+SNAP_SILENCE_DB = -60.0 # 低于此电平(dBFS)的分析帧总是算作安静
+SPLICE_SECONDS = 0.01   # 拼接处交叉淡化的总时长，过零对齐时为查找范围的两倍(秒)
+SPLICE_MODES = ('crossfade', 'zerocross')
+VAD_SAMPLE_RATE = 16000  # 语音检测时解码的采样率 (单声道)
+VAD_HOP = 0.02           # 语音检测的分析帧长(秒)
+VAD_CHUNK_SECONDS = 60   # 语音检测按此时长分块并行计算
+VAD_MARGIN_DB = 12.0     # 比底噪高出此值(dB)的分析帧算作有声
+VAD_SILENCE_DB = -50.0   # 低于此电平(dBFS)的分析帧总是算作静音
+VAD_MIN_SILENCE = 0.6    # 短于此值(秒)的停顿不剪掉
+VAD_MIN_SPEECH = 0.15    # 短于此值(秒)的有声片段视为噪声丢弃
+VAD_PADDING = 0.1        # 每个有声片段两端保留的余量(秒)
+VAD_LABEL = "[语音]"     # 检测出的片段在字幕中的文本
 
-atexit.register(lambda: [clean_temp_files(), kill_ffmpeg_processes()])
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# (格式码, 位深) -> 样本格式名
+WAV_SAMPLE_FORMATS = {
+    (WAVE_FORMAT_PCM, 8): 'u8',
+    (WAVE_FORMAT_PCM, 16): 's16',
+    (WAVE_FORMAT_PCM, 24): 's24',
+    (WAVE_FORMAT_PCM, 32): 's32',
+    (WAVE_FORMAT_IEEE_FLOAT, 32): 'f32',
+    (WAVE_FORMAT_IEEE_FLOAT, 64): 'f64',
+}
+# 样本格式名 -> 单个样本的 numpy 类型；s24 没有原生类型，按 3 个字节原样映射
+WAV_SAMPLE_DTYPES = {
+    'u8': np.dtype('u1'), 's16': np.dtype('<i2'), 's24': np.dtype('u1'),
+    's32': np.dtype('<i4'), 'f32': np.dtype('<f4'), 'f64': np.dtype('<f8'),
+}
+
+# 样本格式名 -> ffmpeg 原始 PCM 格式
+PCM_RAW_FORMATS = {'u8': 'u8', 's16': 's16le', 's24': 's24le', 's32': 's32le', 'f32': 'f32le', 'f64': 'f64le'}
+
+# MP3 帧头查表: 比特率 (kbps) 按 [是否 MPEG1][索引]，采样率按 [版本位][索引]
+MP3_BITRATES = {
+    True: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    False: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MP3_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+MP3_PREROLL_FRAMES = 8              # 分块编码时每块向前多编码的帧数
+PARALLEL_ENCODE_MIN_SECONDS = 1800  # 输出长于此值 (秒) 才分块并行编码 MP3
+PARALLEL_ENCODE_CHUNK = 300         # 并行编码时每块的时长 (秒)
+RECUT_BUCKET = 50                   # 增量重剪时每个分块覆盖的源字幕条数 (超出内存批次大小的分块分几次编码)
+RECUT_FORMATS = ('mp3', 'wav')      # 支持增量重剪的输出格式
+# 智能剪切支持的源视频编码 -> (重编码边缘 GOP 所用的编码器, 把参数集写入码流的 bsf)
+SMART_CUT_CODECS = {'h264': ('libx264', 'h264_mp4toannexb'), 'hevc': ('libx265', 'hevc_mp4toannexb')}
+SMART_CUT_CRF = 18  # 边缘 GOP 重编码质量，尽量与流复制部分观感一致
+FILTER_CONCAT_FANIN = 64  # 分层 concat 时每个节点最多连接的片段数
+DECODE_SEEK_SECONDS = 30  # DecodeSession 向前跳过超过此值(秒)时 seek，而不是解码后丢弃
+DECODE_PREROLL = 0.5      # seek 时提前的时长(秒)，解码器由此预热，多出的部分读取后丢弃
+INEXACT_SEEK_FORMATS = ('mp3', 'aac')  # ffmpeg 输入端 -ss 不能精确到帧的容器 (时间戳按码率估算)
+SRT_READ_CHUNK = 4 << 20  # 解析字幕时每次读取的字符数
+FILTER_SEPARATOR = '\x1f'  # 批量过滤时拼接各条字幕所用的分隔符
+
+# 归一化时去掉的字符: 标点、空白与符号 (保留分隔符；下划线另行去掉)
+_NORMALIZE_DROP = re.compile(r'[^\w\x1f]')
+_REGEX_BACKREF = re.compile(r'\\\d|\(\?P=')
+
+# SRT 字幕头: 序号行 + 时间行；两个字幕头之间的文本即为上一条字幕的内容
+_SRT_HEADER = re.compile(r'^[ \t]*(\d+)[ \t]*\n[ \t]*(\d+):(\d+):(\d+)[,.](\d+)[ \t]*-->[ \t]*'
+                         r'(\d+):(\d+):(\d+)[,.](\d+)[^\n]*$', re.M)
+_SRT_TIMING_LINE = re.compile(rb'^[ \t]*\d+:\d+:\d+[,.]\d+[ \t]*-->', re.M)
+
+# 交叉淡化计划: 每个区间开头/结尾参与淡化的帧数 (即该拼接处淡化长度的一半)
+SplicePlan = namedtuple('SplicePlan', ['head', 'tail', 'sample_format'])
+
+WavLayout = namedtuple('WavLayout', ['sample_format', 'channels', 'sample_rate', 'sample_width',
+                                     'block_align', 'data_offset', 'frames', 'fmt_chunk'])
+
+# 所有尚未结束的任务，进程退出时统一清理
+_active_jobs = weakref.WeakSet()
+
+class ProcessRegistry:
+    """只记录本任务启动的 ffmpeg 进程组，终止时不会波及其他任务或主机上的其他 ffmpeg"""
+    def __init__(self):
+        self.processes = set()
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+        self.spawned = 0  # 累计启动的进程数，供性能报告统计
+
+    def spawn(self, cmd, **kwargs):
+        if self.cancelled.is_set():
+            raise RuntimeError("任务已取消")
+        if os.name == 'nt':
+            kwargs['creationflags'] = subprocess.CREATE_NO_WINDOW | subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            kwargs['start_new_session'] = True  # 子进程自成进程组，pgid == pid
+        proc = subprocess.Popen([get_short_path(cmd[0]), *cmd[1:]], **kwargs)
+        with self.lock:
+            self.processes.add(proc)
+            self.spawned += 1
+        # cancel() 先置位再终止已登记的进程；在此期间启动的进程登记后才能看到置位，由这里自行终止
+        if self.cancelled.is_set():
+            self.terminate(proc, grace=1)
+            raise RuntimeError("任务已取消")
+        return proc
+
+    def discard(self, proc):
+        with self.lock:
+            self.processes.discard(proc)
+
+    def terminate(self, proc, grace=TERMINATE_GRACE):
+        """先礼后兵：SIGTERM 让 ffmpeg 正常收尾，超时仍未退出再 SIGKILL 整个进程组"""
+        if proc.poll() is None:
+            try:
+                if os.name == 'nt':
+                    proc.send_signal(signal.CTRL_BREAK_EVENT)
+                else:
+                    os.killpg(proc.pid, signal.SIGTERM)
+                proc.wait(timeout=grace)
+            except (subprocess.TimeoutExpired, OSError):
+                try:
+                    if os.name == 'nt':
+                        proc.kill()
+                    else:
+                        os.killpg(proc.pid, signal.SIGKILL)
+                except OSError: pass
+                proc.wait()
+        self.discard(proc)
+
+    def terminate_all(self, grace=TERMINATE_GRACE):
+        with self.lock:
+            procs = list(self.processes)
+        for proc in procs:
+            self.terminate(proc, grace)
+
+    def cancel(self):
+        self.cancelled.set()
+        self.terminate_all()
+
+# 未绑定任务环境的调用使用的默认登记表
+_default_registry = ProcessRegistry()
+
+# ffmpeg 能力探测结果，键为 "可执行文件真实路径:mtime:大小"
+_capabilities = {}
+_capabilities_lock = threading.Lock()
+
+# 进程内所有任务共享的内存预算，首次使用时创建
+_memory_budget = None
+_memory_budget_lock = threading.Lock()
+
+# 各缓存目录对应的 MediaCache 实例
+_media_caches = {}
+_media_caches_lock = threading.Lock()
+
+# 已编译的过滤规则，键为规则元组
+_filter_matchers = {}
+_filter_matchers_lock = threading.Lock()
+
+def parse_size(text):
+    """解析 "512M"、"2G"、"1048576" 这样的字节数"""
+    units = {'K': 1024, 'M': 1024**2, 'G': 1024**3, 'T': 1024**4}
+    text = str(text).strip().upper().rstrip('B')
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+class MemoryBudget:
+    """按字节计数的准入控制：申请超出剩余额度时等待其他工作释放，单个申请超过总额时直接失败 (MemoryError)"""
+    def __init__(self, total):
+        self.total = max(1, int(total))
+        self.used = 0
+        self.cond = threading.Condition()
+
+    def acquire(self, nbytes):
+        nbytes = int(nbytes)
+        if nbytes > self.total:
+            # 按实际大小申请：截到总额会让真实分配超出预算，等待也永远等不到
+            raise MemoryError(f"单次需要 {nbytes / 1024**2:.1f}MB，超过内存预算 {self.total / 1024**2:.1f}MB "
+                              f"(可用 --memory-budget 调大)")
+        with self.cond:
+            self.cond.wait_for(lambda: self.used + nbytes <= self.total)
+            self.used += nbytes
+        return nbytes
+
+    def release(self, nbytes):
+        with self.cond:
+            self.used -= nbytes
+            self.cond.notify_all()
+
+    @contextlib.contextmanager
+    def reserve(self, nbytes):
+        granted = self.acquire(nbytes)
+        try:
+            yield
+        finally:
+            self.release(granted)
+
+    def batch_bytes(self):
+        """切割批次大小：预算的四分之一，最多 MAX_BATCH_BYTES"""
+        return min(self.total, max(1 << 20, min(MAX_BATCH_BYTES, self.total // 4)))
+
+def get_memory_budget():
+    global _memory_budget
+    with _memory_budget_lock:
+        if _memory_budget is None:
+            total = parse_size(MEMORY_BUDGET) if MEMORY_BUDGET else psutil.virtual_memory().available // 2
+            _memory_budget = MemoryBudget(total)
+        return _memory_budget
+
+def _resource_snapshot(registry):
+    """当前进程与已回收子进程的累计资源占用"""
+    snap = {'wall': time.perf_counter(), 'cpu': time.process_time(), 'read_bytes': 0, 'write_bytes': 0,
+            'ffmpeg_spawned': registry.spawned if registry else 0}
+    try:
+        io = psutil.Process().io_counters()  # macOS 不提供
+        snap['read_bytes'], snap['write_bytes'] = io.read_bytes, io.write_bytes
+    except (AttributeError, psutil.Error):
+        pass
+    if resource:
+        # 只统计已退出并被回收的子进程；同一进程内并发的任务会互相计入
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        snap.update(child_user=usage.ru_utime, child_sys=usage.ru_stime, child_maxrss_kb=usage.ru_maxrss,
+                    child_read_bytes=usage.ru_inblock * 512, child_write_bytes=usage.ru_oublock * 512)
+    return snap
+
+class RunProfiler:
+    """
+    记录各阶段 (decode/cut/encode/mux/srt) 的墙钟与CPU时间、读写字节数及 ffmpeg 子进程资源占用，
+    可导出 JSON 报告和 Chrome trace (chrome://tracing、Perfetto 可直接打开)。
+    progress_callback(step, total, description) 在进入带步骤号的阶段时调用，供界面更新进度
+    """
+    TOTAL_STEPS = 4
+
+    def __init__(self, registry=None, progress_callback=None):
+        self.registry = registry
+        self.progress_callback = progress_callback
+        self.origin = time.perf_counter()
+        self.started_at = time.time()
+        self.spans = []
+        self.meta = {}
+        self.current = None
+        self.lock = threading.Lock()
+
+    def _open(self, name, **fields):
+        return {'name': name, 'begin': _resource_snapshot(self.registry), 'tid': threading.get_ident(), **fields}
+
+    def _close(self, span):
+        begin, end = span.pop('begin'), _resource_snapshot(self.registry)
+        span['start'] = round(begin['wall'] - self.origin, 6)
+        for key in end:
+            value = end[key] - begin[key]
+            span[key] = round(value, 6) if isinstance(value, float) else value
+        # maxrss 是历史峰值而非增量
+        if 'child_maxrss_kb' in end:
+            span['child_maxrss_kb'] = end['child_maxrss_kb']
+        with self.lock:
+            self.spans.append(span)
+
+    def step(self, step, emoji, description):
+        """打印 "步骤N/4" 提示并通知进度回调"""
+        print(f"\n{emoji} 步骤{step}/{self.TOTAL_STEPS}: {description}...")
+        if self.progress_callback:
+            self.progress_callback(step, self.TOTAL_STEPS, description)
+
+    def stage(self, name, **fields):
+        """结束当前阶段并开始新阶段；主流程的各阶段依次衔接，无需改动代码缩进"""
+        self.finish()
+        self.current = self._open(name, **fields)
+
+    def finish(self):
+        if self.current:
+            span, self.current = self.current, None
+            self._close(span)
+
+    @contextlib.contextmanager
+    def span(self, name, **fields):
+        """阶段内的子区间，可嵌套，可在工作线程中使用"""
+        span = self._open(name, **fields)
+        try:
+            yield span
+        finally:
+            self._close(span)
+
+    def report(self):
+        self.finish()
+        spans = sorted(self.spans, key=lambda s: s['start'])
+        totals = {}
+        for span in spans:
+            entry = totals.setdefault(span['name'], {'wall': 0.0, 'cpu': 0.0, 'count': 0})
+            entry['wall'] = round(entry['wall'] + span['wall'], 6)
+            entry['cpu'] = round(entry['cpu'] + span['cpu'] + span.get('child_user', 0) + span.get('child_sys', 0), 6)
+            entry['count'] += 1
+        return {
+            'started_at': self.started_at,
+            'wall': round(time.perf_counter() - self.origin, 6),
+            'system': {'platform': platform.system(), 'cpu_cores': os.cpu_count(), 'pid': os.getpid()},
+            **self.meta,
+            'totals': totals,
+            'spans': spans,
+        }
+
+    def write_report(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2, ensure_ascii=False)
+
+    def write_chrome_trace(self, path):
+        """Trace Event 格式: 每个区间一个完整事件 (ph=X)，时间单位为微秒"""
+        report = self.report()
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': os.getpid(), 'args': {'name': 'autocut'}}]
+        for span in report['spans']:
+            args = {k: v for k, v in span.items() if k not in ('name', 'start', 'wall', 'tid')}
+            events.append({'name': span['name'], 'cat': 'autocut', 'ph': 'X', 'pid': os.getpid(),
+                           'tid': span['tid'], 'ts': int(span['start'] * 1e6),
+                           'dur': int(span['wall'] * 1e6), 'args': args})
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+
+class JobContext:
+    """单个任务的运行环境：独立的临时目录、编码参数和子进程句柄，多个任务可并发执行"""
+    def __init__(self, batch_size=None, max_workers=None, quality="high", timeout=FFMPEG_TIMEOUT, cache=None,
+                 memory=None, progress_callback=None):
+        self.batch_size = batch_size or BATCH_SIZE
+        self.memory = memory or get_memory_budget()  # MemoryBudget，并发的切割/编码按字节数申请
+        self.max_workers = max_workers or MAX_WORKERS
+        self.quality = quality
+        self.timeout = timeout
+        self.cache = cache  # MediaCache，为 None 时不读写持久缓存
+        self.aac_params = None
+        self.temp_dir = tempfile.mkdtemp(prefix="autocut_")
+        self.registry = ProcessRegistry()
+        self.profiler = RunProfiler(self.registry, progress_callback)  # 各阶段耗时与资源占用
+        _active_jobs.add(self)
+
+    def path(self, *names):
+        return os.path.join(self.temp_dir, *names)
+
+    def cancel(self):
+        """取消任务：终止本任务的全部 ffmpeg，并拒绝再启动新进程"""
+        self.registry.cancel()
+
+    def close(self):
+        self.registry.terminate_all()
+        clean_temp_files(self.temp_dir)
+        _active_jobs.discard(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+atexit.register(lambda: [_default_registry.terminate_all(), *(job.close() for job in list(_active_jobs))])
 
 def get_system_info():
     mem = psutil.virtual_memory()
@@ -17,9 +391,145 @@ def get_system_info():
         'system': platform.system(),
         'cpu_cores': os.cpu_count(),
         'memory': f"{mem.available/1024**3:.1f}GB/{mem.total/1024**3:.1f}GB",
-        'ffmpeg': subprocess.getoutput("ffmpeg -version | head -n1")
+        'ffmpeg': get_ffmpeg_capabilities()['version']
+    }
+
+def _ffmpeg_list(binary, option):
+    """解析 ffmpeg -encoders/-filters 的表格输出 (" 标志位 名称 说明")，返回名称列表"""
+    output = subprocess.run([binary, "-hide_banner", option], capture_output=True, text=True).stdout
+    return [m.group(2) for m in re.finditer(r'^ ([A-Z.|]{3,6}) (\S+)', output, re.M) if m.group(2) != '=']
+
+def _probe_ffmpeg(binary):
+    version = subprocess.run([binary, "-version"], capture_output=True, text=True).stdout.splitlines()
+    hwaccels = subprocess.run([binary, "-hide_banner", "-hwaccels"], capture_output=True, text=True).stdout
+    return {
+        'version': version[0] if version else '',
+        'encoders': _ffmpeg_list(binary, "-encoders"),
+        'filters': _ffmpeg_list(binary, "-filters"),
+        'hwaccels': [line.strip() for line in hwaccels.splitlines()[1:] if line.strip()],
     }
 
+def get_ffmpeg_capabilities(binary="ffmpeg"):
+    """
+    获取 ffmpeg 的版本、编码器、滤镜和硬件加速列表。
+    结果按可执行文件路径与 mtime 缓存在进程内，并持久化到磁盘，重复任务和 GUI 启动时不再重新探测。
+    """
+    path = os.path.realpath(shutil.which(binary) or binary)
+    try:
+        st = os.stat(path)
+        key = f"{path}:{st.st_mtime_ns}:{st.st_size}"
+    except OSError:
+        key = path
+
+    with _capabilities_lock:
+        if key in _capabilities:
+            return _capabilities[key]
+        try:
+            with open(CAPABILITY_CACHE_FILE, 'r', encoding='utf-8') as f:
+                on_disk = json.load(f)
+        except (OSError, ValueError):
+            on_disk = {}
+        if key not in on_disk:
+            on_disk = {k: v for k, v in on_disk.items() if not k.startswith(path + ":")}
+            try:
+                on_disk[key] = _probe_ffmpeg(path)
+            except OSError:
+                return {'version': '', 'encoders': [], 'filters': [], 'hwaccels': []}
+            try:
+                os.makedirs(CACHE_ROOT, exist_ok=True)
+                tmp = f"{CAPABILITY_CACHE_FILE}.{os.getpid()}.tmp"
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(on_disk, f, ensure_ascii=False)
+                os.replace(tmp, CAPABILITY_CACHE_FILE)
+            except OSError as e:
+                print(f"⚠️ 无法写入ffmpeg能力缓存: {e}")
+        _capabilities[key] = on_disk[key]
+        return _capabilities[key]
+
+class MediaCache:
+    """
+    跨任务持久保存的内容寻址缓存 (解码后的 PCM、最终输出)，不随临时目录清理。
+    键由调用方根据源文件指纹和参数生成；总大小超出预算时按最近使用时间淘汰。
+    """
+    def __init__(self, root=None, max_bytes=None):
+        self.root = root or MEDIA_CACHE_DIR
+        self.max_bytes = MEDIA_CACHE_BYTES if max_bytes is None else max_bytes
+        self.lock = threading.Lock()
+
+    def path_for(self, key, ext):
+        return os.path.join(self.root, key[:2], key + ext)
+
+    def get(self, key, ext):
+        """命中时刷新文件的修改时间作为最近使用时间，返回缓存文件路径"""
+        path = self.path_for(key, ext)
+        try:
+            os.utime(path)
+            return path
+        except OSError:
+            return None
+
+    def put(self, key, ext, src_path, move=False):
+        """把文件放入缓存 (先写临时文件再原子替换)，返回缓存路径；文件超出整个预算时不缓存"""
+        try:
+            if os.path.getsize(src_path) > self.max_bytes:
+                return None
+            path = self.path_for(key, ext)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            if move:
+                shutil.move(src_path, tmp)
+            else:
+                shutil.copyfile(src_path, tmp)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"⚠️ 无法写入缓存: {e}")
+            return None
+        self.evict()
+        return path
+
+    def evict(self):
+        """删除最久未使用的条目，直到总大小回到预算以内"""
+        with self.lock:
+            entries, total = [], 0
+            for dirpath, _, filenames in os.walk(self.root):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, path))
+                    total += st.st_size
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass  # 正被其他任务使用 (Windows) 或已被删除
+
+def get_media_cache(root=None, max_bytes=None):
+    root = root or MEDIA_CACHE_DIR
+    with _media_caches_lock:
+        if root not in _media_caches:
+            _media_caches[root] = MediaCache(root, max_bytes)
+        return _media_caches[root]
+
+def source_fingerprint(path):
+    """源文件指纹: 大小、mtime 以及首尾各 1MiB 内容的哈希，不必读完整个大文件"""
+    st = os.stat(path)
+    digest = hashlib.sha1(f"{st.st_size}:{st.st_mtime_ns}".encode())
+    with open(path, 'rb') as f:
+        digest.update(f.read(FINGERPRINT_SAMPLE))
+        if st.st_size > 2 * FINGERPRINT_SAMPLE:
+            f.seek(-FINGERPRINT_SAMPLE, os.SEEK_END)
+            digest.update(f.read(FINGERPRINT_SAMPLE))
+    return digest.hexdigest()
+
+def cache_key(*parts):
+    return hashlib.sha1(json.dumps(parts, ensure_ascii=False).encode()).hexdigest()
+
 def get_short_path(path):
     if os.name != 'nt' or not os.path.exists(path): return path
     try:
@@ -28,22 +538,22 @@ def get_short_path(path):
     except: pass
     return path
 
-def clean_temp_files():
+def clean_temp_files(temp_dir):
     for _ in range(3):
         try:
-            if os.path.exists(TEMP_DIR):
-                shutil.rmtree(TEMP_DIR, ignore_errors=True)
-                time.sleep(1)
-            os.makedirs(TEMP_DIR, exist_ok=True)
+            shutil.rmtree(temp_dir)
+            break
+        except FileNotFoundError:
             break
         except Exception as e:
             print(f"⚠️ 清理临时文件失败 (重试 {_+1}/3): {str(e)}")
+            time.sleep(1)
 
-def kill_ffmpeg_processes():
-    try:
-        os.system('taskkill /f /im ffmpeg.exe >nul 2>&1' if os.name == 'nt' else 'pkill -9 ffmpeg >/dev/null 2>&1')
-        time.sleep(1)
-    except: pass
+def kill_ffmpeg_processes(ctx=None):
+    """终止由本进程启动的 ffmpeg；指定 ctx 时只终止该任务的"""
+    registries = [ctx.registry] if ctx else [_default_registry, *(job.registry for job in list(_active_jobs))]
+    for registry in registries:
+        registry.terminate_all()
 
 def check_aac_encoder():
     encoders = {
@@ -52,149 +562,1463 @@ def check_aac_encoder():
         'default': ['-c:a', 'aac', '-b:a', '192k']
     }
     
-    for cmd in [['ffmpeg', '-hide_banner', '-encoders'], ['ffmpeg', '-codecs']]:
-        try:
-            output = subprocess.run(cmd, capture_output=True, text=True).stdout
-            for enc in encoders:
-                if enc != 'default' and f'{enc}' in output:
-                    print(f"✅ 检测到可用编码器: {enc}")
-                    return encoders[enc]
-        except: continue
+    available = get_ffmpeg_capabilities()['encoders']
+    for enc in encoders:
+        if enc != 'default' and enc in available:
+            print(f"✅ 检测到可用编码器: {enc}")
+            return encoders[enc]
     
     print("⚠️ 使用默认AAC编码器")
     return encoders['default']
 
-def safe_ffmpeg_run(cmd, timeout=FFMPEG_TIMEOUT):
-    def pre_exec():
-        if os.name != 'nt': os.setpgrp()
-
+def safe_ffmpeg_run(cmd, timeout=None, ctx=None):
+    timeout = timeout or (ctx.timeout if ctx else FFMPEG_TIMEOUT)
+    registry = ctx.registry if ctx else _default_registry
+    proc = registry.spawn(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     try:
-        return subprocess.run(
-            [get_short_path(cmd[0]), *cmd[1:]],
-            timeout=timeout, check=True,
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-            creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0,
-            preexec_fn=pre_exec if os.name != 'nt' else None
-        )
+        stdout, stderr = proc.communicate(timeout=timeout)
     except subprocess.TimeoutExpired:
-        kill_ffmpeg_processes()
+        registry.terminate(proc)
         raise RuntimeError(f"FFmpeg处理超时 (超过{timeout}秒)")
-    except subprocess.CalledProcessError as e:
-        error_msg = (e.stderr or b'').decode().strip() or (e.stdout or b'').decode().strip()
+    finally:
+        registry.discard(proc)
+
+    if registry.cancelled.is_set():
+        raise RuntimeError("任务已取消")
+    if proc.returncode != 0:
+        error_msg = (stderr or b'').decode().strip() or (stdout or b'').decode().strip()
         raise RuntimeError(f"FFmpeg错误: {error_msg[:500]}")
+    return subprocess.CompletedProcess(proc.args, proc.returncode, stdout, stderr)
+
+class SubtitleTable:
+    """
+    列式字幕表: 序号、起止时间 (秒) 为 NumPy 数组，全部文本拼成一个字符串、按偏移切取。
+    按下标取出的每一项仍是 (序号, 开始, 结束, 内容) 元组，切片返回共享文本的子表
+    """
+    def __init__(self, index, start, end, text, offsets):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.text = text
+        self.offsets = offsets  # 长度为条数 + 1
+
+    def __len__(self):
+        return len(self.index)
+
+    def content(self, i):
+        return self.text[self.offsets[i]:self.offsets[i + 1]]
+
+    def contents(self):
+        offsets = self.offsets.tolist()
+        return [self.text[a:b] for a, b in zip(offsets, offsets[1:])]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            first, stop, step = key.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(first, stop, step)]
+            stop = max(first, stop)
+            return SubtitleTable(self.index[first:stop], self.start[first:stop], self.end[first:stop],
+                                 self.text, self.offsets[first:stop + 1])
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError(key)
+        return int(self.index[key]), float(self.start[key]), float(self.end[key]), self.content(key)
+
+    def __iter__(self):
+        return zip(self.index.tolist(), self.start.tolist(), self.end.tolist(), self.contents())
+
+def _iter_srt_cues(f, chunk_size=SRT_READ_CHUNK):
+    """逐块读取，产出 (字幕头匹配, 内容)；块内最后一个字幕头要等下一块确认内容结束后才产出"""
+    buffer = ''
+    while True:
+        data = f.read(chunk_size)
+        buffer += data
+        previous, tail = None, 0
+        for header in _SRT_HEADER.finditer(buffer):
+            if previous:
+                yield previous, buffer[previous.end():header.start()]
+            previous, tail = header, header.start()
+        if not data:
+            if previous:
+                yield previous, buffer[previous.end():]
+            return
+        buffer = buffer[tail:]
 
 def parse_srt(file_path):
+    """流式解析 SRT 为 SubtitleTable，不为每条字幕创建对象"""
+    index, times, lengths, pieces = array('q'), array('d'), array('q'), []
     with open(file_path, 'r', encoding='utf-8-sig') as f:
-        return [(s.index, s.start.total_seconds(), s.end.total_seconds(), s.content)
-                for s in srt.parse(f)]
+        for header, content in _iter_srt_cues(f):
+            n, h1, m1, s1, ms1, h2, m2, s2, ms2 = map(int, header.groups())
+            index.append(n)
+            # 与 srt 库一致，毫秒字段按整数毫秒解释
+            times.append(h1 * 3600 + m1 * 60 + s1 + ms1 / 1000)
+            times.append(h2 * 3600 + m2 * 60 + s2 + ms2 / 1000)
+            content = content.strip('\n').rstrip()
+            lengths.append(len(content))
+            pieces.append(content)
+    times = np.frombuffer(times, dtype=np.float64).reshape(-1, 2)
+    offsets = np.zeros(len(index) + 1, dtype=np.int64)
+    np.cumsum(np.frombuffer(lengths, dtype=np.int64), out=offsets[1:])
+    return SubtitleTable(np.frombuffer(index, dtype=np.int64), times[:, 0], times[:, 1], ''.join(pieces), offsets)
+
+def count_subtitle_cues(file_path, chunk_size=SRT_READ_CHUNK):
+    """
+    只统计字幕条数: SRT 数时间行，ASS/SSA 数 Dialogue 与 Comment 行 (与 pysubs2 的 events 一致)；
+    按字节块扫描，不解码也不保留内容
+    """
+    if os.path.splitext(file_path)[1].lower() in ('.ass', '.ssa'):
+        pattern = re.compile(rb'^[ \t]*(?:Dialogue|Comment)[ \t]*:', re.M)
+    else:
+        pattern = _SRT_TIMING_LINE
+    count, carry = 0, b''
+    with open(file_path, 'rb') as f:
+        while True:
+            data = f.read(chunk_size)
+            block = carry + data
+            # 最后一个不完整的行留到下一块，避免时间行被块边界切断
+            cut = block.rfind(b'\n') + 1 if data else len(block)
+            count += len(pattern.findall(block, 0, cut))
+            carry = block[cut:]
+            if not data:
+                return count
+
+def normalize_text(text):
+    """去掉标点、空白与符号，NFKC 统一全半角，casefold 忽略大小写"""
+    # 先去标点，大多数文本剩下的部分已是 NFKC 形式，normalize 可以走快速路径
+    text = _NORMALIZE_DROP.sub('', text).replace('_', '')
+    normalized = unicodedata.normalize('NFKC', text)
+    if normalized != text:
+        normalized = _NORMALIZE_DROP.sub('', normalized).replace('_', '')  # 兼容分解可能产生新的标点，如 ½ -> 1⁄2
+    return normalized.casefold()
+
+class FilterMatcher:
+    """
+    过滤规则，每行一条:
+      文本       去掉首尾空白后整行一致 (原有行为)
+      norm:文本  归一化后整行一致，不区分全半角、大小写，忽略标点与空白
+      sub:文本   归一化后包含该文本
+      re:正则    在去掉首尾空白的整行中能搜索到该正则
+    子串规则编译为 Aho-Corasick 自动机 (需要 pyahocorasick)，未安装时合并成一个正则；
+    正则规则尽量合并为一个。支持 `文本 in matcher`，可直接替代原来的过滤词集合
+    """
+    def __init__(self, patterns):
+        self.patterns = [p.strip() for p in patterns if p.strip()]
+        self.exact, self.normalized, substrings, regexes = set(), set(), set(), []
+        for pattern in self.patterns:
+            if pattern.startswith('re:'):
+                regexes.append(pattern[3:])
+            elif pattern.startswith('sub:'):
+                substrings.add(normalize_text(pattern[4:]))
+            elif pattern.startswith('norm:'):
+                self.normalized.add(normalize_text(pattern[5:]))
+            else:
+                self.exact.add(pattern)
+        substrings.discard('')
+        self.automaton, self.substring_regex = None, None
+        if substrings and ahocorasick:
+            self.automaton = ahocorasick.Automaton()
+            for word in substrings:
+                self.automaton.add_word(word, word)
+            self.automaton.make_automaton()
+        elif substrings:
+            # 长词在前，避免被短词抢先匹配 (只关心是否命中，顺序不影响结果，但能少回溯)
+            self.substring_regex = re.compile('|'.join(map(re.escape, sorted(substrings, key=len, reverse=True))))
+        self.regexes = self._compile(regexes)
+
+    @staticmethod
+    def _compile(regexes):
+        try:
+            compiled = [re.compile(r) for r in regexes]
+        except re.error as e:
+            raise ValueError(f"过滤规则中的正则无效: {e.pattern} ({e})")
+        # 含反向引用的正则合并后组号会变，单独保留
+        if len(compiled) > 1 and not any(_REGEX_BACKREF.search(r) for r in regexes):
+            try:
+                return [re.compile('|'.join(f'(?:{r})' for r in regexes))]
+            except re.error:
+                pass  # 例如各自带有全局内联标志
+        return compiled
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def __contains__(self, text):
+        return self.matches(text)
+
+    def _substring_ends(self, text):
+        """各处子串命中的最后一个字符的位置"""
+        if self.automaton:
+            return [end for end, _ in self.automaton.iter(text)]
+        if self.substring_regex:
+            return [m.end() - 1 for m in self.substring_regex.finditer(text)]
+        return []
+
+    def matches(self, text):
+        text = text.strip()
+        if text in self.exact or any(r.search(text) for r in self.regexes):
+            return True
+        if self.normalized or self.automaton or self.substring_regex:
+            text = normalize_text(text)
+            return text in self.normalized or bool(self._substring_ends(text))
+        return False
+
+    def mask(self, texts):
+        """批量判断，返回命中的布尔数组；归一化与子串匹配在拼接后的整段文本上一次完成"""
+        stripped = [t.strip() for t in texts]
+        hits = np.fromiter((t in self.exact for t in stripped), dtype=bool, count=len(stripped))
+        for regex in self.regexes:
+            hits |= np.fromiter((regex.search(t) is not None for t in stripped), dtype=bool, count=len(stripped))
+        if not (self.normalized or self.automaton or self.substring_regex) or not stripped:
+            return hits
+
+        blob = normalize_text(FILTER_SEPARATOR.join(stripped))
+        parts = blob.split(FILTER_SEPARATOR)
+        if len(parts) != len(stripped):
+            # 字幕本身含有分隔符时逐条归一化
+            parts = [normalize_text(t).replace(FILTER_SEPARATOR, '') for t in stripped]
+            blob = FILTER_SEPARATOR.join(parts)
+        if self.normalized:
+            hits |= np.fromiter((p in self.normalized for p in parts), dtype=bool, count=len(parts))
+        ends = self._substring_ends(blob)
+        if ends:
+            starts = np.zeros(len(parts), dtype=np.int64)
+            np.cumsum([len(p) + 1 for p in parts[:-1]], out=starts[1:])
+            hits[np.searchsorted(starts, ends, side='right') - 1] = True
+        return hits
+
+def get_filter_matcher(patterns):
+    """同一组规则只编译一次"""
+    key = tuple(p.strip() for p in patterns if p.strip())
+    with _filter_matchers_lock:
+        matcher = _filter_matchers.get(key)
+        if matcher is None:
+            matcher = _filter_matchers[key] = FilterMatcher(key)
+        return matcher
 
 def read_filter_file(path):
-    if not os.path.exists(path): return set()
+    """读取过滤规则文件，返回 FilterMatcher；文件不存在时返回空规则"""
+    if not path or not os.path.exists(path):
+        return get_filter_matcher([])
     with open(path, 'r', encoding='utf-8') as f:
-        return set(line.strip() for line in f if line.strip())
+        return get_filter_matcher(f.read().splitlines())
 
-def extract_clip_mp3(input_mp3, start_time, duration, output_clip_mp3):
-    cmd = ["ffmpeg", "-y", "-ss", str(round(max(0, start_time), 6)),
-           "-t", str(round(duration, 6)), "-i", input_mp3,
-           "-acodec", "copy", "-max_muxing_queue_size", "9999", output_clip_mp3]
-    safe_ffmpeg_run(cmd)
+def read_wav_layout(path):
+    """
+    解析 RIFF/RF64 WAV 的块结构，返回真实的 data 偏移与样本布局。
+    支持 LIST/fact 等附加块、WAVE_FORMAT_EXTENSIBLE 以及 s16/s24/s32/f32 等样本格式。
+    """
+    file_size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        riff, _, wave_id = struct.unpack('<4sI4s', f.read(12))
+        if riff not in (b'RIFF', b'RF64') or wave_id != b'WAVE':
+            raise ValueError(f"不是有效的WAV文件: {path}")
 
-def convert_mp3_to_wav(input_mp3, output_wav_path):
-    cmd = ["ffmpeg", "-y", "-i", input_mp3, "-acodec", "pcm_s16le",
-           "-ar", "44100", "-ac", "2", "-threads", str(MAX_WORKERS), output_wav_path]
-    safe_ffmpeg_run(cmd)
+        fmt_chunk = None
+        ds64_data_size = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"WAV文件缺少data块: {path}")
+            chunk_id, chunk_size = struct.unpack('<4sI', header)
+            if chunk_id == b'fmt ':
+                fmt_chunk = f.read(chunk_size)
+            elif chunk_id == b'ds64':
+                ds64_data_size = struct.unpack('<QQ', f.read(16))[1]
+                f.seek(chunk_size - 16, 1)
+            elif chunk_id == b'data':
+                data_offset = f.tell()
+                break
+            else:
+                f.seek(chunk_size, 1)
+            if chunk_size % 2:
+                f.seek(1, 1)
 
-def cut_audio_segments_with_numpy_parallel(wav_path, subtitles, output_path, clip_start_time):
-    mem = psutil.virtual_memory()
-    if mem.available < 1 * 1024**3:
-        raise MemoryError("系统可用内存不足，请关闭其他程序")
+    if fmt_chunk is None:
+        raise ValueError(f"WAV文件缺少fmt块: {path}")
+    format_tag, channels, sample_rate, _, block_align, bits = struct.unpack('<HHIIHH', fmt_chunk[:16])
+    if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt_chunk) >= 26:
+        # 子格式 GUID 的前两个字节就是实际的格式码
+        format_tag = struct.unpack('<H', fmt_chunk[24:26])[0]
+    if (format_tag, bits) not in WAV_SAMPLE_FORMATS:
+        raise ValueError(f"不支持的WAV样本格式: format=0x{format_tag:04x}, bits={bits}")
 
-    with wave.open(wav_path, 'rb') as wf:
-        params = wf.getparams()
-        dtype = np.int16 if params.sampwidth == 2 else np.int8
-        total_frames = wf.getnframes()
-    
-    audio_np = np.memmap(wav_path, dtype=dtype, mode='r',
-                        offset=44, shape=(total_frames * params.nchannels,))
-    
-    framerate = params.framerate
-    frame_size = params.nchannels
-
-    def extract_segment(start, end):
-        start_rel = max(0, round(start - clip_start_time, 6))
-        end_rel = round(end - clip_start_time, 6)
-        start_frame = int(start_rel * framerate) * frame_size
-        end_frame = int(end_rel * framerate) * frame_size
-        return audio_np[start_frame:end_frame].copy()
-
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = [executor.submit(extract_segment, start, end) for _, start, end, _ in subtitles]
-        segments = [f.result() for f in tqdm(futures, desc="⏱️ 切割中", unit="segment")]
-
-    combined = np.concatenate(segments)
-
-    with wave.open(output_path, 'wb') as wf:
-        wf.setnchannels(params.nchannels)
-        wf.setsampwidth(params.sampwidth)
-        wf.setframerate(framerate)
-        wf.writeframes(combined.tobytes())
-
-def compress_audio_to_mp3(input_path, output_path, quality="high"):
-    qscale = "2" if quality == "high" else "4"
-    cmd = ["ffmpeg", "-y", "-i", input_path,
-           "-c:a", "libmp3lame", "-q:a", qscale,
-           "-threads", str(MAX_WORKERS), "-write_xing", "0", output_path]
-    safe_ffmpeg_run(cmd)
-
-def compress_audio_to_aac(input_path, output_path):
-    aac_params = check_aac_encoder()
-    
-    cmd = ["ffmpeg", "-y", "-i", input_path, *aac_params,
-           "-movflags", "+faststart", "-threads", str(min(2, MAX_WORKERS)),
-           "-max_muxing_queue_size", "9999", output_path]
-    
-    try:
-        safe_ffmpeg_run(cmd)
-    except RuntimeError as e:
-        print(f"⚠️ 直接压缩失败: {str(e)}, 尝试回退方案...")
-        temp_wav = os.path.join(TEMP_DIR, "fallback.wav")
-        convert_mp3_to_wav(input_path, temp_wav)
-        safe_ffmpeg_run(["ffmpeg", "-y", "-i", temp_wav, *aac_params, output_path])
+    # 流式写出的 WAV 常把 data 大小记为 0 或 0xFFFFFFFF，以文件实际长度为准
+    data_size = ds64_data_size if ds64_data_size is not None else chunk_size
+    if data_size in (0, 0xFFFFFFFF) or data_offset + data_size > file_size:
+        data_size = file_size - data_offset
+
+    return WavLayout(
+        sample_format=WAV_SAMPLE_FORMATS[(format_tag, bits)],
+        channels=channels, sample_rate=sample_rate, sample_width=bits // 8,
+        block_align=block_align, data_offset=data_offset,
+        frames=data_size // block_align, fmt_chunk=fmt_chunk)
+
+def pcm_layout(sample_rate=STREAM_SAMPLE_RATE, channels=STREAM_CHANNELS):
+    """ffmpeg 解码输出所用的 s16 PCM 布局"""
+    return WavLayout('s16', channels, sample_rate, 2, 2 * channels, 0, 0,
+                     struct.pack('<HHIIHH', WAVE_FORMAT_PCM, channels, sample_rate,
+                                 sample_rate * 2 * channels, 2 * channels, 16))
+
+def open_wav_frames(path, layout=None):
+    """零拷贝地把 WAV 数据映射为 (帧, 声道) 视图；s24 为 (帧, 声道, 3) 的原始字节视图"""
+    layout = layout or read_wav_layout(path)
+    dtype = WAV_SAMPLE_DTYPES[layout.sample_format]
+    shape = (layout.frames, layout.channels, 3) if layout.sample_format == 's24' else (layout.frames, layout.channels)
+    if layout.frames == 0:
+        return layout, np.empty(shape, dtype=dtype)
+    return layout, np.memmap(path, dtype=dtype, mode='r', offset=layout.data_offset, shape=shape)
+
+def _wav_header(layout, data_size):
+    fmt = layout.fmt_chunk + (b'\0' if len(layout.fmt_chunk) % 2 else b'')
+    riff_size = min(4 + 8 + len(fmt) + 8 + data_size, 0xFFFFFFFF)
+    return (struct.pack('<4sI4s', b'RIFF', riff_size, b'WAVE')
+            + struct.pack('<4sI', b'fmt ', len(layout.fmt_chunk)) + fmt
+            + struct.pack('<4sI', b'data', min(data_size, 0xFFFFFFFF)))
+
+def allocate_wav(path, layout, frames):
+    """预先写好头部并分配整个数据区，返回按 (帧, 声道) 写入的内存映射，多个线程可各自写入不同区间"""
+    header = _wav_header(layout, frames * layout.block_align)
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.truncate(len(header) + frames * layout.block_align)
+    return np.memmap(path, dtype=WAV_SAMPLE_DTYPES[layout.sample_format], mode='r+', offset=len(header),
+                     shape=(frames, layout.channels, *((3,) if layout.sample_format == 's24' else ())))
+
+def probe_audio(path, ctx=None):
+    """用 ffprobe 读取容器格式与首条音频流的编码、采样率、声道数和时长"""
+    proc = safe_ffmpeg_run(["ffprobe", "-v", "error", "-select_streams", "a:0",
+                            "-show_entries", "stream=codec_name,sample_rate,channels:format=format_name,duration",
+                            "-of", "json", path], ctx=ctx)
+    info = json.loads(proc.stdout.decode() or "{}")
+    if not info.get('streams'):
+        raise ValueError(f"未找到音频流: {path}")
+    stream, fmt = info['streams'][0], info.get('format', {})
+    return {
+        'codec': stream.get('codec_name', ''),
+        'sample_rate': int(stream.get('sample_rate') or 0),
+        'channels': int(stream.get('channels') or 0),
+        'format': fmt.get('format_name', ''),
+        'duration': float(fmt.get('duration') or 0),
+    }
+
+def decode_kept_windows(input_path, subtitles, output_wav, ctx,
+                        sample_rate=STREAM_SAMPLE_RATE, channels=STREAM_CHANNELS, padding=WINDOW_PADDING):
+    """
+    只解码保留字幕覆盖到的时间窗口 (精确seek)，按顺序紧凑地写入一个 WAV。
+    返回时间轴已换算到该 WAV 上的字幕列表，过滤掉的部分越多，解码量越少。
+    padding 为窗口两端的余量，切点对齐时至少要等于对齐范围，避免对齐到相邻窗口的音频上。
+    """
+    times = sorted((max(0.0, start - padding), end + padding) for _, start, end, _ in subtitles)
+    windows = []
+    for start, end in times:
+        # 重叠的必须合并；间隔较小时也合并以减少 seek，但不让窗口超过 WINDOW_MAX_SECONDS，
+        # 拆开处落在字幕之间不保留的音频上，不会在保留的音频中留下接缝
+        if windows and (start <= windows[-1][1] or (start - windows[-1][1] <= WINDOW_MERGE_GAP and
+                                                    max(windows[-1][1], end) - windows[-1][0] <= WINDOW_MAX_SECONDS)):
+            windows[-1][1] = max(windows[-1][1], end)
+        else:
+            windows.append([start, end])
+    # 字幕首尾相连、没有间隔可拆的超长窗口按固定时长切开 (前后相接，映射时共用同一偏移)
+    windows = [[a, min(b, a + WINDOW_MAX_SECONDS)] for start, end in windows
+               for a, b in [(start + k * WINDOW_MAX_SECONDS, end)
+                            for k in range(max(1, int(np.ceil((end - start) / WINDOW_MAX_SECONDS))))]]
+
+    # 以帧为单位确定每个窗口在输出中的位置，保证换算后的时间轴采样级精确
+    layout = pcm_layout(sample_rate, channels)
+    frame_bytes = layout.block_align
+    win_starts = np.array([int(round(a * sample_rate)) for a, _ in windows], dtype=np.int64)
+    win_frames = np.array([int(round(b * sample_rate)) for _, b in windows], dtype=np.int64) - win_starts
+    win_offsets = np.concatenate(([0], np.cumsum(win_frames)))
+    header = _wav_header(layout, int(win_offsets[-1]) * frame_bytes)
+    with open(output_wav, 'wb') as f:
+        f.write(header)
+        f.truncate(len(header) + int(win_offsets[-1]) * frame_bytes)
+
+    chunk_bytes = STREAM_CHUNK_BYTES - STREAM_CHUNK_BYTES % frame_bytes
+
+    def decode_window(i):
+        # 每个窗口只占用一个固定大小的读缓冲区，解码结果逐块直接写到输出文件中的位置
+        with ctx.memory.reserve(chunk_bytes):
+            _decode_window(i, int(win_frames[i]) * frame_bytes)
+
+    def _decode_window(i, expected):
+        proc = ctx.registry.spawn(
+            ["ffmpeg", "-v", "error", "-nostdin", "-accurate_seek",
+             "-ss", f"{win_starts[i] / sample_rate:.6f}", "-t", f"{win_frames[i] / sample_rate:.6f}",
+             "-i", input_path, "-vn", "-f", "s16le", "-acodec", "pcm_s16le",
+             "-ar", str(sample_rate), "-ac", str(channels), "pipe:1"],
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        errors = []
+        drain = threading.Thread(target=_drain_stderr, args=(proc, errors), daemon=True)
+        drain.start()
+        timed_out = threading.Event()
+        timer = threading.Timer(ctx.timeout, lambda: (timed_out.set(), ctx.registry.terminate(proc)))
+        timer.start()
+        written = 0
+        try:
+            with open(output_wav, 'r+b') as f:
+                f.seek(len(header) + int(win_offsets[i]) * frame_bytes)
+                while written < expected:
+                    data = proc.stdout.read(min(chunk_bytes, expected - written))
+                    if not data:
+                        break
+                    f.write(data)
+                    written += len(data)
+                # 解码结果比预期少几帧 (文件末尾) 时，文件预先分配的部分本就是零，多出的部分不再读取
+        finally:
+            timer.cancel()
+            # 读够窗口长度后 ffmpeg 可能还在输出，直接结束即可
+            ctx.registry.terminate(proc, grace=1)
+            drain.join(timeout=1)
+        if written < expected and proc.returncode != 0:
+            if timed_out.is_set():
+                raise RuntimeError(f"FFmpeg处理超时 (超过{ctx.timeout}秒)")
+            raise RuntimeError(f"FFmpeg错误: {' '.join(errors)[:500]}")
+
+    with ThreadPoolExecutor(max_workers=ctx.max_workers) as executor:
+        list(tqdm(executor.map(decode_window, range(len(windows))), total=len(windows),
+                  desc="🔊 解码保留窗口", unit="window"))
+
+    decoded = int(win_offsets[-1]) / sample_rate
+    print(f"🔊 解码 {len(windows)} 个窗口，共 {decoded:.1f}s")
+
+    remapped = []
+    for index, start, end, content in subtitles:
+        k = int(np.searchsorted(win_starts, int(round(start * sample_rate)), side='right')) - 1
+        shift = (win_offsets[k] - win_starts[k]) / sample_rate
+        remapped.append((index, start + shift, end + shift, content))
+    return remapped
+
+def cached_source_pcm(input_path, ctx, sample_rate=STREAM_SAMPLE_RATE, channels=STREAM_CHANNELS, decode=True):
+    """
+    从持久缓存取出整个源文件解码后的 PCM WAV，未命中时完整解码一次并放入缓存，
+    之后换区间、换过滤词重跑都不用再解码。未启用缓存或输入本身就是 PCM 时返回 None。
+    decode 为 False 时只查缓存、未命中返回 None，供不需要整段 PCM 的引擎顺带复用
+    """
+    if ctx.cache is None or probe_audio(input_path, ctx).get('codec', '').startswith('pcm_'):
+        return None
+    key = source_pcm_key(input_path, sample_rate, channels)
+    path = ctx.cache.get(key, '.wav')
+    if path:
+        print("♻️ 命中解码缓存，跳过解码")
+        return path
+    if not decode:
+        return None
+    temp_wav = decode_source_pcm(input_path, ctx.path("source.wav"), ctx, sample_rate, channels)
+    return ctx.cache.put(key, '.wav', temp_wav, move=True) or temp_wav
+
+def source_pcm_key(input_path, sample_rate=STREAM_SAMPLE_RATE, channels=STREAM_CHANNELS):
+    """整段解码 PCM 在持久缓存中的键"""
+    return cache_key('pcm', source_fingerprint(input_path), sample_rate, channels)
+
+def decode_source_pcm(input_path, output_wav, ctx, sample_rate=STREAM_SAMPLE_RATE, channels=STREAM_CHANNELS):
+    """完整解码源文件的首条音频流为 s16 WAV (超过 4GB 时自动写为 RF64)"""
+    safe_ffmpeg_run(["ffmpeg", "-y", "-v", "error", "-nostdin", "-i", input_path, "-vn",
+                     "-acodec", "pcm_s16le", "-ar", str(sample_rate), "-ac", str(channels),
+                     "-rf64", "auto", output_wav], ctx=ctx)
+    return output_wav
+
+def _subtitle_frames(subtitles, clip_start_time, framerate):
+    """各条字幕相对剪辑起点的采样帧位置 (starts, ends)，不排序、不合并"""
+    times = np.array([(start, end) for _, start, end, _ in subtitles], dtype=np.float64).reshape(-1, 2)
+    rel = np.round(times - clip_start_time, 6)
+    return (np.maximum(rel[:, 0], 0) * framerate).astype(np.int64), (rel[:, 1] * framerate).astype(np.int64)
+
+def compile_keep_ranges(subtitles, clip_start_time, framerate):
+    """把保留字幕一次性编译为按起点排序、重叠或相接处已合并的采样帧区间 (starts, ends)"""
+    if not subtitles:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    starts, ends = _subtitle_frames(subtitles, clip_start_time, framerate)
+    valid = ends > starts
+    starts, ends = starts[valid], ends[valid]
+    if not len(starts):
+        return starts, ends
+
+    order = np.argsort(starts, kind='stable')
+    starts, ends = starts[order], ends[order]
+    # 起点超过此前所有区间终点的最大值时才开启新区间
+    reach = np.maximum.accumulate(ends)
+    heads = np.flatnonzero(np.concatenate(([True], starts[1:] > reach[:-1])))
+    return starts[heads], np.maximum.reduceat(ends, heads)
+
+def output_timeline(subtitles, clip_start_time, framerate):
+    """
+    各条字幕在剪辑后音频中的起止时间 (秒)，返回 (序号, 开始, 结束, 内容) 列表。
+    与 compile_keep_ranges 一样合并重叠或相接的字幕，新字幕与剪出的音频逐帧对应
+    """
+    if not subtitles:
+        return []
+    starts, ends = _subtitle_frames(subtitles, clip_start_time, framerate)
+    range_starts, range_ends = compile_keep_ranges(subtitles, clip_start_time, framerate)
+    if not len(range_starts):
+        return [(index, 0.0, 0.0, content) for index, _, _, content in subtitles]
+    lengths = range_ends - range_starts
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    k = np.maximum(np.searchsorted(range_starts, starts, side='right') - 1, 0)
+    # 长度不为正而未进入保留区间的字幕落在所在区间的末尾，时长为 0
+    out_starts = offsets[k] + np.clip(starts - range_starts[k], 0, lengths[k])
+    out_ends = np.minimum(out_starts + np.maximum(ends - starts, 0), offsets[k + 1])
+    return [(index, start, end, content) for (index, _, _, content), start, end
+            in zip(subtitles, (out_starts / framerate).tolist(), (out_ends / framerate).tolist())]
+
+def pcm_to_float(frames, sample_format):
+    """把 (帧, 声道) 样本转换为 [-1, 1] 范围的 float32；s24 输入为 (帧, 声道, 3) 的字节视图"""
+    if sample_format == 's24':
+        raw = frames.astype(np.int32)
+        value = raw[..., 0] | (raw[..., 1] << 8) | (raw[..., 2] << 16)
+        value -= (value & 0x800000) << 1  # 符号扩展
+        return value.astype(np.float32) / float(1 << 23)
+    if sample_format == 'u8':
+        return (frames.astype(np.float32) - 128) / 128
+    if sample_format in ('s16', 's32'):
+        return frames.astype(np.float32) / float(1 << (frames.dtype.itemsize * 8 - 1))
+    return frames.astype(np.float32)
+
+def float_to_pcm(values, sample_format):
+    """pcm_to_float 的逆变换: 四舍五入并限幅后转回原样本格式"""
+    if sample_format in ('f32', 'f64'):
+        return values.astype(WAV_SAMPLE_DTYPES[sample_format])
+    if sample_format == 'u8':
+        return np.clip(np.rint(values * 128 + 128), 0, 255).astype(np.uint8)
+    bits = {'s16': 16, 's24': 24, 's32': 32}[sample_format]
+    scale = float(1 << (bits - 1))
+    ints = np.clip(np.rint(values.astype(np.float64) * scale), -scale, scale - 1).astype(np.int32)
+    if sample_format == 's24':
+        return ints.astype('<i4').view(np.uint8).reshape(*ints.shape, 4)[..., :3]
+    return ints.astype(WAV_SAMPLE_DTYPES[sample_format])
+
+def sample_format_of(audio_np):
+    """由 open_wav_frames 返回的视图推断样本格式"""
+    if audio_np.ndim == 3:
+        return 's24'
+    return {'u1': 'u8', 'i2': 's16', 'i4': 's32', 'f4': 'f32', 'f8': 'f64'}[audio_np.dtype.str[1:]]
+
+def _crossing_offsets(audio_np, points, radius, sample_format):
+    """各位置 radius 帧内的过零点 (各声道平均后符号改变处)，返回 (行号, 相对偏移) 按行、按距离排序"""
+    total = len(audio_np)
+    offsets = np.arange(-radius, radius + 1)
+    rows_all, shifts_all = [], []
+    for first in range(0, len(points), 65536):
+        rows = np.clip(points[first:first + 65536, None] + offsets, 0, total - 1)
+        mono = pcm_to_float(audio_np[rows.ravel()], sample_format).reshape(*rows.shape, -1).mean(axis=2)
+        sign = np.signbit(mono)
+        # 第 j 与 j+1 帧符号不同，则在 j+1 处切开
+        row, col = np.nonzero(sign[:, 1:] != sign[:, :-1])
+        rows_all.append(row + first)
+        shifts_all.append(offsets[1:][col])
+    row, shift = np.concatenate(rows_all), np.concatenate(shifts_all)
+    order = np.lexsort((np.abs(shift), row))
+    return row[order], shift[order]
+
+def _align_zero_crossings(audio_np, starts, ends, radius, sample_format):
+    """
+    起点移到最近的过零点；终点在过零点中挑选能抵消累计时长变化的那个，
+    使输出中每段的位置与原时间轴的偏差始终不超过 radius，字幕无需随之调整
+    """
+    row, shift = _crossing_offsets(audio_np, starts, radius, sample_format)
+    first = np.unique(row, return_index=True)
+    new_starts = starts.copy()
+    new_starts[first[0]] += shift[first[1]]
+    new_starts = np.where(new_starts < ends, new_starts, starts)
+    row, shift = _crossing_offsets(audio_np, ends, radius, sample_format)
+    bounds = np.searchsorted(row, np.arange(len(ends) + 1))
+    candidates = shift.tolist()
+    gained = (starts - new_starts).tolist()
+    new_ends = ends.tolist()
+    drift = 0
+    for k in range(len(ends)):
+        drift += gained[k]
+        lo, hi = bounds[k], bounds[k + 1]
+        if lo < hi:
+            move = min(candidates[lo:hi], key=lambda c: abs(c + drift))
+            if new_ends[k] + move > new_starts[k]:
+                new_ends[k] += move
+                drift += move
+    return new_starts, np.array(new_ends, dtype=ends.dtype)
+
+def plan_splices(audio_np, starts, ends, sample_rate, mode="crossfade", seconds=SPLICE_SECONDS):
+    """
+    为各拼接处做准备，返回 (starts, ends, plan)。
+    zerocross: 把区间起止点移到 seconds/2 内的过零点，plan 为 None，拼接时无需额外处理；
+    crossfade: 区间不变，plan 记录每个拼接处的等功率交叉淡化长度，由 iter_cut_batches 在输出上就地完成。
+    淡化以拼接点为中心，用到前一段结尾之后与后一段开头之前的源音频，输出总长度不变
+    """
+    total = len(audio_np)
+    starts, ends = np.minimum(starts, total), np.minimum(ends, total)
+    sample_format = sample_format_of(audio_np)
+    half = max(1, int(round(seconds * sample_rate / 2)))
+    if mode == "zerocross":
+        if not len(starts):
+            return starts, ends, None
+        new_starts, new_ends = _align_zero_crossings(audio_np, starts, ends, half, sample_format)
+        return new_starts, new_ends, None
+    if mode != "crossfade":
+        raise ValueError(f"未知的拼接方式: {mode}")
+    lengths = ends - starts
+    # 淡化不超过两侧区间长度的一半，也不能超出源文件
+    joint = np.minimum.reduce([np.full(max(0, len(starts) - 1), half, dtype=np.int64),
+                               lengths[:-1] // 2, lengths[1:] // 2, starts[1:], total - ends[:-1]])
+    joint = np.maximum(joint, 0)
+    head = np.concatenate(([0], joint)).astype(np.int64)
+    tail = np.concatenate((joint, [0])).astype(np.int64)
+    return starts, ends, SplicePlan(head, tail, sample_format)
+
+def _expand(lo, hi):
+    """把若干 [lo, hi) 区间展开为 (所属区间下标, 区间内偏移) 两个扁平数组"""
+    counts = np.maximum(hi - lo, 0)
+    owner = np.repeat(np.arange(len(counts)), counts)
+    within = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+    return owner, within
+
+def _crossfade_batch(batch, audio_np, pieces, starts, ends, plan):
+    """
+    在已拼好的批次上就地完成交叉淡化。pieces 为 (源起点, 源终点, 区间号, 批内偏移)，
+    区间结尾淡出的同时混入下一区间开头之前的源音频，区间开头淡入的同时混入上一区间结尾之后的源音频
+    """
+    a, b, r, o = pieces.T
+    for side in ('tail', 'head'):
+        half = (plan.tail if side == 'tail' else plan.head)[r]
+        if side == 'tail':
+            zone_lo, zone_hi = ends[r] - half, ends[r]
+        else:
+            zone_lo, zone_hi = starts[r], starts[r] + half
+        lo, hi = np.maximum(a, zone_lo), np.minimum(b, zone_hi)
+        owner, within = _expand(lo, hi)
+        if not len(owner):
+            continue
+        u = lo[owner] - zone_lo[owner] + within  # 在本侧淡化区内的位置
+        h = half[owner]
+        out_pos = o[owner] + lo[owner] - a[owner] + within
+        if side == 'tail':
+            t = u
+            other = starts[r[owner] + 1] - h + u
+        else:
+            t = h + u
+            other = ends[r[owner] - 1] + u
+        theta = ((t + 0.5) / (2 * h) * (np.pi / 2)).astype(np.float32)
+        fade_out, fade_in = np.cos(theta), np.sin(theta)
+        shape = (-1,) + (1,) * (batch.ndim - 1 - (plan.sample_format == 's24'))
+        mine = pcm_to_float(batch[out_pos], plan.sample_format)
+        theirs = pcm_to_float(audio_np[other], plan.sample_format)
+        if side == 'tail':
+            mixed = mine * fade_out.reshape(shape) + theirs * fade_in.reshape(shape)
+        else:
+            mixed = theirs * fade_out.reshape(shape) + mine * fade_in.reshape(shape)
+        batch[out_pos] = float_to_pcm(mixed, plan.sample_format)
+
+def block_energy(audio_np, sample_format, hop, budget, needed=None):
+    """
+    单趟顺序计算每 hop 帧的短时能量 (各声道均方值)。按内存预算分块读取，
+    needed 为按分析帧的布尔数组时，整块都不需要的部分直接跳过、不读盘
+    """
+    frame_bytes = audio_np[:1].nbytes or 1
+    blocks = len(audio_np) // hop
+    energy = np.full(blocks + 1, np.inf, dtype=np.float32)  # 末尾不足一帧的部分不参与对齐
+    # 有符号整数与浮点样本直接在 einsum 中累加为 float32，不生成转换后的副本；其余格式先转换
+    direct = sample_format in ('s16', 's32', 'f32', 'f64')
+    if sample_format in ('s16', 's32'):
+        full_scale = float(1 << (audio_np.dtype.itemsize * 8 - 1))
+    else:
+        full_scale = 1.0
+    work_bytes = frame_bytes if direct else frame_bytes + 4 * audio_np.shape[1]  # 每帧读取与转换占用的内存
+    step = max(1, budget.batch_bytes() // (hop * work_bytes))
+    for first in range(0, blocks, step):
+        last = min(blocks, first + step)
+        if needed is not None and not needed[first:last].any():
+            continue
+        with budget.reserve((last - first) * hop * work_bytes):
+            frames = audio_np[first * hop:last * hop]
+            block = (frames if direct else pcm_to_float(frames, sample_format)).reshape(last - first, -1)
+            sums = np.einsum('ij,ij->i', block, block, dtype=np.float32, casting='unsafe')
+            energy[first:last] = sums / (block.shape[1] * full_scale * full_scale)
+    return energy
+
+def snap_to_quiet(audio_np, positions, sample_format, sample_rate, tolerance, budget,
+                  hop_seconds=SNAP_HOP, quiet_db=SNAP_QUIET_DB, silence_db=SNAP_SILENCE_DB):
+    """
+    把各切点 (采样帧位置) 移到 tolerance 秒内最近的安静分析帧上：安静指不比窗口内最低能量高出 quiet_db，
+    或低于 silence_db。切点所在的帧本身已经安静时保持不动。只对切点附近做一次能量分析，
+    所有切点的查找都是对 (切点数, 窗口帧数) 矩阵的向量运算
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    hop = max(1, int(round(hop_seconds * sample_rate)))
+    radius = max(1, int(np.ceil(tolerance * sample_rate / hop)))
+    blocks = len(audio_np) // hop
+    if not len(positions) or not blocks:
+        return positions
 
-def parallel_compress_segments(wav_files, output_path, output_format, quality):
+    centre = np.clip(positions // hop, 0, blocks)
+    # 差分数组标出所有切点 ± radius 覆盖到的分析帧
+    marks = np.zeros(blocks + 2, dtype=np.int32)
+    np.add.at(marks, np.clip(centre - radius, 0, blocks + 1), 1)
+    np.add.at(marks, np.clip(centre + radius + 1, 0, blocks + 1), -1)
+    energy = block_energy(audio_np, sample_format, hop, budget, np.cumsum(marks)[:blocks] > 0)
+
+    offsets = np.arange(-radius, radius + 1)
+    distance = np.abs(offsets).astype(np.float32)
+    quiet_ratio = np.float32(10 ** (quiet_db / 10))
+    silence = np.float32(10 ** (silence_db / 10))
+    snapped = positions.copy()
+    for first in range(0, len(positions), 65536):  # 分段限制矩阵大小
+        rows = centre[first:first + 65536, None] + offsets
+        window = energy[np.clip(rows, 0, blocks)]
+        window[(rows < 0) | (rows >= blocks)] = np.inf
+        floor = window.min(axis=1, keepdims=True)
+        quiet = (window <= floor * quiet_ratio) | (window <= silence)
+        best = np.argmin(np.where(quiet, distance, np.inf), axis=1)
+        moved = (offsets[best] != 0) & np.isfinite(floor[:, 0])
+        target = (centre[first:first + 65536] + offsets[best]) * hop + hop // 2
+        snapped[first:first + 65536] = np.where(moved, target, positions[first:first + 65536])
+    return snapped
+
+def refine_cut_points(audio_np, layout, subtitles, clip_start_time, tolerance, budget):
+    """字幕起止时间对齐到 tolerance 秒内的安静处，返回新的字幕列表 (时间轴不变，仍为秒)"""
+    if not subtitles or tolerance <= 0:
+        return list(subtitles)
+    sample_rate = layout.sample_rate
+    times = np.array([(start, end) for _, start, end, _ in subtitles], dtype=np.float64)
+    original = np.round((times - clip_start_time) * sample_rate).astype(np.int64)
+    snapped = snap_to_quiet(audio_np, original.ravel(), layout.sample_format, sample_rate,
+                            tolerance, budget).reshape(-1, 2)
+    # 对齐后长度不为正的字幕保持原样
+    collapsed = snapped[:, 1] <= snapped[:, 0]
+    snapped[collapsed] = original[collapsed]
+    shift = np.abs(snapped - original)
+    moved = int((shift > 0).sum())
+    if moved:
+        print(f"🎯 切点对齐: {moved}/{shift.size} 个切点移到安静处，平均移动 {shift[shift > 0].mean() / sample_rate * 1000:.0f}ms")
+    refined = snapped / sample_rate + clip_start_time
+    return [(index, start, end, content) for (index, _, _, content), (start, end)
+            in zip(subtitles, refined.tolist())]
+
+def _vad_energy_pcm(wav_path, hop_seconds, ctx):
+    """PCM WAV 直接内存映射，按时间分块并行计算各分析帧的能量"""
+    layout, audio_np = open_wav_frames(wav_path)
+    hop = max(1, int(round(hop_seconds * layout.sample_rate)))
+    chunk = max(1, int(VAD_CHUNK_SECONDS * layout.sample_rate) // hop) * hop
+    blocks = len(audio_np) // hop
+
+    def energy_of(first):
+        energy = block_energy(audio_np[first:first + chunk], layout.sample_format, hop, ctx.memory)
+        return energy[:-1]
+
+    with ThreadPoolExecutor(max_workers=ctx.max_workers) as executor:
+        parts = list(executor.map(energy_of, range(0, blocks * hop, chunk)))
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=np.float32), hop / layout.sample_rate
+
+def _vad_energy_stream(input_path, hop_seconds, ctx, duration, sample_rate=VAD_SAMPLE_RATE):
+    """
+    按时间分块，每块由一个 ffmpeg 解码为低采样率单声道 PCM 经管道读入并逐段计算能量，
+    各块并行，解码 (通常是瓶颈) 也随之并行；块边界对齐到分析帧
+    """
+    hop = max(1, int(round(hop_seconds * sample_rate)))
+    read_bytes = max(1, int(VAD_CHUNK_SECONDS * sample_rate) // hop) * hop * 2
+    total_blocks = max(1, int(np.ceil(duration * sample_rate / hop)))
+    parts = max(1, min(ctx.max_workers, int(duration // (2 * VAD_CHUNK_SECONDS))))
+    part_blocks = -(-total_blocks // parts)
+
+    def energy_of(first_block):
+        last = first_block == (parts - 1) * part_blocks
+        cmd = ["ffmpeg", "-v", "error", "-nostdin"]
+        if first_block:
+            cmd += ["-ss", str(first_block * hop / sample_rate)]
+        if not last:
+            cmd += ["-t", str(part_blocks * hop / sample_rate)]
+        decoder = ctx.registry.spawn(
+            [*cmd, "-i", input_path, "-vn", "-acodec", "pcm_s16le", "-ar", str(sample_rate), "-ac", "1",
+             "-f", "s16le", "pipe:1"], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        decoder_errors, pieces, tail = [], [], b''
+        drain = threading.Thread(target=_drain_stderr, args=(decoder, decoder_errors), daemon=True)
+        drain.start()
+        try:
+            while True:
+                data = decoder.stdout.read(read_bytes)
+                if not data:
+                    break
+                data = tail + data
+                usable = len(data) // (hop * 2) * hop * 2
+                block = np.frombuffer(data, dtype=np.int16, count=usable // 2).reshape(-1, hop)
+                sums = np.einsum('ij,ij->i', block, block, dtype=np.float32, casting='unsafe')
+                pieces.append(sums / (hop * 32768.0 * 32768.0))
+                tail = data[usable:]
+            decoder.wait()
+        finally:
+            ctx.registry.terminate(decoder, grace=1)
+            drain.join(timeout=1)
+        if decoder.returncode != 0:
+            raise RuntimeError(f"FFmpeg错误: {' '.join(decoder_errors)[:500]}")
+        energy = np.concatenate(pieces) if pieces else np.zeros(0, dtype=np.float32)
+        # 解码出的长度与请求略有出入时补齐或截断，保证各块首尾相接
+        if not last and len(energy) != part_blocks:
+            energy = np.concatenate((energy, np.zeros(part_blocks, dtype=np.float32)))[:part_blocks]
+        return energy
+
+    with ThreadPoolExecutor(max_workers=parts) as executor:
+        energy = np.concatenate(list(executor.map(energy_of, range(0, parts * part_blocks, part_blocks))))
+    return energy, hop / sample_rate
+
+def speech_ranges(energy, hop_seconds, margin_db=VAD_MARGIN_DB, silence_db=VAD_SILENCE_DB,
+                  min_silence=VAD_MIN_SILENCE, min_speech=VAD_MIN_SPEECH, padding=VAD_PADDING):
+    """
+    由各分析帧的能量得出有声区间 (秒)。阈值取底噪 (低分位数) 加 margin_db，
+    但不高于响度 (高分位数) 减 margin_db，整段都有声时也不会被剪空；再合并短停顿、丢弃短噪声、两端加余量
+    """
+    if not len(energy):
+        return np.zeros(0), np.zeros(0)
+    db = 10 * np.log10(np.maximum(energy, 1e-12))
+    floor, loud = np.percentile(db, [10, 95])
+    threshold = max(silence_db, min(floor + margin_db, loud - margin_db))
+    active = np.concatenate(([0], (db > threshold).view(np.int8), [0]))
+    edges = np.diff(active)
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    if len(starts):
+        joined = (starts[1:] - ends[:-1]) * hop_seconds < min_silence
+        starts, ends = starts[np.concatenate(([True], ~joined))], ends[np.concatenate((~joined, [True]))]
+        kept = (ends - starts) * hop_seconds >= min_speech
+        starts, ends = starts[kept], ends[kept]
+    duration = len(energy) * hop_seconds
+    starts = np.maximum(starts * hop_seconds - padding, 0.0)
+    ends = np.minimum(ends * hop_seconds + padding, duration)
+    # 加上余量后重叠的片段合并
+    if len(starts):
+        joined = starts[1:] <= ends[:-1]
+        starts, ends = starts[np.concatenate(([True], ~joined))], ends[np.concatenate((~joined, [True]))]
+    return starts, ends
+
+def detect_speech(input_path, ctx, hop_seconds=VAD_HOP, **options):
+    """
+    没有字幕时用能量检测找出有声片段，返回与 parse_srt 相同的 SubtitleTable，
+    main 及之后的切割流程无需区分字幕来源。options 传给 speech_ranges
+    """
+    info = probe_audio(input_path, ctx)
+    is_pcm = info.get('codec', '').startswith('pcm_')
+    if is_pcm:
+        try:
+            read_wav_layout(input_path)
+        except (ValueError, struct.error, OSError):
+            is_pcm = False
+    if is_pcm:
+        energy, hop_seconds = _vad_energy_pcm(input_path, hop_seconds, ctx)
+    else:
+        energy, hop_seconds = _vad_energy_stream(input_path, hop_seconds, ctx, info['duration'])
+    starts, ends = speech_ranges(energy, hop_seconds, **options)
+    count = len(starts)
+    kept = float((ends - starts).sum())
+    print(f"🎙️ 语音检测: {count} 个有声片段，共 {kept:.1f}s / {len(energy) * hop_seconds:.1f}s")
+    return SubtitleTable(np.arange(1, count + 1, dtype=np.int64), np.round(starts, 3), np.round(ends, 3),
+                         VAD_LABEL * count, np.arange(count + 1, dtype=np.int64) * len(VAD_LABEL))
+
+def iter_cut_batches(audio_np, starts, ends, budget, max_ranges=None, splice=None):
+    """
+    按样本字节数 (而非字幕条数) 划分批次，逐批产出切好的帧；超长区间会被拆开。
+    每批在被消费期间占用预算中的相应额度，额度不足时等待，而不是一次分配整段输出。
+    splice 为 plan_splices 返回的 SplicePlan 时，拼接处在批次上就地交叉淡化 (跨批次的拼接处两边各自完成)
+    """
+    frame_bytes = audio_np[:1].nbytes or 1
+    max_frames = max(1, budget.batch_bytes() // frame_bytes)
+    max_ranges = max_ranges or len(starts) or 1
+    total = len(audio_np)
+    pieces, frames = [], 0
+
+    starts, ends = np.minimum(starts, total), np.minimum(ends, total)
+
+    def flush():
+        batch = np.empty((frames, *audio_np.shape[1:]), dtype=audio_np.dtype)
+        offset = 0
+        for a, b, _ in pieces:
+            batch[offset:offset + b - a] = audio_np[a:b]
+            offset += b - a
+        if splice:
+            meta = np.array(pieces, dtype=np.int64).reshape(-1, 3)
+            offsets = np.concatenate(([0], np.cumsum(meta[:, 1] - meta[:, 0])[:-1]))
+            _crossfade_batch(batch, audio_np, np.column_stack((meta, offsets)), starts, ends, splice)
+        return batch
+
+    for k, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+        while start < end:
+            take = min(end - start, max_frames - frames)
+            pieces.append((start, start + take, k))
+            frames += take
+            start += take
+            if frames >= max_frames or len(pieces) >= max_ranges:
+                with budget.reserve(frames * frame_bytes):
+                    yield flush()
+                pieces, frames = [], 0
+    if pieces:
+        with budget.reserve(frames * frame_bytes):
+            yield flush()
+
+def cut_audio_segments_with_numpy_parallel(wav_path, subtitles, output_path, clip_start_time, ctx=None,
+                                           snap_tolerance=0.0, splice=None, splice_seconds=SPLICE_SECONDS):
+    """
+    按内存预算分批切割并直接写出 WAV，内存紧张时批次变小、等待，而不是报错。
+    snap_tolerance > 0 时先把切点对齐到该范围 (秒) 内的安静处；
+    splice 为 crossfade/zerocross 时在拼接处做交叉淡化或过零对齐，消除爆音
+    """
+    budget = ctx.memory if ctx else get_memory_budget()
+    layout, audio_np = open_wav_frames(wav_path)
+    subtitles = refine_cut_points(audio_np, layout, subtitles, clip_start_time, snap_tolerance, budget)
+    starts, ends = compile_keep_ranges(subtitles, clip_start_time, layout.sample_rate)
+    plan = None
+    if splice:
+        starts, ends, plan = plan_splices(audio_np, starts, ends, layout.sample_rate, splice, splice_seconds)
+    with WavWriter(output_path, layout) as writer:
+        for batch in iter_cut_batches(audio_np, starts, ends, budget, splice=plan):
+            writer.write(batch)
+
+def audio_encoder_args(output_format, quality, ctx):
+    if output_format == "mp3":
+        return ["-c:a", "libmp3lame", "-q:a", "2" if quality == "high" else "4"]
     if output_format == "m4a":
-        concat_file = os.path.join(TEMP_DIR, "concat.txt")
-        with open(concat_file, 'w') as f:
-            f.write("\n".join(f"file '{w}'" for w in wav_files))
-        
-        merged_wav = os.path.join(TEMP_DIR, "merged.wav")
-        safe_ffmpeg_run(["ffmpeg", "-y", "-f", "concat", "-safe", "0",
-                         "-i", concat_file, "-c", "copy", merged_wav])
-        
-        compress_audio_to_aac(merged_wav, output_path)
-        return
-
-    temp_dir = os.path.join(TEMP_DIR, "compress_mp3")
-    os.makedirs(temp_dir, exist_ok=True)
-
-    def process_file(i, input_wav):
-        output_file = os.path.join(temp_dir, f"{i}.mp3")
-        compress_audio_to_mp3(input_wav, output_file, quality)
-        return output_file
-
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = [executor.submit(process_file, i, w) for i, w in enumerate(wav_files)]
-        mp3_files = [f.result() for f in tqdm(futures, desc="🔧 压缩进度")]
-
-    concat_file = os.path.join(TEMP_DIR, "mp3_list.txt")
-    with open(concat_file, 'w') as f:
-        f.write("\n".join(f"file '{mp3}'" for mp3 in mp3_files))
-    
-    safe_ffmpeg_run(["ffmpeg", "-y", "-f", "concat", "-safe", "0",
-                     "-i", concat_file, "-c", "copy", output_path])
+        if ctx.aac_params is None:
+            ctx.aac_params = check_aac_encoder()
+        return [*ctx.aac_params, "-movflags", "+faststart"]
+    return ["-c:a", "pcm_s16le"]
+
+def _drain_stderr(proc, lines):
+    for line in proc.stderr:
+        lines.append(line.decode(errors='replace').strip())
+        del lines[:-20]
+
+def _raw_pcm_args(layout):
+    return ["-f", PCM_RAW_FORMATS[layout.sample_format], "-ar", str(layout.sample_rate),
+            "-ac", str(layout.channels)]
+
+class PcmEncoder:
+    """长驻的单个编码进程：各批次 PCM 依次写入其 stdin，整段只编码一次，批次之间没有编码器延迟造成的空隙"""
+    def __init__(self, output_path, layout, output_format, quality, ctx):
+        self.ctx = ctx
+        self.proc = ctx.registry.spawn(
+            ["ffmpeg", "-y", "-v", "error", *_raw_pcm_args(layout), "-i", "pipe:0",
+             *audio_encoder_args(output_format, quality, ctx), output_path],
+            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        self.errors = []
+        self.drain = threading.Thread(target=_drain_stderr, args=(self.proc, self.errors), daemon=True)
+        self.drain.start()
+        self.broken = False
+
+    def write(self, frames):
+        if self.broken: return
+        if isinstance(frames, np.ndarray):
+            frames = memoryview(np.ascontiguousarray(frames)).cast('B')
+        try:
+            self.proc.stdin.write(frames)
+        except BrokenPipeError:
+            # 编码器已退出，具体原因在 close() 中随返回码一起报告
+            self.broken = True
+
+    def close(self):
+        try:
+            self.proc.stdin.close()
+        except OSError: pass
+        rc = self.proc.wait()
+        self.ctx.registry.discard(self.proc)
+        self.drain.join(timeout=1)
+        if self.ctx.registry.cancelled.is_set():
+            raise RuntimeError("任务已取消")
+        if rc != 0:
+            raise RuntimeError(f"FFmpeg错误: {' '.join(self.errors)[:500]}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class WavWriter:
+    """逐批追加帧的 WAV 写出器，关闭时回填头部长度"""
+    def __init__(self, path, layout):
+        self.layout = layout
+        self.file = open(path, 'wb')
+        self.file.write(_wav_header(layout, 0))
+        self.data_size = 0
+
+    def write(self, frames):
+        frames = memoryview(np.ascontiguousarray(frames)).cast('B')
+        self.file.write(frames)
+        self.data_size += frames.nbytes
+
+    def close(self):
+        self.file.seek(0)
+        self.file.write(_wav_header(self.layout, self.data_size))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class DecodeSession:
+    """
+    只打开一次输入，按帧号随机读取任意区间的 s16 PCM，返回 (帧, 声道) 数组。
+    安装了 PyAV 时在进程内解码，远距离或向后跳转时 seek；否则由一个 ffmpeg 解码到管道，
+    向前的短距离跳转读取后丢弃，向后或远距离跳转时带 -ss 重新启动 (MP3 等容器的 -ss 放在输出端，
+    由 ffmpeg 解码后丢弃以保证精确到帧，远距离跳转也不重启)。按时间顺序读取时全程只解码一遍
+    """
+    def __init__(self, path, ctx, sample_rate=None, channels=None, backend=None, info=None):
+        # info 为 probe_audio 的结果，同一输入开多个会话时传入以免重复运行 ffprobe
+        info = info or probe_audio(path, ctx)
+        self.layout = pcm_layout(sample_rate or info['sample_rate'] or STREAM_SAMPLE_RATE,
+                                 channels or info['channels'] or STREAM_CHANNELS)
+        self.duration = info['duration']  # 容器给出的时长 (秒)，MP3 等可能是估算值
+        self.path = path
+        self.ctx = ctx
+        self.backend = backend or ('pyav' if av else 'ffmpeg')
+        self.exact_seek = self.backend == 'pyav' or info['format'] not in INEXACT_SEEK_FORMATS
+        self.container = None
+        self.decoder = None
+        self.chunks = None  # 产出 (首帧帧号, 帧数组) 的迭代器，每次定位后重建
+        self.buffer = np.zeros((0, self.layout.channels), dtype=np.int16)
+        self.buffer_start = 0
+        self.seeks = 0
+
+    def read(self, start, end):
+        """读取 [start, end) 帧；到达文件末尾时返回的帧数可能少于请求"""
+        start, end = int(start), int(end)
+        buffer_end = self.buffer_start + len(self.buffer)
+        far = self.exact_seek and start > buffer_end + DECODE_SEEK_SECONDS * self.layout.sample_rate
+        if self.chunks is None or start < self.buffer_start or far:
+            self._open(start)
+        out = np.empty((max(0, end - start), self.layout.channels), dtype=np.int16)
+        pos = start
+        while pos < end:
+            buffer_end = self.buffer_start + len(self.buffer)
+            if self.buffer_start <= pos < buffer_end:
+                take = min(end, buffer_end) - pos
+                out[pos - start:pos - start + take] = self.buffer[pos - self.buffer_start:pos - self.buffer_start + take]
+                pos += take
+                continue
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer_start, self.buffer = chunk
+            if self.buffer_start > pos:
+                # 解码出的时间戳有空隙时补静音
+                gap = min(self.buffer_start, end) - pos
+                out[pos - start:pos - start + gap] = 0
+                pos += gap
+        return out[:pos - start]
+
+    def _open(self, frame):
+        self.seeks += 1
+        self.buffer = self.buffer[:0]
+        self.buffer_start = frame
+        self.chunks = self._pyav_chunks(frame) if self.backend == 'pyav' else self._ffmpeg_chunks(frame)
+
+    def _pyav_chunks(self, frame):
+        if self.container is None:
+            self.container = av.open(self.path)
+        stream = self.container.streams.audio[0]
+        # 时间戳含流的起始偏移 (如 MP3 的编码器延迟)，换算为从 0 开始的帧号
+        origin = float((stream.start_time or 0) * stream.time_base)
+        # 定位到目标之前一点，解码后丢弃多出的部分
+        target = max(0.0, frame / self.layout.sample_rate - DECODE_PREROLL)
+        self.container.seek(int((target + origin) / stream.time_base), stream=stream)
+        resampler = av.AudioResampler(format='s16', layout={1: 'mono', 2: 'stereo'}.get(
+                                          self.layout.channels, f"{self.layout.channels}c"),
+                                      rate=self.layout.sample_rate)
+        checked = not frame
+        for decoded in self.container.decode(stream):
+            for converted in resampler.resample(decoded):
+                first = int(round((converted.pts * converted.time_base - origin) * self.layout.sample_rate))
+                if not checked:
+                    checked = True
+                    if first > frame:
+                        # 定位越过了目标 (如无索引的 VBR 文件)，改为从头解码
+                        yield from self._pyav_chunks(0)
+                        return
+                yield first, converted.to_ndarray().reshape(-1, self.layout.channels)
+
+    def _ffmpeg_chunks(self, frame):
+        if self.decoder:
+            self.ctx.registry.terminate(self.decoder, grace=1)
+        if self.exact_seek:
+            # 输入端定位到目标之前一点，解码器预热后的多出部分由 read 丢弃
+            frame = max(0, frame - int(DECODE_PREROLL * self.layout.sample_rate))
+        seek = ["-ss", str(frame / self.layout.sample_rate)] if frame else []
+        # 输入端 -ss 对 MP3 等不能精确到帧，改放在输出端由 ffmpeg 解码后丢弃
+        before, after = (seek, []) if self.exact_seek else ([], seek)
+        self.decoder = decoder = self.ctx.registry.spawn(
+            ["ffmpeg", "-v", "error", "-nostdin", *before, "-i", self.path, *after, "-vn", "-acodec", "pcm_s16le",
+             *_raw_pcm_args(self.layout), "pipe:1"],
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        frame_bytes = self.layout.block_align
+        tail = b''
+        while True:
+            data = decoder.stdout.read(STREAM_CHUNK_BYTES)
+            if not data:
+                return
+            data = tail + data
+            usable = len(data) - len(data) % frame_bytes
+            tail = data[usable:]
+            chunk = np.frombuffer(data, dtype=np.int16, count=usable // 2).reshape(-1, self.layout.channels)
+            yield frame, chunk
+            frame += len(chunk)
+
+    def close(self):
+        self.chunks = None
+        if self.decoder:
+            self.ctx.registry.terminate(self.decoder, grace=1)
+            self.decoder = None
+        if self.container is not None:
+            self.container.close()
+            self.container = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _mp3_frame_offsets(data):
+    """逐帧解析 MP3 帧头，返回每一帧在数据中的起始偏移"""
+    offsets, i = [], 0
+    while i + 4 <= len(data):
+        header = int.from_bytes(data[i:i + 4], 'big')
+        version, layer = (header >> 19) & 3, (header >> 17) & 3
+        bitrate_index, rate_index = (header >> 12) & 15, (header >> 10) & 3
+        if (header >> 21) != 0x7FF or layer != 1 or version == 1 or bitrate_index in (0, 15) or rate_index == 3:
+            raise ValueError(f"无效的MP3帧头 (偏移 {i})")
+        bitrate = MP3_BITRATES[version == 3][bitrate_index] * 1000
+        sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+        offsets.append(i)
+        i += (144 if version == 3 else 72) * bitrate // sample_rate + ((header >> 9) & 1)
+    return offsets
+
+def _mp3_frame_len(sample_rate):
+    return 1152 if sample_rate >= 32000 else 576
+
+def _encode_mp3_frames(block, layout, first, count, encoder_args, ctx):
+    """
+    把一段 PCM 编码为 MP3 (关闭比特池)，只返回从第 first 帧起的 count 帧；count 为 None 时取到末尾。
+    block 起点须落在帧网格上，前面多出的帧即为编码器预热。
+    """
+    proc = ctx.registry.spawn(
+        ["ffmpeg", "-v", "error", *_raw_pcm_args(layout), "-i", "pipe:0",
+         *encoder_args, "-reservoir", "0",
+         "-write_xing", "0", "-id3v2_version", "0", "-f", "mp3", "pipe:1"],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        data, err = proc.communicate(np.ascontiguousarray(block).tobytes(), timeout=ctx.timeout)
+    except subprocess.TimeoutExpired:
+        ctx.registry.terminate(proc)
+        raise RuntimeError(f"FFmpeg处理超时 (超过{ctx.timeout}秒)")
+    finally:
+        ctx.registry.discard(proc)
+    if proc.returncode != 0:
+        raise RuntimeError(f"FFmpeg错误: {err.decode(errors='replace').strip()[:500]}")
+
+    offsets = _mp3_frame_offsets(data) + [len(data)]
+    last = len(offsets) - 1 if count is None else first + count
+    if last > len(offsets) - 1:
+        raise RuntimeError("MP3分块输出帧数不足")
+    return data[offsets[first]:offsets[last]]
+
+def encode_mp3_gapless(wav_path, output_path, quality, ctx, chunk_seconds=PARALLEL_ENCODE_CHUNK):
+    """
+    无缝分块并行编码 MP3。
+    每块的起点都对齐到 MP3 帧长 (1152 样本)，并向前多编码若干帧作为预热，
+    编码后按帧精确丢弃预热部分再首尾相接。由于所有块的帧网格与整段一次编码时完全一致，
+    拼接处不会出现编码器延迟和填充带来的空隙。块间关闭比特池 (reservoir)，保证每帧可独立解码。
+    """
+    layout, pcm = open_wav_frames(wav_path)
+    frame_len = _mp3_frame_len(layout.sample_rate)
+    preroll, postroll = MP3_PREROLL_FRAMES * frame_len, 2 * frame_len
+    total = layout.frames
+    step = max(1, int(chunk_seconds * layout.sample_rate) // frame_len) * frame_len
+    # 每块按两倍 (含预热) 的输入大小申请额度，块长不超过预算能容纳的大小
+    fits = ctx.memory.total // (2 * layout.block_align) - preroll - postroll
+    step = min(step, max(1, fits // frame_len) * frame_len)
+    bounds = list(range(0, total, step)) + [total]
+    last_chunk = len(bounds) - 2
+    encoder_args = audio_encoder_args("mp3", quality, ctx)
+
+    def encode_chunk(i):
+        a, b = bounds[i], bounds[i + 1]
+        s0 = max(0, a - preroll)
+        s1 = total if i == last_chunk else min(total, b + postroll)
+        # 输入 PCM 的拷贝加上编码输出，按两倍输入大小申请内存额度
+        with ctx.memory.reserve(2 * (s1 - s0) * layout.block_align):
+            return _encode_mp3_frames(pcm[s0:s1], layout, (a - s0) // frame_len,
+                                      None if i == last_chunk else (b - a) // frame_len, encoder_args, ctx)
+
+    with ThreadPoolExecutor(max_workers=ctx.max_workers) as executor:
+        parts = list(tqdm(executor.map(encode_chunk, range(len(bounds) - 1)), total=len(bounds) - 1,
+                          desc="🔧 分块编码", unit="chunk"))
+
+    raw_mp3 = ctx.path("gapless_raw.mp3")
+    with open(raw_mp3, 'wb') as f:
+        for part in parts:
+            f.write(part)
+    # 再封装一次以写入 Xing 头 (时长与索引)，不重新编码
+    safe_ffmpeg_run(["ffmpeg", "-y", "-i", raw_mp3, "-c", "copy", output_path], ctx=ctx)
+
+def _recut_buckets(subtitles, total, sample_rate, frame_len):
+    """
+    按源字幕序号把保留字幕分桶，编译每桶的保留区间，并把最后一个区间延长或缩短
+    (不超过半帧) 使桶长为帧长的整数倍。返回 [(签名, starts, ends, 补零帧数)] 与剪辑后时间轴上的字幕列表。
+    """
+    groups = {}
+    for sub in subtitles:
+        groups.setdefault((sub[0] - 1) // RECUT_BUCKET, []).append(sub)
+
+    buckets, adjusted, position = [], [], 0
+    for bucket_id in sorted(groups):
+        subs = groups[bucket_id]
+        starts, ends = compile_keep_ranges(subs, 0.0, sample_rate)
+        starts, ends = np.minimum(starts, total), np.minimum(ends, total)
+        length = int((ends - starts).sum())
+        if not length:
+            continue
+        shift = -(length % frame_len)
+        if shift < -(frame_len // 2) or ends[-1] + shift <= starts[-1]:
+            shift += frame_len
+        ends[-1] += shift
+        zero_pad = max(0, int(ends[-1]) - total)  # 源文件末尾不够时补静音
+        ends[-1] -= zero_pad
+        buckets.append(([bucket_id, starts.tolist(), ends.tolist(), zero_pad], starts, ends, zero_pad))
+        # 桶内按合并后的区间换算到输出时间轴，再加上之前各桶 (含长度调整) 的总长
+        offset = position / sample_rate
+        adjusted += [(index, start + offset, end + offset, content)
+                     for index, start, end, content in output_timeline(subs, 0.0, sample_rate)]
+        position += int((ends - starts).sum()) + zero_pad
+    return buckets, adjusted
+
+def incremental_cut(source_wav, subtitles, output_path, output_format, quality, ctx,
+                    source_id=None, encoder_args=None):
+    """
+    增量重剪 (MP3/WAV)。保留字幕按源序号分桶，每桶编码为一个可独立解码、首尾无缝的分块，
+    分块与清单 (manifest.json) 保存在输出文件旁的 <输出>.autocut 目录。
+    重跑时只重新编码保留区间有变化的桶及其相邻桶 (预热与收尾取自相邻桶)，其余分块直接复用后拼接。
+    source_wav 为时间轴与字幕一致的整段 PCM WAV，返回剪辑后时间轴上的字幕列表，用于生成新字幕。
+    """
+    if output_format not in RECUT_FORMATS:
+        raise ValueError(f"增量重剪只支持 {'/'.join(RECUT_FORMATS)} 格式")
+    layout, frames = open_wav_frames(source_wav)
+    frame_len = _mp3_frame_len(layout.sample_rate)
+    buckets, adjusted = _recut_buckets(subtitles, len(frames), layout.sample_rate, frame_len)
+    if not buckets:
+        raise ValueError("没有需要保留的片段")
+    if encoder_args is None and output_format == "mp3":
+        encoder_args = audio_encoder_args("mp3", quality, ctx)
+
+    lengths = [int((ends - starts).sum()) + zero_pad for _, starts, ends, zero_pad in buckets]
+
+    def bucket_pcm(k, a, b):
+        """取第 k 桶剪辑后时间轴上 [a, b) 的样本，只拷贝这一段，末尾补零的部分为静音"""
+        _, starts, ends, _ = buckets[k]
+        block = np.zeros((b - a, *frames.shape[1:]), dtype=frames.dtype)
+        offset = 0
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            lo, hi = max(a, offset), min(b, offset + end - start)
+            if lo < hi:
+                block[lo - a:hi - a] = frames[start + lo - offset:start + hi - offset]
+            offset += end - start
+            if offset >= b:
+                break
+        return block
+
+    # MP3 分块的内容还取决于相邻桶 (预热与收尾)，所以键中带上相邻桶的签名
+    base = [source_id or source_fingerprint(source_wav), output_format, encoder_args, layout.sample_format,
+            layout.sample_rate, layout.channels]
+    keys = []
+    for k, (signature, _, _, _) in enumerate(buckets):
+        if output_format == "mp3":
+            prev_sig = buckets[k - 1][0] if k > 0 else None
+            next_sig = buckets[k + 1][0] if k + 1 < len(buckets) else None
+            keys.append(cache_key(*base, prev_sig, signature, next_sig))
+        else:
+            keys.append(cache_key(*base, signature))
+
+    chunk_dir = output_path + ".autocut"
+    manifest_path = os.path.join(chunk_dir, "manifest.json")
+    ext = ".mp3" if output_format == "mp3" else ".pcm"
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            previous = set(json.load(f).get('chunks', []))
+    except (OSError, ValueError):
+        previous = set()
+    os.makedirs(chunk_dir, exist_ok=True)
+    dirty = [k for k, key in enumerate(keys)
+             if key not in previous or not os.path.exists(os.path.join(chunk_dir, key + ext))]
+    print(f"♻️ 增量重剪: {len(buckets)} 个分块，复用 {len(buckets) - len(dirty)} 个，重新生成 {len(dirty)} 个")
+
+    preroll, postroll = MP3_PREROLL_FRAMES * frame_len, 2 * frame_len
+    # 每次编码的输入 (含预热与收尾) 与输出按两倍输入大小申请额度，不超过一个内存批次；
+    # 更长的桶按帧长对齐分几次编码，与整段编码一样首尾无缝
+    fits = ctx.memory.batch_bytes() // (2 * layout.block_align) - preroll - postroll
+    piece_frames = max(1, fits // frame_len) * frame_len
+
+    def encode_piece(k, a, b):
+        if output_format != "mp3":
+            return memoryview(np.ascontiguousarray(bucket_pcm(k, a, b))).cast('B')
+        # 预热取自本桶之前的样本或上一桶的末尾，收尾取自本桶之后的样本或下一桶的开头
+        if a:
+            head = bucket_pcm(k, max(0, a - preroll), a)
+        else:
+            head = bucket_pcm(k - 1, max(0, lengths[k - 1] - preroll), lengths[k - 1]) if k > 0 else None
+        if b < lengths[k]:
+            tail = bucket_pcm(k, b, min(lengths[k], b + postroll))
+        else:
+            tail = bucket_pcm(k + 1, 0, min(lengths[k + 1], postroll)) if k + 1 < len(buckets) else None
+        pcm = np.concatenate([p for p in (head, bucket_pcm(k, a, b), tail) if p is not None])
+        last = k == len(buckets) - 1 and b == lengths[k]
+        return _encode_mp3_frames(pcm, layout, 0 if head is None else len(head) // frame_len,
+                                  None if last else (b - a) // frame_len, encoder_args, ctx)
+
+    def build_chunk(k):
+        tmp = os.path.join(chunk_dir, f"{keys[k]}{ext}.tmp")
+        with open(tmp, 'wb') as f:
+            for a in range(0, lengths[k], piece_frames):
+                b = min(lengths[k], a + piece_frames)
+                with ctx.memory.reserve(2 * (b - a + preroll + postroll) * layout.block_align):
+                    f.write(encode_piece(k, a, b))
+        os.replace(tmp, os.path.join(chunk_dir, keys[k] + ext))
+
+    with ThreadPoolExecutor(max_workers=ctx.max_workers) as executor:
+        list(tqdm(executor.map(build_chunk, dirty), total=len(dirty), desc="🔧 增量编码", unit="chunk"))
+
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump({'format': output_format, 'chunks': keys}, f)
+    for name in os.listdir(chunk_dir):
+        if name != "manifest.json" and os.path.splitext(name)[0] not in keys:
+            os.remove(os.path.join(chunk_dir, name))
 
-def generate_new_srt(subtitles, output_path, filter_texts, start_index, end_index, adjusted_subs=None):
-    current_time = 0.0
+    # 拼接分块: MP3 再封装一次写入 Xing 头，WAV 直接补上头部
+    if output_format == "mp3":
+        raw_mp3 = ctx.path("recut_raw.mp3")
+        concat_files([os.path.join(chunk_dir, key + ext) for key in keys], raw_mp3)
+        safe_ffmpeg_run(["ffmpeg", "-y", "-i", raw_mp3, "-c", "copy", output_path], ctx=ctx)
+    else:
+        with WavWriter(output_path, layout) as writer:
+            for key in keys:
+                with open(os.path.join(chunk_dir, key + ext), 'rb') as f:
+                    while True:
+                        block = f.read(STREAM_CHUNK_BYTES)
+                        if not block: break
+                        writer.write(np.frombuffer(block, dtype=np.uint8))
+    return adjusted
+
+def concat_files(paths, output_path):
+    with open(output_path, 'wb') as out:
+        for path in paths:
+            with open(path, 'rb') as f:
+                shutil.copyfileobj(f, out, STREAM_CHUNK_BYTES)
+
+def stream_cut_audio(input_path, subtitles, clip_start_time, clip_duration, output_path,
+                     output_format, quality, ctx, sample_rate=STREAM_SAMPLE_RATE, channels=STREAM_CHANNELS,
+                     tee_wav=None):
+    """
+    单趟流式剪辑：ffmpeg 解码为原始 PCM 经管道读入，只把字幕区间内的样本写入编码器的 stdin，
+    全程不落地临时 WAV，内存只占用一个固定大小的缓冲区。
+    tee_wav 指定时从头解码整个源文件，解码出的 PCM 同时顺序写入该 WAV (供放入解码缓存)，
+    完整写完时返回 True。
+    解码或编码超过 ctx.timeout 秒没有任何进展时视为卡死，结束两个进程并报错；
+    解码提前结束、没有覆盖到最后一个保留区间时也报错，不输出一个悄悄变短的文件
+    """
+    layout = pcm_layout(sample_rate, channels)
+    frame_bytes = layout.block_align
+    starts, ends = compile_keep_ranges(subtitles, 0.0 if tee_wav else clip_start_time, sample_rate)
+    ranges = list(zip(starts.tolist(), ends.tolist()))
+    if not ranges:
+        raise ValueError("没有需要保留的片段")
+    last_frame = ranges[-1][1]
+
+    window = [] if tee_wav else ["-ss", str(round(max(0, clip_start_time), 6)), "-t", str(round(clip_duration, 6))]
+    decoder = ctx.registry.spawn(
+        ["ffmpeg", "-v", "error", "-nostdin", *window, "-i", input_path, "-vn",
+         "-acodec", "pcm_s16le", *_raw_pcm_args(layout), "-threads", str(ctx.max_workers), "pipe:1"],
+        stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    decoder_errors = []
+    drain = threading.Thread(target=_drain_stderr, args=(decoder, decoder_errors), daemon=True)
+    drain.start()
+    encoder = PcmEncoder(output_path, layout, output_format, quality, ctx)
+    tee = WavWriter(tee_wav, layout) if tee_wav else None
+    tee_complete = False
+
+    # 看门狗: 每读入一块就把期限后延，超过期限时经进程登记表结束解码与编码进程，阻塞的读写随之返回
+    deadline = [time.monotonic() + ctx.timeout]
+    timed_out, finished = threading.Event(), threading.Event()
+    def watchdog():
+        while not finished.wait(1.0):
+            if time.monotonic() > deadline[0]:
+                timed_out.set()
+                ctx.registry.terminate(decoder, grace=1)
+                ctx.registry.terminate(encoder.proc, grace=1)
+                return
+    threading.Thread(target=watchdog, daemon=True).start()
+
+    buf = bytearray(STREAM_CHUNK_BYTES - STREAM_CHUNK_BYTES % frame_bytes)
+    view = memoryview(buf)
+    pos = 0    # 缓冲区首帧在剪辑区间内的帧号
+    fill = 0   # 缓冲区已填充字节数
+    ri = 0     # 第一个尚未写完的区间
+    progress = tqdm(total=last_frame, desc="⏱️ 流式切割", unit="frame", unit_scale=True)
+    try:
+        while (ri < len(ranges) or tee) and not encoder.broken and not timed_out.is_set():
+            n = decoder.stdout.readinto(view[fill:])
+            deadline[0] = time.monotonic() + ctx.timeout
+            if not n:
+                tee_complete = tee is not None and decoder.wait() == 0
+                break
+            fill += n
+            usable = fill - fill % frame_bytes
+            chunk_end = pos + usable // frame_bytes
+            if tee:
+                tee.write(view[:usable])
+
+            while ri < len(ranges) and ranges[ri][1] <= pos:
+                ri += 1
+            j = ri
+            while j < len(ranges) and ranges[j][0] < chunk_end:
+                a, b = max(ranges[j][0], pos), min(ranges[j][1], chunk_end)
+                if b > a:
+                    encoder.write(view[(a - pos) * frame_bytes:(b - pos) * frame_bytes])
+                j += 1
+
+            # 不完整的尾帧挪到缓冲区开头，等待下一次读入补齐
+            view[:fill - usable] = view[usable:fill]
+            fill -= usable
+            progress.update(min(chunk_end, last_frame) - min(pos, last_frame))
+            pos = chunk_end
+    finally:
+        progress.close()
+        # 保留区间已全部输出时解码器可能仍在运行，直接结束即可
+        ctx.registry.terminate(decoder, grace=1)
+        drain.join(timeout=1)
+        deadline[0] = time.monotonic() + ctx.timeout  # 编码器收尾同样受期限约束
+        try:
+            encoder.close()
+        except RuntimeError:
+            if not timed_out.is_set():
+                raise
+        finally:
+            finished.set()
+            if tee:
+                tee.close()
+
+    if timed_out.is_set():
+        raise RuntimeError(f"FFmpeg处理超时 (超过{ctx.timeout}秒没有进展)")
+    if pos < last_frame - int(STREAM_END_TOLERANCE * sample_rate):
+        detail = f": {' '.join(decoder_errors)[:500]}" if decoder_errors else ""
+        raise RuntimeError(f"解码提前结束: 只解码到 {pos / sample_rate:.2f}s，"
+                           f"保留区间到 {last_frame / sample_rate:.2f}s{detail}")
+    return tee_complete
+
+def use_parallel_mp3(output_format, frames, sample_rate, ctx):
+    """输出足够长且有多个工作线程时才值得分块并行编码"""
+    return output_format == "mp3" and ctx.max_workers > 1 and frames / sample_rate >= PARALLEL_ENCODE_MIN_SECONDS
+
+def generate_new_srt(subtitles, output_path, filter_texts, start_index, end_index, adjusted_subs=None,
+                     clip_start_time=0.0, framerate=STREAM_SAMPLE_RATE, retimed=False):
+    """
+    按剪辑后音频的时间轴生成新字幕。adjusted_subs 应与切割时所用的字幕、clip_start_time 与 framerate 一致，
+    重叠的字幕与音频一样合并计算；retimed 为 True 时 adjusted_subs 已是剪辑后的时间，直接写出
+    """
     new_subs = []
 
     # 如果提供了已调整的字幕列表，就使用它
@@ -205,32 +2029,276 @@ def generate_new_srt(subtitles, output_path, filter_texts, start_index, end_inde
                        for i, start, end, content in subtitles[start_index-1:end_index]
                        if content.strip() not in filter_texts]
 
+    if not retimed:
+        source_subs = output_timeline(source_subs, clip_start_time, framerate)
+
     for _, start, end, content in source_subs:
-        duration = end - start
         new_subs.append(srt.Subtitle(
             index=len(new_subs)+1,
-            start=srt.timedelta(seconds=current_time),
-            end=srt.timedelta(seconds=current_time + duration),
+            start=srt.timedelta(seconds=start),
+            end=srt.timedelta(seconds=end),
             content=content
         ))
-        current_time += duration
 
     with open(output_path, 'w', encoding='utf-8') as f:
         f.write(srt.compose(new_subs))
 
-def extract_audio_from_mp4(input_mp4, output_mp3):
-    cmd = ["ffmpeg", "-y", "-i", input_mp4, "-vn", "-acodec", "libmp3lame", output_mp3]
-    safe_ffmpeg_run(cmd)
-
-def extract_clip_mp4(input_mp4, start_time, duration, output_clip_mp4):
+def extract_clip_mp4(input_mp4, start_time, duration, output_clip_mp4, ctx=None):
     cmd = ["ffmpeg", "-y", "-ss", str(round(max(0, start_time), 6)),
            "-t", str(round(duration, 6)), "-i", input_mp4,
            "-c:v", "copy", "-c:a", "copy", "-max_muxing_queue_size", "9999", output_clip_mp4]
-    safe_ffmpeg_run(cmd)
+    safe_ffmpeg_run(cmd, ctx=ctx)
 
-def generate_mp4(input_audio, input_video, output_mp4):
+def generate_mp4(input_audio, input_video, output_mp4, ctx=None):
     cmd = ["ffmpeg", "-y", "-i", input_video, "-i", input_audio, "-c:v", "copy", "-c:a", "aac", output_mp4]
-    safe_ffmpeg_run(cmd)
+    safe_ffmpeg_run(cmd, ctx=ctx)
+
+def video_keep_segments(subtitles):
+    """保留字幕对应的视频区间 (秒)，与音频切割使用同一套合并规则"""
+    starts, ends = compile_keep_ranges(subtitles, 0.0, 1_000_000)
+    return [(start / 1e6, end / 1e6) for start, end in zip(starts.tolist(), ends.tolist())]
+
+def probe_video_stream(path, ctx=None):
+    """用 ffprobe 读取首条视频流的编码与像素格式"""
+    proc = safe_ffmpeg_run(["ffprobe", "-v", "error", "-select_streams", "v:0",
+                            "-show_entries", "stream=codec_name,pix_fmt,width,height",
+                            "-of", "json", path], ctx=ctx)
+    streams = json.loads(proc.stdout.decode() or "{}").get('streams')
+    if not streams:
+        raise ValueError(f"未找到视频流: {path}")
+    return streams[0]
+
+def probe_video_packets(path, ctx=None):
+    """只读取数据包头 (不解码)，返回首条视频流所有帧的时间点 (已排序) 与关键帧时间点"""
+    proc = safe_ffmpeg_run(["ffprobe", "-v", "error", "-select_streams", "v:0",
+                            "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", path], ctx=ctx)
+    pts, keys = [], []
+    for line in proc.stdout.decode().splitlines():
+        fields = line.strip().split(',')
+        if len(fields) < 2 or fields[0] in ('', 'N/A'):
+            continue
+        pts.append(float(fields[0]))
+        if 'K' in fields[1]:
+            keys.append(float(fields[0]))
+    return np.sort(np.array(pts, dtype=np.float64)), np.unique(np.array(keys, dtype=np.float64))
+
+def plan_smart_cut(segments, pts, keyframes):
+    """
+    把每个保留区间拆成 ('copy'|'encode', 起点, 帧数, 时长) 片段:
+    区间内完整的 GOP 直接流复制，只有两端不完整的 GOP 需要重编码。
+    """
+    parts = []
+    frame_step = float(np.median(np.diff(pts))) if len(pts) > 1 else 0.04
+    def add(kind, start, end):
+        # 帧数按 [start, end) 内的帧时间点统计，为 0 的片段 (不足一帧) 直接跳过
+        first, stop = np.searchsorted(pts, [start, end], side='left')
+        if stop <= first:
+            return 0.0
+        # 时长取到下一帧的时间点，拼接时各片段首尾正好相接
+        next_pts = pts[stop] if stop < len(pts) else pts[-1] + frame_step
+        duration = float(next_pts - pts[first])
+        parts.append((kind, start, int(stop - first), duration))
+        return duration
+
+    # 每个区间按帧取整后都会比音频略长或略短，累计偏差从下一个区间的终点扣回，音画误差始终不超过一帧
+    drift = 0.0
+    for start, end in segments:
+        target_end = max(start, end - drift)
+        first = int(np.searchsorted(keyframes, start, side='left'))
+        last = int(np.searchsorted(keyframes, target_end, side='right')) - 1
+        if first >= last:
+            # 区间内不足一个完整 GOP，整段重编码
+            taken = add('encode', start, target_end)
+        else:
+            taken = (add('encode', start, keyframes[first]) +
+                     add('copy', keyframes[first], keyframes[last]) +
+                     add('encode', keyframes[last], target_end))
+        drift += taken - (end - start)
+    return parts
+
+def smart_cut_video(input_video, segments, output_path, ctx):
+    """
+    智能剪切: 区间内部的 GOP 流复制，只重编码边缘的不完整 GOP，再无损拼接。
+    各片段的关键帧前都重复写入参数集 (SPS/PPS)，重编码与复制的片段可以直接 concat。
+    """
+    stream = probe_video_stream(input_video, ctx)
+    encoder, bsf = SMART_CUT_CODECS.get(stream.get('codec_name'), (None, None))
+    if encoder is None or encoder not in get_ffmpeg_capabilities()['encoders']:
+        raise RuntimeError(f"不支持智能剪切的视频编码: {stream.get('codec_name')}")
+    pts, keyframes = probe_video_packets(input_video, ctx)
+    if not len(keyframes):
+        raise RuntimeError("未找到关键帧")
+
+    parts = plan_smart_cut(segments, pts, keyframes)
+    if not parts:
+        raise RuntimeError("没有可保留的视频帧")
+    copied = sum(1 for part in parts if part[0] == 'copy')
+    print(f"🎬 智能剪切: {len(segments)} 个区间 → {copied} 段流复制, {len(parts) - copied} 段边缘重编码")
+
+    def run_part(i):
+        kind, start, frames, _ = parts[i]
+        part_path = ctx.path(f"smart_{i:05d}.mkv")
+        if kind == 'copy':
+            codec = ["-c:v", "copy"]
+        else:
+            codec = ["-c:v", encoder, "-preset", "faster", "-crf", str(SMART_CUT_CRF),
+                     "-pix_fmt", stream.get('pix_fmt') or "yuv420p"]
+        # 起点是关键帧时输入端 seek 正好落在该关键帧上；按帧数截止，避免按时长截断的误差
+        safe_ffmpeg_run(["ffmpeg", "-y", "-v", "error", "-ss", f"{start:.6f}", "-i", input_video,
+                         "-map", "0:v:0", "-an", "-sn", "-dn", *codec,
+                         "-frames:v", str(frames), "-bsf:v", bsf, part_path], ctx=ctx)
+        return part_path
+
+    with ThreadPoolExecutor(max_workers=ctx.max_workers) as executor:
+        part_paths = list(tqdm(executor.map(run_part, range(len(parts))), total=len(parts),
+                               desc="🎬 智能剪切", unit="part"))
+
+    # 显式写出每段时长，不依赖容器记录的起始时间 (B 帧会让首帧时间点不为 0)
+    part_list = ctx.path("smart_parts.txt")
+    with open(part_list, 'w', encoding='utf-8') as f:
+        for part_path, part in zip(part_paths, parts):
+            f.write(f"file '{part_path}'\nduration {part[3]:.6f}\n")
+    safe_ffmpeg_run(["ffmpeg", "-y", "-v", "error", "-f", "concat", "-safe", "0", "-i", part_list,
+                     "-map", "0:v", "-c", "copy", output_path], ctx=ctx)
+
+def select_expression(segments):
+    """
+    把有序、互不重叠的区间编译成二分查找形式的 select 表达式，
+    每帧只需比较 O(log n) 次，区间数再多表达式深度也很浅。
+    """
+    def build(lo, hi):
+        if hi - lo == 1:
+            start, end = segments[lo]
+            return f"gte(t,{start:.6f})*lt(t,{end:.6f})"
+        mid = (lo + hi) // 2
+        return f"if(lt(t,{segments[mid][0]:.6f}),{build(lo, mid)},{build(mid, hi)})"
+    return build(0, len(segments))
+
+def video_select_graph(segments):
+    """单个 select 过滤器保留全部区间，输出标签为 [outv]"""
+    return f"[0:v]select='{select_expression(segments)}',setpts=N/FRAME_RATE/TB[outv]"
+
+def audio_trim_graph(segments, fanin=FILTER_CONCAT_FANIN):
+    """
+    按时间分层的 asplit/atrim 树: 每层先把音频粗裁到子组覆盖的时间跨度，叶子再精确 atrim (采样级)，
+    最后按同样的层级 concat。每帧只流经覆盖它的分支，几千个区间也只需一次解码。
+    segments 需按时间排序且互不重叠，返回 (过滤图文本, 输出标签)。
+    """
+    lines, node_ids = [], iter(range(len(segments)))
+
+    def build(label, lo, hi):
+        if hi - lo == 1:
+            start, end = segments[lo]
+            lines.append(f"[{label}]atrim=start={start:.6f}:end={end:.6f},asetpts=PTS-STARTPTS[a{lo}]")
+            return f"a{lo}"
+        n = next(node_ids)
+        step = -(-(hi - lo) // fanin)
+        groups = [(j, min(j + step, hi)) for j in range(lo, hi, step)]
+        lines.append(f"[{label}]asplit={len(groups)}" + "".join(f"[s{n}_{k}]" for k in range(len(groups))))
+        outputs = []
+        for k, (group_lo, group_hi) in enumerate(groups):
+            branch = f"s{n}_{k}"
+            if group_hi - group_lo > 1:
+                # 不重置时间戳，下层仍按原始时间裁剪
+                lines.append(f"[{branch}]atrim=start={segments[group_lo][0]:.6f}:"
+                             f"end={segments[group_hi - 1][1]:.6f}[t{n}_{k}]")
+                branch = f"t{n}_{k}"
+            outputs.append(build(branch, group_lo, group_hi))
+        lines.append("".join(f"[{name}]" for name in outputs) + f"concat=n={len(outputs)}:v=0:a=1[c{n}]")
+        return f"c{n}"
+
+    output = build("0:a", 0, len(segments))
+    return ";\n".join(lines), output
+
+def write_filter_script(path, graph):
+    """过滤图写入文件交给 -filter_complex_script，不受命令行长度限制"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(graph)
+    return path
+
+def _cut_video_filter(input_video, segments, output_path, ctx):
+    """单次 filter_complex 重编码全部保留区间，过滤图通过脚本文件传入"""
+    script = write_filter_script(ctx.path("filter_complex.txt"), video_select_graph(segments))
+    cmd = [
+        "ffmpeg", "-y", "-i", input_video,
+        "-filter_complex_script", script,
+        "-map", "[outv]", "-c:v", "libx264", "-preset", "faster",
+        output_path
+    ]
+    safe_ffmpeg_run(cmd, timeout=1800, ctx=ctx)  # 增加超时时间到30分钟
+
+def _cut_video_chunked(input_video, segments, output_path, ctx):
+    """
+    把保留区间分块重编码后再拼接。每个区间作为一路单独 seek 的输入，
+    只解码保留的部分，各块在有界线程池中并发处理。
+    """
+    # 将视频分成较大的块进行处理
+    chunk_size = min(10, max(1, len(segments) // 5))
+    chunks = [segments[i:i+chunk_size] for i in range(0, len(segments), chunk_size)]
+    print(f"🧩 将视频分为 {len(chunks)} 个块进行处理")
+
+    def encode_chunk(chunk_idx):
+        chunk = chunks[chunk_idx]
+        chunk_video = ctx.path(f"chunk_{chunk_idx}.mp4")
+        # 输入端 -ss/-t: 从最近的关键帧开始解码，只到区间终点为止
+        inputs = []
+        for start, end in chunk:
+            inputs += ["-ss", f"{start:.6f}", "-t", f"{end - start:.6f}", "-i", input_video]
+        filter_str = "".join(f"[{i}:v]" for i in range(len(chunk))) + f"concat=n={len(chunk)}:v=1:a=0[outv]"
+        cmd = [
+            "ffmpeg", "-y", *inputs,
+            "-filter_complex", filter_str,
+            "-map", "[outv]", "-c:v", "libx264", "-preset", "faster",
+            chunk_video
+        ]
+        safe_ffmpeg_run(cmd, timeout=1200, ctx=ctx)  # 每个块20分钟超时
+        return chunk_video
+
+    with ThreadPoolExecutor(max_workers=ctx.max_workers) as executor:
+        chunk_videos = list(tqdm(executor.map(encode_chunk, range(len(chunks))), total=len(chunks),
+                                 desc="🧩 分块处理", unit="chunk"))
+
+    # 合并所有块
+    chunk_list = ctx.path("chunk_list.txt")
+    with open(chunk_list, 'w') as f:
+        for chunk_video in chunk_videos:
+            f.write(f"file '{chunk_video}'\n")
+    safe_ffmpeg_run([
+        "ffmpeg", "-y", "-f", "concat", "-safe", "0",
+        "-i", chunk_list, "-c", "copy", output_path
+    ], ctx=ctx)
+
+def cut_video_segments(input_video, segments, output_path, ctx, video_mode="smart"):
+    """
+    依次尝试智能剪切、单次 filter_complex、分块重编码，生成只含保留区间的无音频视频。
+    全部失败时返回 False，由调用方回退到整段截取。
+    """
+    if not segments:
+        return False
+    print(f"🎬 视频保留区间: {len(segments)} 个")
+    if video_mode == "smart":
+        try:
+            smart_cut_video(input_video, segments, output_path, ctx)
+            return True
+        except Exception as e:
+            print(f"⚠️ 智能剪切失败: {e}")
+            print("改为重编码...")
+
+    try:
+        # 使用filter_complex一次性处理视频，片段数量不再受限
+        _cut_video_filter(input_video, segments, output_path, ctx)
+        return True
+    except Exception as e:
+        print(f"⚠️ 高级视频处理失败: {e}")
+        print("尝试备用方法...")
+
+    # 如果上面的方法失败，尝试使用分段处理
+    try:
+        _cut_video_chunked(input_video, segments, output_path, ctx)
+        return True
+    except Exception as e:
+        print(f"⚠️ 分块视频处理失败: {e}")
+        return False
 
 def get_audio_duration(audio_path):
     """
@@ -245,7 +2313,7 @@ def get_audio_duration(audio_path):
     result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
     return float(result.stdout.strip())
 
-def convert_audio_to_video(input_audio_path, output_video_path, resolution="1280x720", color="black"):
+def convert_audio_to_video(input_audio_path, output_video_path, resolution="1280x720", color="black", ctx=None):
     """
     使用 FFmpeg 将音频转换为带黑色背景的视频，背景时长 = 音频时长
     """
@@ -264,35 +2332,58 @@ def convert_audio_to_video(input_audio_path, output_video_path, resolution="1280
         output_video_path
     ]
     print(f"🎧 自动将音频转换为视频: {output_video_path}")
-    safe_ffmpeg_run(cmd)
+    safe_ffmpeg_run(cmd, ctx=ctx)
 
 def main(input_audio_path, input_srt_path, output_audio_path, output_srt_path,
-         filter_file_path, start_index, end_index, output_format="mp3", quality="high"):
+         filter_file_path, start_index, end_index, output_format="mp3", quality="high", ctx=None,
+         engine="stream", video_mode="smart", use_cache=False, incremental=False,
+         report_path=None, trace_path=None, progress_callback=None, snap_tolerance=0.0,
+         splice=None, splice_seconds=SPLICE_SECONDS, vad_margin_db=VAD_MARGIN_DB, vad_min_silence=VAD_MIN_SILENCE):
+    """
+    input_srt_path 为空时用语音检测 (detect_speech) 生成保留区间，只剪掉静音与空白；
+    end_index 为 None 时处理到最后一条字幕；
+    use_cache 为 True 时读写持久缓存 (输出结果与整段解码的 PCM，流式引擎在剪辑的同时写入，不先整段解码)；
+    report_path/trace_path 指定时写出各阶段的性能报告 (JSON) 与 Chrome trace；
+    progress_callback(step, total, description) 在每个步骤开始时调用；
+    snap_tolerance > 0 时把切点对齐到该范围 (秒) 内的安静处；
+    splice 为 crossfade/zerocross 时在拼接处交叉淡化或对齐过零点 (numpy 引擎，不增加 ffmpeg 处理)
+    """
     print("🚀 AutoCut Core v2.4.4 启动")
     print("🖥️ 系统信息:", get_system_info())
 
+    # 未指定任务环境时自建一个，结束后连同临时目录一起释放
+    owns_ctx = ctx is None
+    ctx = ctx or JobContext(quality=quality, cache=get_media_cache() if use_cache else None)
+    profiler = ctx.profiler
+    if progress_callback:
+        profiler.progress_callback = progress_callback
     try:
-        kill_ffmpeg_processes()
-        clean_temp_files()
-        os.makedirs(TEMP_DIR, exist_ok=True)
-
         input_video_path = None
         if input_audio_path.lower().endswith('.mp4'):
             input_video_path = input_audio_path
-            input_audio_path = os.path.join(TEMP_DIR, "extracted_audio.mp3")
-            extract_audio_from_mp4(input_video_path, input_audio_path)
+            # 两种引擎都直接从视频中解码音频，无需先转出一份 MP3
 
-        if not all(os.path.exists(f) for f in [input_audio_path, input_srt_path]):
-            missing = [f for f in [input_audio_path, input_srt_path] if not os.path.exists(f)]
+        required = [f for f in [input_audio_path, input_srt_path] if f]
+        if not all(os.path.exists(f) for f in required):
+            missing = [f for f in required if not os.path.exists(f)]
             raise FileNotFoundError(f"文件不存在: {missing}")
 
         input_audio_path = get_short_path(input_audio_path)
-        input_srt_path = get_short_path(input_srt_path)
+        input_srt_path = input_srt_path and get_short_path(input_srt_path)
         output_audio_path = get_short_path(output_audio_path)
         output_srt_path = get_short_path(output_srt_path)
 
-        subtitles = parse_srt(input_srt_path)
+        if input_srt_path:
+            profiler.stage('parse')
+            subtitles = parse_srt(input_srt_path)
+        else:
+            profiler.stage('vad')
+            subtitles = detect_speech(input_audio_path, ctx, margin_db=vad_margin_db, min_silence=vad_min_silence)
+            if not len(subtitles):
+                raise ValueError("未检测到有声片段")
         filter_texts = read_filter_file(filter_file_path)
+        if end_index is None:
+            end_index = len(subtitles)
 
         if not (1 <= start_index <= end_index <= len(subtitles)):
             raise ValueError(f"无效范围 (总字幕: {len(subtitles)}, 请求: {start_index}-{end_index})")
@@ -303,173 +2394,198 @@ def main(input_audio_path, input_srt_path, output_audio_path, output_srt_path,
         print(f"⏱️ 处理区间: {clip_start_time:.2f}s → {clip_end_time:.2f}s (时长: {clip_duration:.2f}s)")
 
         temp_files = {
-            'clip_mp3': os.path.join(TEMP_DIR, "clip.mp3"),
-            'clip_wav': os.path.join(TEMP_DIR, "clip.wav"),
-            'final_wav': os.path.join(TEMP_DIR, "final.wav")
+            'clip_wav': ctx.path("clip.wav"),
+            'cut_wav': ctx.path("cut.wav"),
+            'final_wav': ctx.path("final.wav")
         }
 
-        print("\n🔪 步骤1/4: 提取原始音频...")
-        extract_clip_mp3(input_audio_path, clip_start_time, clip_duration, temp_files['clip_mp3'])
-        convert_mp3_to_wav(temp_files['clip_mp3'], temp_files['clip_wav'])
+        # 整个区间一次批量匹配过滤规则
+        window = subtitles[start_index - 1:end_index]
+        filtered = filter_texts.mask(window.contents())
+        adjusted_subtitles = [subtitle for subtitle, hit in zip(window, filtered.tolist()) if not hit]
+        print(f"📋 有效字幕: {len(adjusted_subtitles)} (过滤 {int(filtered.sum())} 条)")
 
-        adjusted_subtitles = [
-            (i, start, end, content)
-            for i, start, end, content in subtitles[start_index - 1:end_index]
-            if content.strip() not in filter_texts
-        ]
-        print(f"📋 有效字幕: {len(adjusted_subtitles)} (过滤 {len(subtitles[start_index-1:end_index]) - len(adjusted_subtitles)} 条)")
-
-        print("\n✂️ 步骤2/4: 切割音频...")
-        batch_wavs = []
-        for i in range(0, len(adjusted_subtitles), BATCH_SIZE):
-            batch = adjusted_subtitles[i:i + BATCH_SIZE]
-            batch_wav = os.path.join(TEMP_DIR, f"batch_{i//BATCH_SIZE}.wav")
-            cut_audio_segments_with_numpy_parallel(temp_files['clip_wav'], batch, batch_wav, clip_start_time)
-            batch_wavs.append(batch_wav)
-
-        print("\n🧩 步骤3/4: 合并输出...")
-        if output_format == "mp4":
-            temp_audio = output_audio_path
-            temp_audio_mp3 = os.path.join(TEMP_DIR, "temp_audio.mp3")
-            
-            # 处理音频部分
-            parallel_compress_segments(batch_wavs, temp_audio_mp3, "mp3", quality)
-            
-            if input_video_path:
-                # 创建一个过滤器复杂表达式来一次性处理视频
-                filter_file = os.path.join(TEMP_DIR, "filter_complex.txt")
-                
-                # 计算需要保留的片段
-                segments = []
-                for _, start, end, content in adjusted_subtitles:
-                    segments.append((start, end))
-                
-                # 合并连续或重叠的片段以减少片段数量
-                merged_segments = []
-                if segments:
-                    current_start, current_end = segments[0]
-                    for start, end in segments[1:]:
-                        # 如果当前片段与下一片段的间隔小于0.5秒，则合并它们
-                        if start - current_end <= 0.5:
-                            current_end = end
-                        else:
-                            merged_segments.append((current_start, current_end))
-                            current_start, current_end = start, end
-                    merged_segments.append((current_start, current_end))
-                
-                print(f"🎬 优化视频片段: 从 {len(segments)} 个减少到 {len(merged_segments)} 个")
-                
-                # 创建过滤器复杂表达式
-                if len(merged_segments) <= 50:  # FFmpeg对filter_complex的长度有限制
-                    filter_parts = []
-                    for i, (start, end) in enumerate(merged_segments):
-                        duration = end - start
-                        filter_parts.append(f"[0:v]trim=start={start}:end={end},setpts=PTS-STARTPTS[v{i}];")
-                    
-                    # 连接所有片段
-                    filter_str = "".join(filter_parts)
-                    if merged_segments:
-                        filter_str += "".join(f"[v{i}]" for i in range(len(merged_segments))) + f"concat=n={len(merged_segments)}:v=1:a=0[outv]"
-                        
-                        try:
-                            # 使用filter_complex一次性处理视频
-                            merged_video_no_audio = os.path.join(TEMP_DIR, "merged_video_no_audio.mp4")
-                            cmd = [
-                                "ffmpeg", "-y", "-i", input_video_path,
-                                "-filter_complex", filter_str,
-                                "-map", "[outv]", "-c:v", "libx264", "-preset", "faster",
-                                merged_video_no_audio
-                            ]
-                            safe_ffmpeg_run(cmd, timeout=1800)  # 增加超时时间到30分钟
-                            
-                            # 合并处理好的音频和视频
-                            generate_mp4(temp_audio_mp3, merged_video_no_audio, temp_audio)
-                            output_audio_path = temp_audio
-                        except Exception as e:
-                            print(f"⚠️ 高级视频处理失败: {e}")
-                            print("尝试备用方法...")
-                
-                # 如果片段太多或上面的方法失败，尝试使用分段处理
-                try:
-                    # 将视频分成较大的块进行处理
-                    chunk_size = min(10, max(1, len(merged_segments) // 5))
-                    chunks = [merged_segments[i:i+chunk_size] for i in range(0, len(merged_segments), chunk_size)]
-                    print(f"🧩 将视频分为 {len(chunks)} 个块进行处理")
-                    
-                    chunk_videos = []
-                    for chunk_idx, chunk in enumerate(chunks):
-                        chunk_video = os.path.join(TEMP_DIR, f"chunk_{chunk_idx}.mp4")
-                        chunk_videos.append(chunk_video)
-                        
-                        # 为每个块创建过滤器
-                        filter_parts = []
-                        for i, (start, end) in enumerate(chunk):
-                            duration = end - start
-                            filter_parts.append(f"[0:v]trim=start={start}:end={end},setpts=PTS-STARTPTS[v{i}];")
-                        
-                        filter_str = "".join(filter_parts)
-                        if chunk:
-                            filter_str += "".join(f"[v{i}]" for i in range(len(chunk))) + f"concat=n={len(chunk)}:v=1:a=0[outv]"
-                            
-                            cmd = [
-                                "ffmpeg", "-y", "-i", input_video_path,
-                                "-filter_complex", filter_str,
-                                "-map", "[outv]", "-c:v", "libx264", "-preset", "faster",
-                                chunk_video
-                            ]
-                            safe_ffmpeg_run(cmd, timeout=1200)  # 每个块20分钟超时
-                    
-                    # 合并所有块
-                    chunk_list = os.path.join(TEMP_DIR, "chunk_list.txt")
-                    with open(chunk_list, 'w') as f:
-                        for chunk_video in chunk_videos:
-                            f.write(f"file '{chunk_video}'\n")
-                    
-                    merged_video_no_audio = os.path.join(TEMP_DIR, "merged_video_no_audio.mp4")
-                    safe_ffmpeg_run([
-                        "ffmpeg", "-y", "-f", "concat", "-safe", "0",
-                        "-i", chunk_list, "-c", "copy", merged_video_no_audio
-                    ])
-                    
-                    # 合并处理好的音频和视频
-                    generate_mp4(temp_audio_mp3, merged_video_no_audio, temp_audio)
-                except Exception as e:
-                    print(f"⚠️ 分块视频处理失败: {e}")
-                    print("回退到基本方法...")
-                    # 如果上述方法都失败，回退到基本方法
-                    clipped_video_path = os.path.join(TEMP_DIR, "clipped_video.mp4")
-                    extract_clip_mp4(input_video_path, clip_start_time, clip_duration, clipped_video_path)
-                    generate_mp4(temp_audio_mp3, clipped_video_path, temp_audio)
-            else:
-                # 如果原始输入是音频，自动生成黑色背景的视频
-                convert_audio_to_video(temp_audio_mp3, temp_audio)
-            
-            output_audio_path = temp_audio
+        # 相同源文件、保留区间与输出参数的结果直接从缓存取出 (增量重剪自带分块复用，不走输出缓存)
+        incremental = incremental and output_format in RECUT_FORMATS
+        if snap_tolerance and engine == "stream" and not incremental:
+            print("🎯 切点对齐需要解码后的PCM，改用 numpy 引擎")
+            engine = "numpy"
+        if splice and engine == "stream":
+            print("🎚️ 拼接处理在解码后的PCM上完成，改用 numpy 引擎")
+            engine = "numpy"
+        if splice and incremental:
+            print("⚠️ 增量重剪按分块独立编码，不做拼接处理")
+            splice = None
+        # 生成新字幕所用的字幕、剪辑起点与帧率须与切割音频时一致
+        srt_subtitles, srt_clip_start, srt_framerate, srt_retimed = \
+            adjusted_subtitles, clip_start_time, STREAM_SAMPLE_RATE, False
+        output_key, cached_output, cached_srt = None, None, None
+        if ctx.cache is not None and not incremental:
+            output_key = cache_key('output', source_fingerprint(input_audio_path),
+                                   [(start, end) for _, start, end, _ in adjusted_subtitles],
+                                   clip_start_time, output_format, quality,
+                                   video_mode if output_format == "mp4" else None, snap_tolerance,
+                                   *([splice, splice_seconds] if splice else []))
+            cached_output = ctx.cache.get(output_key, os.path.splitext(output_audio_path)[1])
+            cached_srt = cached_output and ctx.cache.get(output_key, '.srt')
+
+        if cached_output:
+            print("\n♻️ 命中输出缓存，跳过解码、切割与编码")
+            profiler.stage('cache')
+            shutil.copyfile(cached_output, output_audio_path)
         else:
-            if output_format == "wav":
-                with wave.open(temp_files['final_wav'], 'wb') as out_wav:
-                    with wave.open(batch_wavs[0], 'rb') as in_wav:
-                        out_wav.setparams(in_wav.getparams())
-                    for bw in batch_wavs:
-                        with wave.open(bw, 'rb') as in_wav:
-                            out_wav.writeframes(in_wav.readframes(in_wav.getnframes()))
-                shutil.move(temp_files['final_wav'], output_audio_path)
+            temp_audio_mp3 = ctx.path("temp_audio.mp3")
+            if incremental:
+                profiler.step(1, "🔪", "提取原始音频")
+                profiler.stage('decode')
+                if probe_audio(input_audio_path, ctx).get('codec', '').startswith('pcm_'):
+                    source_wav = input_audio_path
+                else:
+                    source_wav = (cached_source_pcm(input_audio_path, ctx) or
+                                  decode_source_pcm(input_audio_path, temp_files['clip_wav'], ctx))
+                profiler.step(2, "✂️", "增量切割并编码")
+                cut_subtitles = adjusted_subtitles
+                if snap_tolerance:
+                    profiler.stage('refine')
+                    layout, audio_np = open_wav_frames(source_wav)
+                    cut_subtitles = refine_cut_points(audio_np, layout, adjusted_subtitles, 0.0, snap_tolerance,
+                                                      ctx.memory)
+                profiler.stage('cut', fused='encode')
+                srt_subtitles = incremental_cut(source_wav, cut_subtitles, output_audio_path, output_format,
+                                                quality, ctx, source_id=source_fingerprint(input_audio_path))
+                srt_retimed = True
+            elif engine == "stream":
+                # 解码、切割、编码在同一条管道中完成，不产生中间 WAV
+                profiler.step(1, "🔪", "解码音频流")
+                profiler.stage('decode')
+                # 缓存中已有整段 PCM 时从中读取；没有时直接流式解码源文件，不为缓存先整段解码，
+                # 启用了缓存的压缩格式输入在流式剪辑的同时把解码结果写入缓存，下次换区间重跑时不再解码
+                stream_input = cached_source_pcm(input_audio_path, ctx, decode=False)
+                tee_wav = None
+                if (stream_input is None and ctx.cache is not None
+                        and not probe_audio(input_audio_path, ctx).get('codec', '').startswith('pcm_')):
+                    tee_wav = ctx.path("source.wav")
+                profiler.step(2, "✂️", "流式切割并编码")
+                profiler.stage('cut', fused='decode,encode')
+                stream_output = temp_audio_mp3 if output_format == "mp4" else output_audio_path
+                if stream_cut_audio(stream_input or input_audio_path, adjusted_subtitles, clip_start_time,
+                                    clip_duration, stream_output, "mp3" if output_format == "mp4" else output_format,
+                                    quality, ctx, tee_wav=tee_wav):
+                    ctx.cache.put(source_pcm_key(input_audio_path), '.wav', tee_wav, move=True)
             else:
-                parallel_compress_segments(batch_wavs, output_audio_path, output_format, quality)
+                profiler.step(1, "🔪", "提取原始音频")
+                profiler.stage('decode')
+                source_wav, cut_subtitles = None, adjusted_subtitles
+                try:
+                    if probe_audio(input_audio_path, ctx).get('codec', '').startswith('pcm_'):
+                        # PCM 母带直接内存映射整个文件，不做任何转码
+                        read_wav_layout(input_audio_path)
+                        source_wav = input_audio_path
+                        print("✅ 输入为PCM WAV，直接映射，跳过转码")
+                except (ValueError, RuntimeError, struct.error, OSError) as e:
+                    print(f"⚠️ 无法直接映射输入音频，改为解码: {e}")
+                if source_wav is None:
+                    # 启用了缓存时整段解码一次放入缓存并直接映射，之后换区间重跑不再解码
+                    source_wav = cached_source_pcm(input_audio_path, ctx)
+                if source_wav is None:
+                    # 压缩格式只解码保留字幕覆盖的时间窗口
+                    source_wav = temp_files['clip_wav']
+                    cut_subtitles = decode_kept_windows(input_audio_path, adjusted_subtitles, source_wav, ctx,
+                                                        padding=max(WINDOW_PADDING, snap_tolerance))
+
+                profiler.step(2, "✂️", "切割音频")
+                layout, audio_np = open_wav_frames(source_wav)
+                if snap_tolerance:
+                    profiler.stage('refine')
+                    cut_subtitles = refine_cut_points(audio_np, layout, cut_subtitles, 0.0,
+                                                      snap_tolerance, ctx.memory)
+                # 新字幕按切割所用的字幕 (窗口或对齐后的时间) 与采样率生成，与音频逐帧对应
+                srt_subtitles, srt_clip_start, srt_framerate = cut_subtitles, 0.0, layout.sample_rate
+                profiler.stage('cut')
+                audio_target = temp_audio_mp3 if output_format == "mp4" else output_audio_path
+                audio_format = "mp3" if output_format == "mp4" else output_format
+                starts, ends = compile_keep_ranges(cut_subtitles, 0.0, layout.sample_rate)
+                plan = None
+                if splice:
+                    starts, ends, plan = plan_splices(audio_np, starts, ends, layout.sample_rate, splice,
+                                                      splice_seconds)
+                kept_frames = int((np.minimum(ends, layout.frames) - np.minimum(starts, layout.frames)).sum())
+                parallel_mp3 = use_parallel_mp3(audio_format, kept_frames, layout.sample_rate, ctx)
+
+                # 各批次的 PCM 直接送入同一个编码进程，不再逐批编码后拼接
+                if audio_format == "wav":
+                    sink = WavWriter(temp_files['final_wav'], layout)
+                elif parallel_mp3:
+                    sink = WavWriter(temp_files['cut_wav'], layout)
+                else:
+                    sink = PcmEncoder(audio_target, layout, audio_format, quality, ctx)
+                    profiler.current['fused'] = "encode"
+                # 批次按样本字节数划分并受内存预算约束，batch_size 只限制每批的区间数
+                with sink:
+                    for batch in tqdm(iter_cut_batches(audio_np, starts, ends, ctx.memory, ctx.batch_size, plan),
+                                      desc="⏱️ 切割中", unit="batch"):
+                        sink.write(batch)
+
+                profiler.stage('encode')
+                if parallel_mp3:
+                    encode_mp3_gapless(temp_files['cut_wav'], audio_target, quality, ctx)
+                elif audio_format == "wav":
+                    shutil.move(temp_files['final_wav'], audio_target)
 
-        print("\n📝 步骤4/4: 生成字幕...")
-        generate_new_srt(subtitles, output_srt_path, filter_texts, start_index, end_index, adjusted_subtitles)
+            profiler.step(3, "🧩", "合并输出")
+            profiler.stage('mux')
+            if output_format == "mp4":
+                temp_audio = output_audio_path
+            
+                if input_video_path:
+                    # 视频片段与音频使用同一组保留区间，只合并重叠或相接的字幕，保证音画同步
+                    segments = video_keep_segments(adjusted_subtitles)
+                    merged_video_no_audio = ctx.path("merged_video_no_audio.mp4")
+                    if cut_video_segments(input_video_path, segments, merged_video_no_audio, ctx, video_mode):
+                        # 合并处理好的音频和视频
+                        generate_mp4(temp_audio_mp3, merged_video_no_audio, temp_audio, ctx=ctx)
+                    else:
+                        print("回退到基本方法...")
+                        # 如果上述方法都失败，回退到基本方法
+                        clipped_video_path = ctx.path("clipped_video.mp4")
+                        extract_clip_mp4(input_video_path, clip_start_time, clip_duration, clipped_video_path, ctx=ctx)
+                        generate_mp4(temp_audio_mp3, clipped_video_path, temp_audio, ctx=ctx)
+                else:
+                    # 如果原始输入是音频，自动生成黑色背景的视频
+                    convert_audio_to_video(temp_audio_mp3, temp_audio, ctx=ctx)
+            
+                output_audio_path = temp_audio
+
+            if output_key:
+                ctx.cache.put(output_key, os.path.splitext(output_audio_path)[1], output_audio_path)
+
+        profiler.step(4, "📝", "生成字幕")
+        profiler.stage('srt')
+        if cached_srt:
+            # 输出缓存中的字幕与缓存的音频出自同一次切割 (如切点对齐后的时间)
+            shutil.copyfile(cached_srt, output_srt_path)
+        else:
+            generate_new_srt(subtitles, output_srt_path, filter_texts, start_index, end_index, srt_subtitles,
+                             srt_clip_start, srt_framerate, srt_retimed)
+            if output_key:
+                ctx.cache.put(output_key, '.srt', output_srt_path)
+        profiler.finish()
 
-        orig_size = os.path.getsize(temp_files['clip_mp3']) / 1024**2
+        orig_size = os.path.getsize(input_audio_path) / 1024**2
         final_size = os.path.getsize(output_audio_path) / 1024**2
         print(f"\n✅ 处理完成!\n"
               f"  输出文件: {output_audio_path} ({final_size:.2f}MB)\n"
               f"  字幕文件: {output_srt_path}\n"
               f"  压缩比: {final_size/orig_size*100:.1f}% (原始: {orig_size:.2f}MB)")
+        profiler.meta.update(input=input_audio_path, output=output_audio_path, output_format=output_format,
+                             engine="incremental" if incremental else engine, cached=bool(cached_output),
+                             subtitles=len(subtitles), kept=len(adjusted_subtitles),
+                             input_bytes=os.path.getsize(input_audio_path),
+                             output_bytes=os.path.getsize(output_audio_path))
 
     except MemoryError as e:
         print(f"\n❌ 内存不足: {str(e)}")
-        print("💡 建议: 1. 减少处理区间 2. 关闭其他程序 3. 使用更小的BATCH_SIZE")
+        print("💡 建议: 1. 减少处理区间 2. 关闭其他程序 3. 调整 --memory-budget")
         raise
     except RuntimeError as e:
         print(f"\n❌ FFmpeg处理失败: {str(e)}")
@@ -479,8 +2595,16 @@ def main(input_audio_path, input_srt_path, output_audio_path, output_srt_path,
         print(f"\n❌ 未知错误: {str(e)}")
         raise
     finally:
-        clean_temp_files()
-        print("🧹 临时文件已清理")
+        # 失败的运行同样写出报告，便于定位卡在哪个阶段
+        if report_path:
+            profiler.write_report(report_path)
+            print(f"📊 性能报告: {report_path}")
+        if trace_path:
+            profiler.write_chrome_trace(trace_path)
+            print(f"📊 Chrome trace: {trace_path}")
+        if owns_ctx:
+            ctx.close()
+            print("🧹 临时文件已清理")
 
 if __name__ == "__main__":
     import argparse
@@ -489,21 +2613,46 @@ if __name__ == "__main__":
         formatter_class=argparse.ArgumentDefaultsHelpFormatter
     )
     parser.add_argument('--input', required=True, help='输入音频路径(MP3/WAV)')
-    parser.add_argument('--srt', required=True, help='字幕文件路径(SRT格式)')
+    parser.add_argument('--srt', default=None, help='字幕文件路径(SRT格式)，不指定时用语音检测只剪掉静音')
     parser.add_argument('--output', required=True, help='输出音频路径')
     parser.add_argument('--output-srt', required=True, help='输出字幕路径')
     parser.add_argument('--filter', default="", help='过滤文本文件路径')
-    parser.add_argument('--start', type=int, required=True, help='起始字幕序号(从1开始)')
-    parser.add_argument('--end', type=int, required=True, help='结束字幕序号')
+    parser.add_argument('--start', type=int, default=1, help='起始字幕序号(从1开始)')
+    parser.add_argument('--end', type=int, default=None, help='结束字幕序号 (默认到最后一条)')
     parser.add_argument('--format', choices=['mp3', 'm4a', 'wav'], 
                        default='mp3', help='输出音频格式')
     parser.add_argument('--quality', choices=['high', 'medium', 'low'], 
                        default='high', help='输出音质(仅MP3有效)')
     parser.add_argument('--batch-size', type=int, default=500,
                        help='处理批次大小(内存不足时减小此值)')
+    parser.add_argument('--memory-budget', default=None,
+                       help='内存预算, 如 512M、2G (默认取可用内存的一半)；切割批次与并发任务都受其约束')
+    parser.add_argument('--engine', choices=['stream', 'numpy'], default='stream',
+                       help='剪辑引擎: stream 单趟管道流式处理, numpy 先解码为WAV再分批切割')
+    parser.add_argument('--video-mode', choices=['smart', 'reencode'], default='smart',
+                       help='MP4视频剪切方式: smart 关键帧内流复制仅重编码边缘, reencode 全部重编码')
+    parser.add_argument('--incremental', action='store_true',
+                       help='增量重剪(仅MP3/WAV): 分块与清单保存在输出文件旁，重跑时只重新编码有变化的分块')
+    parser.add_argument('--cache', action='store_true',
+                       help='读写持久缓存 (位置由 AUTOCUT_CACHE_DIR 指定, 大小上限由 AUTOCUT_CACHE_BYTES 指定)')
+    parser.add_argument('--snap', type=float, default=0.0,
+                       help='切点对齐范围(秒), 如 0.3: 把每个切点移到该范围内最近的安静处 (使用 numpy 引擎)')
+    parser.add_argument('--splice', choices=['none', *SPLICE_MODES], default='none',
+                       help='拼接处理: crossfade 等功率交叉淡化, zerocross 对齐过零点 (使用 numpy 引擎)')
+    parser.add_argument('--splice-ms', type=float, default=SPLICE_SECONDS * 1000,
+                       help='交叉淡化时长(毫秒)，过零对齐时为查找范围')
+    parser.add_argument('--vad-margin', type=float, default=VAD_MARGIN_DB,
+                       help='语音检测(无字幕时): 比底噪高出多少dB算作有声')
+    parser.add_argument('--min-silence', type=float, default=VAD_MIN_SILENCE,
+                       help='语音检测(无字幕时): 长于此值(秒)的静音才剪掉')
+    parser.add_argument('--report', default=None,
+                       help='性能报告路径(JSON): 各阶段墙钟/CPU时间、读写字节数与ffmpeg子进程资源占用')
+    parser.add_argument('--trace', default=None,
+                       help='Chrome trace 路径, 可在 chrome://tracing 或 Perfetto 中查看')
     
     args = parser.parse_args()
     BATCH_SIZE = max(100, min(args.batch_size, 1000))
+    MEMORY_BUDGET = args.memory_budget or MEMORY_BUDGET
     
     try:
         main(
@@ -515,10 +2664,20 @@ if __name__ == "__main__":
             start_index=args.start,
             end_index=args.end,
             output_format=args.format,
-            quality=args.quality
+            quality=args.quality,
+            engine=args.engine,
+            video_mode=args.video_mode,
+            use_cache=args.cache,
+            incremental=args.incremental,
+            report_path=args.report,
+            trace_path=args.trace,
+            snap_tolerance=args.snap,
+            splice=None if args.splice == 'none' else args.splice,
+            splice_seconds=args.splice_ms / 1000,
+            vad_margin_db=args.vad_margin,
+            vad_min_silence=args.min_silence
         )
     except KeyboardInterrupt:
         print("\n🛑 用户中断操作")
         kill_ffmpeg_processes()
-        clean_temp_files()
         exit(1)
\ No newline at end of file
@@ -5,25 +5,16 @@ import threading
 import sys 
 import json 
 import os 
-import re 
-from autocut_core import main, parse_srt 
+from autocut_core import main, count_subtitle_cues 
  
 class TextRedirector:
-    def __init__(self, widget, status_callback=None):
+    def __init__(self, widget):
         self.widget  = widget 
-        self.status_callback  = status_callback 
-        self.step_pattern  = re.compile(r' 步骤(\d)/4: (.*?)\.\.\.')
  
     def write(self, text):
         self.widget.insert(tk.END,  text)
         self.widget.see(tk.END) 
         self.widget.update_idletasks() 
-        
-        if self.status_callback: 
-            match = self.step_pattern.search(text) 
-            if match:
-                step, description = match.groups() 
-                self.status_callback(f" 步骤 {step}/4 - {description}", int(step)*25)
 
     def flush(self):
         pass
@@ -157,8 +148,8 @@ class AutoCutGUI:
         scrollbar.pack(side="right",  fill="y")
         self.log_text.config(yscrollcommand=scrollbar.set) 
  
-        sys.stdout  = TextRedirector(self.log_text,  self.update_progress_status) 
-        sys.stderr  = TextRedirector(self.log_text,  self.update_progress_status) 
+        sys.stdout  = TextRedirector(self.log_text) 
+        sys.stderr  = TextRedirector(self.log_text) 
  
         # 状态栏 
         self.status_frame  = ttk.Frame(self.root,  relief="sunken", padding=5)
@@ -189,6 +180,10 @@ class AutoCutGUI:
         if progress_value is not None:
             self.progress.config(value=progress_value) 
         self.root.update_idletasks() 
+
+    def report_step(self, step, total, description):
+        """main 的进度回调：按步骤更新状态栏与进度条"""
+        self.update_progress_status(f" 步骤 {step}/{total} - {description}", int(step * 100 / total))
  
     def start_processing(self):
         if self.is_processing: 
@@ -204,14 +199,15 @@ class AutoCutGUI:
         try:
             self.update_progress_status("🔄  初始化处理环境...", 0)
             
-            required = ["input_audio", "input_srt", "output_mp3", "output_srt", "filter_file"]
+            # 输入字幕可以留空，此时用语音检测只剪掉静音
+            required = ["input_audio", "output_mp3", "output_srt", "filter_file"]
             if not all(self.entries[key].get() for key in required):
                 raise ValueError("请填写所有路径字段。")
 
             names = ["输入音频", "输入字幕", "输出音频", "输出字幕", "过滤文本"]
-            for key, name in zip(required, names):
+            for key, name in zip(["input_audio", "input_srt", "output_mp3", "output_srt", "filter_file"], names):
                 path = self.entries[key].get()
-                if key not in ["output_mp3", "output_srt"] and not os.path.exists(path): 
+                if path and key not in ["output_mp3", "output_srt"] and not os.path.exists(path): 
                     raise FileNotFoundError(f"{name}文件不存在: {path}")
 
             start_index = int(self.entries["start_index"].get() or "1")
@@ -231,7 +227,8 @@ class AutoCutGUI:
                 start_index=start_index,
                 end_index=end_index,
                 output_format=self.format_var.get(), 
-                quality=self.quality_var.get() 
+                quality=self.quality_var.get(),
+                progress_callback=self.report_step
             )
 
             self.update_progress_status("✅  处理完成！")
@@ -248,7 +245,9 @@ class AutoCutGUI:
         try:
             if self.entries["end_index"].get().strip(): 
                 return int(self.entries["end_index"].get().strip()) 
-            return len(parse_srt(srt_path))
+            if not srt_path:
+                return None  # 语音检测生成的片段全部处理
+            return count_subtitle_cues(srt_path)
         except Exception as e:
             print(f"获取字幕总数失败: {e}")
             return 999999 
@@ -1,4 +1,5 @@
 import pysubs2
+import numpy as np
 import os
 import sys
 import subprocess
@@ -8,6 +9,12 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import threading
 import time
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from autocut_core import (audio_trim_graph, write_filter_script, JobContext, get_media_cache, cached_source_pcm,
+                          decode_source_pcm, incremental_cut, source_fingerprint, count_subtitle_cues,
+                          FilterMatcher, get_filter_matcher, open_wav_frames, refine_cut_points, RECUT_FORMATS,
+                          DecodeSession, allocate_wav, probe_audio, STREAM_CHUNK_BYTES)
 
 # 常量定义
 SETTINGS_FILE = "subtitle_tool_settings.json"
@@ -19,6 +26,9 @@ DEFAULT_FILTER_WORDS = [
     "这样能听明白吗"
 ]
 
+SEGMENT_RETRIES = 2        # 备用方法中单个片段提取失败或时长不符时的重试次数
+SEGMENT_TOLERANCE = 0.05   # 末尾片段因音频时长估算误差允许短缺的时长(秒)
+
 # 支持的音频格式
 AUDIO_FORMATS = {
     "WAV (无损)": {"ext": "wav", "codec": "pcm_s16le"},
@@ -32,68 +42,270 @@ AUDIO_FORMATS = {
 }
 
 # 核心处理函数
+class CueTable:
+    """
+    数组化的字幕表: 原始行号、起止时间与调整后的开始时间 (毫秒) 都是 NumPy 数组，
+    筛选、排序、重排时间轴都是向量运算；pysubs2 事件只在保存时才复制生成
+    """
+    def __init__(self, subs, rows, start, end, adjusted_start=None):
+        self.subs = subs  # 原始 SSAFile，保存时从中复制事件、样式与文件信息
+        self.rows = rows  # 在 subs.events 中的下标
+        self.start = start
+        self.end = end
+        self.adjusted_start = np.zeros_like(start) if adjusted_start is None else adjusted_start
+
+    @classmethod
+    def from_subs(cls, subs, first=0, last=None):
+        events = subs.events[first:last]
+        count = len(events)
+        rows = np.arange(first, first + count, dtype=np.int64)
+        start = np.fromiter((e.start for e in events), dtype=np.int64, count=count)
+        end = np.fromiter((e.end for e in events), dtype=np.int64, count=count)
+        return cls(subs, rows, start, end)
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def index(self):
+        """从 1 开始的原始行号"""
+        return self.rows + 1
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    @property
+    def adjusted_end(self):
+        return self.adjusted_start + self.duration
+
+    def take(self, selector):
+        """按布尔掩码或下标数组取出子表"""
+        return CueTable(self.subs, self.rows[selector], self.start[selector], self.end[selector],
+                        self.adjusted_start[selector])
+
+    def plaintexts(self):
+        return [self.subs.events[row].plaintext for row in self.rows.tolist()]
+
+    def sorted(self):
+        """按原始开始时间稳定排序"""
+        return self.take(np.argsort(self.start, kind="stable"))
+
+    def retimed(self):
+        """依次首尾相接: 每条的新开始时间是此前各条时长之和"""
+        adjusted = np.zeros(len(self), dtype=np.int64)
+        np.cumsum(self.duration[:-1], out=adjusted[1:])
+        return CueTable(self.subs, self.rows, self.start, self.end, adjusted)
+
+    def keep_ranges(self, min_duration=0.0):
+        """按开始时间排序的保留区间 (秒)，每段至少 min_duration"""
+        cues = self.sorted()
+        starts = cues.start / 1000
+        return starts, np.maximum(cues.end / 1000, starts + min_duration)
+
+    def to_ssafile(self):
+        """生成 pysubs2 字幕文件，事件为原事件的副本并使用调整后的时间"""
+        result = pysubs2.SSAFile()
+        result.info = self.subs.info.copy()
+        result.styles = self.subs.styles.copy()
+        for row, start, end in zip(self.rows.tolist(), self.adjusted_start.tolist(), self.adjusted_end.tolist()):
+            event = self.subs.events[row].copy()
+            event.start, event.end = start, end
+            result.events.append(event)
+        return result
+
+    def save(self, path, **kwargs):
+        self.to_ssafile().save(path, **kwargs)
+
 class SubtitleProcessor:
     @staticmethod
     def process_subtitles(subs, start_line, end_line, filter_words, progress_callback=None):
-        """处理字幕，过滤指定词语并调整时间轴"""
+        """
+        处理字幕，过滤指定词语并调整时间轴。filter_words 可以是过滤规则列表 (支持 norm:/sub:/re: 前缀)
+        或已编译的 FilterMatcher。返回 (result, segments)，两者是同一张 CueTable: 保存时调用 result.save()，剪辑音频时作为片段信息
+        """
         if progress_callback:
             progress_callback("筛选保留字幕...")
         
         # 筛选需要保留的字幕
-        filtered_events = []
-        total_lines = min(end_line, len(subs.events)) - (start_line - 1)
-        
-        for i in range(start_line - 1, min(end_line, len(subs.events))):
-            event = subs.events[i]
-            if event.plaintext.strip() not in filter_words:
-                new_event = event.copy()
-                filtered_events.append({
-                    "event": new_event,
-                    "original_start": event.start,
-                    "original_end": event.end,
-                    "duration": event.end - event.start
-                })
-            
-            if progress_callback and i % 100 == 0:
-                progress_callback(f"已筛选: {i-start_line+2}/{total_lines}行")
+        cues = CueTable.from_subs(subs, start_line - 1, min(end_line, len(subs.events)))
+        total_lines = len(cues)
+        matcher = filter_words if isinstance(filter_words, FilterMatcher) else get_filter_matcher(filter_words)
+        keep = ~matcher.mask(cues.plaintexts())
         
         if progress_callback:
             progress_callback("调整时间轴...")
         
-        # 按原始时间排序
-        filtered_events.sort(key=lambda x: x["original_start"])
+        # 按原始时间排序后首尾相接，使字幕连续播放
+        cues = cues.take(keep).sorted().retimed()
         
-        # 调整时间轴，使字幕连续播放
-        current_time = 0
-        for item in filtered_events:
-            item["event"].start = current_time
-            item["event"].end = current_time + item["duration"]
-            current_time += item["duration"]
+        if progress_callback:
+            progress_callback(f"字幕处理完成，保留了 {len(cues)}/{total_lines} 行")
         
-        # 创建结果
-        result = pysubs2.SSAFile()
-        result.info = subs.info.copy()
-        result.styles = subs.styles.copy()
-        result.events = [item["event"] for item in filtered_events]
-        
-        # 构建用于音频剪辑的片段信息
-        segments = []
-        for item in filtered_events:
-            segments.append({
-                "start_ms": item["original_start"],
-                "end_ms": item["original_end"],
-                "adjusted_start_ms": item["event"].start,
-                "keep": True,
-                "keep_events": [item]
-            })
+        return cues, cues
+    
+    @staticmethod
+    def _job_context(ctx, use_cache):
+        """沿用调用方的任务环境 (及其缓存设置)；未指定时自建一个，只有 use_cache 为 True 才读写持久缓存"""
+        if ctx is not None:
+            return contextlib.nullcontext(ctx)
+        return JobContext(cache=get_media_cache() if use_cache else None)
+    
+    @staticmethod
+    def _snap_ranges(audio_path, starts, ends, snap_tolerance, ctx=None, use_cache=False):
+        """解码 (或取缓存的) PCM，把区间起止点对齐到附近的安静处，返回按起点重新排序的区间"""
+        with SubtitleProcessor._job_context(ctx, use_cache) as ctx:
+            source_wav = (cached_source_pcm(audio_path, ctx) or
+                          decode_source_pcm(audio_path, ctx.path("source.wav"), ctx))
+            layout, frames = open_wav_frames(source_wav)
+            ranges = refine_cut_points(frames, layout, [(0, a, b, "") for a, b in zip(starts.tolist(), ends.tolist())],
+                                       0.0, snap_tolerance, ctx.memory)
+            del frames  # 先释放映射再清理临时目录
+        starts = np.array([r[1] for r in ranges])
+        ends = np.array([r[2] for r in ranges])
+        order = np.argsort(starts, kind="stable")
+        return starts[order], ends[order]
+    
+    @staticmethod
+    def _incremental_cut(audio_path, output_audio_path, segments, audio_format, gap_threshold, min_duration, progress_callback=None, snap_tolerance=0.0, ctx=None, use_cache=False):
+        """增量重剪: 分块与清单保存在输出文件旁，只重新编码保留字幕有变化的分块"""
+        if not len(segments):
+            raise ValueError("没有需要保留的片段")
+        
+        # 与普通剪辑一致: 保证最小时长，并把间隔小于阈值的相邻字幕连起来
+        starts, ends = segments.keep_ranges(min_duration)
+        gaps = starts[1:] - ends[:-1]
+        bridge = (gaps > 0) & (gaps <= gap_threshold)
+        ends[:-1][bridge] = starts[1:][bridge]
+        subtitles = [(index, start, end, "") for index, start, end in
+                     zip(segments.sorted().index.tolist(), starts.tolist(), ends.tolist())]
+        
+        encoder_args = ["-c:a", audio_format.get("codec", "pcm_s16le"), *audio_format.get("options", [])]
+        with SubtitleProcessor._job_context(ctx, use_cache) as ctx:
+            if progress_callback:
+                progress_callback("解码音频...")
+            source_wav = (cached_source_pcm(audio_path, ctx) or
+                          decode_source_pcm(audio_path, ctx.path("source.wav"), ctx))
+            if snap_tolerance > 0:
+                if progress_callback:
+                    progress_callback("对齐切点到安静处...")
+                layout, frames = open_wav_frames(source_wav)
+                subtitles = refine_cut_points(frames, layout, subtitles, 0.0, snap_tolerance, ctx.memory)
+                del frames
+            if progress_callback:
+                progress_callback("增量编码音频...")
+            incremental_cut(source_wav, subtitles, output_audio_path, audio_format["ext"], "high", ctx,
+                            source_id=source_fingerprint(audio_path), encoder_args=encoder_args)
         
         if progress_callback:
-            progress_callback(f"字幕处理完成，保留了 {len(filtered_events)}/{total_lines} 行")
+            progress_callback("音频处理完成")
+        return True
+    
+    @staticmethod
+    def _extract_segments(audio_path, merged_segments, output_wav, ctx, progress_callback=None):
+        """
+        备用方法: 片段按帧数均分为若干连续的组并发提取，每组一个解码会话按时间顺序
+        逐块 (STREAM_CHUNK_BYTES) 读取，直接写入预先分配好的 WAV 中各自的位置，每组只占用一块的内存额度。
+        每个片段都校验帧数，不符时换新会话重试，仍失败则整体报错，不会悄悄输出一个更短的文件。
+        ctx.cancel() 可随时中止
+        """
+        # 只探测一次，各解码会话共用探测结果；容器给出的时长可能是估算值，不据此截断片段，
+        # 以实际解码出的帧数为准校验
+        info = probe_audio(audio_path, ctx)
+        probe = DecodeSession(audio_path, ctx, info=info)
+        layout, rate = probe.layout, probe.layout.sample_rate
+        starts = np.round(np.array([seg["start"] for seg in merged_segments]) * rate).astype(np.int64)
+        ends = np.round(np.array([seg["end"] for seg in merged_segments]) * rate).astype(np.int64)
+        lengths = ends - starts
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        total = int(offsets[-1])
+        if not total:
+            raise ValueError("没有需要保留的片段")
+        output = allocate_wav(output_wav, layout, total)
+        
+        # 组数多于线程数，各线程先做完的继续领取，负载更均衡；
+        # 不能精确定位的输入 (如没有 PyAV 时的 MP3) 每组都要从头解码，只分一组
+        groups = ctx.max_workers * 4 if probe.exact_seek else 1
+        targets = np.linspace(0, total, groups + 1)[:-1]
+        bounds = np.unique(np.r_[np.searchsorted(offsets[1:], targets, side='right'), len(lengths)])
+        tolerance = int(SEGMENT_TOLERANCE * rate)
+        chunk_frames = max(1, STREAM_CHUNK_BYTES // layout.block_align)
+        failed = threading.Event()
+        done = [0]
+        done_lock = threading.Lock()
+        
+        def stopped():
+            return failed.is_set() or ctx.registry.cancelled.is_set()
+        
+        def extract(first, last):
+            # 读出的一块与解码会话内部的缓冲各占一块
+            with ctx.memory.reserve(2 * chunk_frames * layout.block_align):
+                _extract(first, last)
+        
+        def read_segment(session, i):
+            """逐块读取第 i 个片段写入输出，返回读到的帧数 (到达音频末尾时少于片段长度)"""
+            got = 0
+            for a in range(int(starts[i]), int(ends[i]), chunk_frames):
+                if stopped():
+                    break
+                b = min(int(ends[i]), a + chunk_frames)
+                frames = session.read(a, b)
+                output[offsets[i] + got:offsets[i] + got + len(frames)] = frames
+                got += len(frames)
+                if len(frames) < b - a:
+                    break
+            return got
+        
+        def _extract(first, last):
+            session = DecodeSession(audio_path, ctx, rate, layout.channels, info=info)
+            try:
+                for i in range(first, last):
+                    got, error = 0, None
+                    for attempt in range(SEGMENT_RETRIES + 1):
+                        if stopped():
+                            raise RuntimeError("任务已取消")
+                        try:
+                            got = read_segment(session, i)
+                            # 只有到达音频末尾的片段允许略短，缺少的部分保持静音
+                            if got == lengths[i] or (i == len(lengths) - 1 and lengths[i] - got <= tolerance):
+                                break
+                        except (RuntimeError, OSError, ValueError) as e:
+                            error = e
+                        # 读取出错或帧数不符时丢弃当前会话，用新会话重试
+                        session.close()
+                        session = DecodeSession(audio_path, ctx, rate, layout.channels, info=info)
+                    else:
+                        if error is None and got < lengths[i]:
+                            raise RuntimeError(f"片段 {i + 1} ({starts[i] / rate:.2f}s - {ends[i] / rate:.2f}s) "
+                                               f"超出音频实际长度，只解码出 {got}/{lengths[i]} 帧")
+                        raise RuntimeError(f"片段 {i + 1} 提取失败 (期望 {lengths[i]} 帧，实际 {got} 帧)"
+                                           f"{f': {error}' if error else ''}")
+                    with done_lock:
+                        done[0] += 1
+                        count = done[0]
+                    if progress_callback and count % 50 == 0:
+                        progress_callback(f"处理片段 {count}/{len(lengths)}...")
+            finally:
+                session.close()
         
-        return result, segments
+        try:
+            with ThreadPoolExecutor(max_workers=ctx.max_workers) as executor:
+                futures = [executor.submit(extract, a, b) for a, b in zip(bounds[:-1], bounds[1:])]
+                try:
+                    for future in as_completed(futures):
+                        future.result()
+                except BaseException:
+                    # 任一组失败或被中断时通知其余组尽快停下，未开始的组不再执行
+                    failed.set()
+                    for future in futures:
+                        future.cancel()
+                    raise
+            output.flush()
+        finally:
+            del output
     
     @staticmethod
-    def cut_audio_by_segments(audio_path, output_audio_path, segments, audio_format, gap_threshold=0.1, min_duration=0.05, progress_callback=None):
+    def cut_audio_by_segments(audio_path, output_audio_path, segments, audio_format, gap_threshold=0.1, min_duration=0.05, progress_callback=None, incremental=False, snap_tolerance=0.0, ctx=None, use_cache=False):
         """
         剪辑音频，匹配字幕时间轴
         
@@ -105,46 +317,40 @@ class SubtitleProcessor:
             gap_threshold: 合并间隔阈值(秒)
             min_duration: 最小片段时长(秒)
             progress_callback: 进度回调函数
+            incremental: 增量重剪 (仅MP3/WAV)，重跑时只重新编码有变化的分块
+            snap_tolerance: 切点对齐范围(秒)，大于 0 时把每个切点移到该范围内最近的安静处
+            ctx: 任务环境 (JobContext)，备用方法用它并发提取，调用 ctx.cancel() 可中止；
+                 不指定时自建一个，使用全部 CPU 核
+            use_cache: 未指定 ctx 时是否读写持久缓存 (增量重剪与切点对齐解码出的整段 PCM)；
+                 指定了 ctx 时沿用 ctx.cache
         """
         if progress_callback:
             progress_callback("准备音频片段...")
         
-        # 收集需要保留的片段
-        keep_segments = []
-        for seg in segments:
-            if seg.get("keep"):
-                for item in seg["keep_events"]:
-                    start = item["original_start"] / 1000
-                    end = item["original_end"] / 1000
-                    
-                    # 确保最小时长
-                    if end - start < min_duration:
-                        end = start + min_duration
-                        
-                    keep_segments.append({"start": start, "end": end})
+        if incremental and audio_format.get("ext") in RECUT_FORMATS:
+            return SubtitleProcessor._incremental_cut(audio_path, output_audio_path, segments, audio_format,
+                                                      gap_threshold, min_duration, progress_callback, snap_tolerance,
+                                                      ctx, use_cache)
         
-        if not keep_segments:
+        if not len(segments):
             if progress_callback:
                 progress_callback("没有找到需要保留的片段")
             raise ValueError("没有需要保留的片段")
         
-        # 排序并合并接近的片段
+        # 收集需要保留的片段 (已按开始时间排序并保证最小时长)，合并接近的片段
         if progress_callback:
             progress_callback("合并接近片段...")
-            
-        keep_segments.sort(key=lambda x: x["start"])
-        merged_segments = []
-        current = keep_segments[0]
-        
-        for next_seg in keep_segments[1:]:
-            if next_seg["start"] - current["end"] <= gap_threshold:
-                # 合并片段
-                current["end"] = max(current["end"], next_seg["end"])
-            else:
-                merged_segments.append(current)
-                current = next_seg
         
-        merged_segments.append(current)
+        starts, ends = segments.keep_ranges(min_duration)
+        if snap_tolerance > 0:
+            if progress_callback:
+                progress_callback("对齐切点到安静处...")
+            starts, ends = SubtitleProcessor._snap_ranges(audio_path, starts, ends, snap_tolerance, ctx, use_cache)
+        # 排序后到此为止的最大结束时间即所在合并组的结束时间；与其间隔超过阈值处开始新的一组
+        reach = np.maximum.accumulate(ends)
+        first = np.flatnonzero(np.r_[True, starts[1:] - reach[:-1] > gap_threshold])
+        merged_segments = [{"start": start, "end": end} for start, end in
+                           zip(starts[first].tolist(), np.maximum.reduceat(ends, first).tolist())]
         
         if progress_callback:
             progress_callback(f"音频处理: {len(merged_segments)} 个片段")
@@ -159,59 +365,24 @@ class SubtitleProcessor:
                 # 先创建一个临时WAV文件
                 temp_wav = os.path.join(temp_dir, "temp_output.wav")
                 
-                # 方法1: 复杂滤镜方法 (适用于片段数量适中的情况)
-                if len(merged_segments) <= 200:
-                    if progress_callback:
-                        progress_callback("使用滤镜处理音频...")
-                    
-                    filter_parts = []
-                    concat_parts = []
-                    
-                    for i, seg in enumerate(merged_segments):
-                        segment_id = f"seg_{i}"
-                        filter_parts.append(f"[0:a]atrim=start={seg['start']:.6f}:end={seg['end']:.6f},asetpts=PTS-STARTPTS[{segment_id}]")
-                        concat_parts.append(f"[{segment_id}]")
-                    
-                    filter_complex = ";".join(filter_parts)
-                    if len(merged_segments) > 1:
-                        filter_complex += ";" + "".join(concat_parts) + f"concat=n={len(merged_segments)}:v=0:a=1[out]"
-                        map_param = "[out]"
-                    else:
-                        map_param = concat_parts[0]
-                    
-                    command = [
-                        "ffmpeg", "-y", 
-                        "-i", audio_path,
-                        "-filter_complex", filter_complex,
-                        "-map", map_param, 
-                        "-acodec", "pcm_s16le",  # 先用无损格式
-                        temp_wav
-                    ]
-                    
-                    subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-                    
-                # 方法2: EDL方法 (适用于片段数量较多的情况)
-                else:
-                    if progress_callback:
-                        progress_callback("使用EDL方式处理音频...")
-                    
-                    edl_path = os.path.join(temp_dir, "segments.edl")
-                    with open(edl_path, "w", encoding="utf-8") as f:
-                        for seg in merged_segments:
-                            f.write(f"file '{audio_path}'\n")
-                            f.write(f"inpoint {seg['start']:.6f}\n")
-                            f.write(f"outpoint {seg['end']:.6f}\n")
-                    
-                    command = [
-                        "ffmpeg", "-y", 
-                        "-f", "concat", 
-                        "-safe", "0",
-                        "-i", edl_path, 
-                        "-c:a", "pcm_s16le",  # 先用无损格式
-                        temp_wav
-                    ]
-                    
-                    subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+                # 方法1: 复杂滤镜方法，过滤图写入脚本文件并分层 concat，片段数量不受限制
+                if progress_callback:
+                    progress_callback("使用滤镜处理音频...")
+                
+                filter_graph, map_label = audio_trim_graph(
+                    [(seg["start"], seg["end"]) for seg in merged_segments])
+                filter_script = write_filter_script(os.path.join(temp_dir, "filter_complex.txt"), filter_graph)
+                
+                command = [
+                    "ffmpeg", "-y", 
+                    "-i", audio_path,
+                    "-filter_complex_script", filter_script,
+                    "-map", f"[{map_label}]", 
+                    "-acodec", "pcm_s16le",  # 先用无损格式
+                    temp_wav
+                ]
+                
+                subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
                 
                 # 转换为最终格式
                 if progress_callback:
@@ -238,43 +409,15 @@ class SubtitleProcessor:
                     progress_callback(f"尝试备用方法: {str(e)[:50]}...")
                 
                 try:
-                    # 单文件EDL备用方法
-                    concat_file = os.path.join(temp_dir, "concat.txt")
-                    with open(concat_file, "w", encoding="utf-8") as f:
-                        for i, seg in enumerate(merged_segments):
-                            temp_file = os.path.join(temp_dir, f"part_{i:04d}.wav")
-                            
-                            # 截取单个片段
-                            cmd = [
-                                "ffmpeg", "-y", 
-                                "-i", audio_path,
-                                "-ss", f"{seg['start']:.6f}",
-                                "-to", f"{seg['end']:.6f}",
-                                "-c:a", "pcm_s16le",
-                                temp_file
-                            ]
-                            
-                            if i % 10 == 0 and progress_callback:
-                                progress_callback(f"处理片段 {i+1}/{len(merged_segments)}...")
-                            
-                            subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                            f.write(f"file '{temp_file}'\n")
-                    
-                    if progress_callback:
-                        progress_callback("合并音频片段...")
-                    
-                    # 先合并为WAV
+                    # 备用方法: 各片段并发地从解码会话中读出，不再为每个片段启动一个 ffmpeg
                     temp_wav = os.path.join(temp_dir, "merged.wav")
-                    merge_cmd = [
-                        "ffmpeg", "-y", 
-                        "-f", "concat",
-                        "-safe", "0",
-                        "-i", concat_file,
-                        "-c:a", "pcm_s16le",
-                        temp_wav
-                    ]
-                    
-                    subprocess.run(merge_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                    if ctx is None:
+                        with JobContext(max_workers=os.cpu_count()) as own_ctx:
+                            SubtitleProcessor._extract_segments(audio_path, merged_segments, temp_wav, own_ctx,
+                                                                progress_callback)
+                    else:
+                        SubtitleProcessor._extract_segments(audio_path, merged_segments, temp_wav, ctx,
+                                                            progress_callback)
                     
                     # 转换为最终格式
                     if progress_callback:
@@ -288,7 +431,7 @@ class SubtitleProcessor:
                     
                     final_command.append(output_audio_path)
                     
-                    subprocess.run(final_command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                    subprocess.run(final_command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
                     
                     if progress_callback:
                         progress_callback("音频处理完成")
@@ -303,16 +446,13 @@ class SubtitleProcessor:
     @staticmethod
     def export_segments_json(segments, output_json_path):
         """导出片段映射信息到JSON文件"""
-        data = []
-        for seg in segments:
-            if seg.get("keep"):
-                for item in seg["keep_events"]:
-                    data.append({
-                        "original_start": round(item["original_start"] / 1000, 3),
-                        "original_end": round(item["original_end"] / 1000, 3),
-                        "duration": round((item["original_end"] - item["original_start"]) / 1000, 3),
-                        "adjusted_start": round(item["event"].start / 1000, 3)
-                    })
+        columns = zip(segments.start.tolist(), segments.end.tolist(), segments.adjusted_start.tolist())
+        data = [{
+            "original_start": round(start / 1000, 3),
+            "original_end": round(end / 1000, 3),
+            "duration": round((end - start) / 1000, 3),
+            "adjusted_start": round(adjusted / 1000, 3)
+        } for start, end, adjusted in columns]
         
         with open(output_json_path, "w", encoding="utf-8") as f:
             json.dump(data, f, indent=2, ensure_ascii=False)
@@ -380,12 +520,12 @@ class SubtitleEditorApp:
         # 加载已保存的字幕文件(如果有)
         if self.input_path.get():
             try:
-                subs = pysubs2.load(self.input_path.get())
-                self.total_label.set(f"总行数: {len(subs.events)}")
+                total = count_subtitle_cues(self.input_path.get())
+                self.total_label.set(f"总行数: {total}")
                 if not self.start_entry.get():
                     self.start_entry.insert(0, "1")
                 if not self.end_entry.get():
-                    self.end_entry.insert(0, str(len(subs.events)))
+                    self.end_entry.insert(0, str(total))
             except:
                 pass
     
@@ -531,12 +671,13 @@ class SubtitleEditorApp:
         if path:
             self.input_path.set(path)
             try:
-                subs = pysubs2.load(path)
-                self.total_label.set(f"总行数: {len(subs.events)}")
+                # 只统计行数，不解析整个文件
+                total = count_subtitle_cues(path)
+                self.total_label.set(f"总行数: {total}")
                 self.start_entry.delete(0, tk.END)
                 self.start_entry.insert(0, "1")
                 self.end_entry.delete(0, tk.END)
-                self.end_entry.insert(0, str(len(subs.events)))
+                self.end_entry.insert(0, str(total))
                 self.output_path.set(os.path.splitext(path)[0] + "_cut.ass")
             except Exception as e:
                 self.total_label.set("加载失败")
@@ -627,8 +768,8 @@ class SubtitleEditorApp:
             self.root.update()
             self.preview_text.delete("1.0", tk.END)
             
-            for event in edited.events:
-                self.preview_text.insert(tk.END, f"[{event.start/1000:.3f}s - {event.end/1000:.3f}s] {event.plaintext.strip()}\n")
+            for start, end, text in zip(edited.adjusted_start.tolist(), edited.adjusted_end.tolist(), edited.plaintexts()):
+                self.preview_text.insert(tk.END, f"[{start/1000:.3f}s - {end/1000:.3f}s] {text.strip()}\n")
             
             # 处理音频(如果有)
             if self.audio_file:
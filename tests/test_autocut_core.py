@@ -0,0 +1,167 @@
+import functools, shutil, struct, sys, wave
+import numpy as np
+import pytest
+import srt
+
+import autocut_core
+
+OVERLAPPING = [(1, 1.0, 4.0, "一"), (2, 3.0, 6.0, "二"), (3, 10.0, 12.0, "三")]
+
+def _write_srt(path, cues):
+    subs = [srt.Subtitle(index, srt.timedelta(seconds=start), srt.timedelta(seconds=end), content)
+            for index, start, end, content in cues]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(srt.compose(subs))
+
+def _srt_end(path):
+    with open(path, encoding="utf-8") as f:
+        return max(sub.end.total_seconds() for sub in srt.parse(f.read()))
+
+def test_srt_timeline_follows_merged_ranges(tmp_path):
+    output = tmp_path / "out.srt"
+    autocut_core.generate_new_srt(OVERLAPPING, output, set(), 1, 3, OVERLAPPING, 0.0, 44100)
+    starts, ends = autocut_core.compile_keep_ranges(OVERLAPPING, 0.0, 44100)
+    assert (ends - starts).sum() / 44100 == pytest.approx(7.0)
+    assert _srt_end(output) == pytest.approx(7.0)
+    with open(output, encoding="utf-8") as f:
+        subs = list(srt.parse(f.read()))
+    # 第二条从第一条内部的 2.0s 开始，第三条紧接在合并后的区间之后
+    assert [(s.start.total_seconds(), s.end.total_seconds()) for s in subs] == [(0.0, 3.0), (2.0, 5.0), (5.0, 7.0)]
+
+@pytest.mark.skipif(not shutil.which("ffmpeg"), reason="需要 ffmpeg")
+@pytest.mark.parametrize("engine", ["numpy", "stream"])
+def test_main_srt_matches_audio_length(tmp_path, engine):
+    rate = 44100
+    source = tmp_path / "source.wav"
+    with wave.open(str(source), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        t = np.arange(15 * rate) / rate
+        f.writeframes((np.sin(2 * np.pi * 440 * t) * 10000).astype("<i2").tobytes())
+    input_srt = tmp_path / "input.srt"
+    _write_srt(input_srt, OVERLAPPING)
+    output, output_srt = tmp_path / "out.wav", tmp_path / "out.srt"
+
+    autocut_core.main(str(source), str(input_srt), str(output), str(output_srt), "", 1, 3,
+                      output_format="wav", engine=engine, use_cache=False)
+
+    with wave.open(str(output), "rb") as f:
+        audio_seconds = f.getnframes() / f.getframerate()
+    assert audio_seconds == pytest.approx(7.0, abs=0.01)
+    assert _srt_end(output_srt) == pytest.approx(audio_seconds, abs=0.002)
+
+def test_memory_budget_rejects_oversized_reservation():
+    budget = autocut_core.MemoryBudget(1024)
+    with pytest.raises(MemoryError):
+        with budget.reserve(2048):
+            pass
+    with budget.reserve(1024):
+        assert budget.used == 1024
+    assert budget.used == 0
+
+# 多行内容、空行分隔不规范、时间跨小时与 CRLF 混用，块边界会落在字幕头与内容的各个位置
+SRT_SAMPLE = (
+    "1\n00:00:01,000 --> 00:00:02,500\n第一行\n第二行\n\n"
+    "2\r\n00:00:03,040 --> 00:00:04,000\r\nHello, world!\r\n\r\n"
+    "3\n00:59:59,999 --> 01:00:01,001\n<i>跨小时</i>\n\n\n"
+    "4\n01:00:02,000 --> 01:00:03,000\n最后一条\n"
+)
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1 << 20])
+def test_parse_srt_matches_srt_library(tmp_path, monkeypatch, chunk_size):
+    path = tmp_path / "sample.srt"
+    path.write_bytes(SRT_SAMPLE.encode("utf-8"))
+    monkeypatch.setattr(autocut_core, "_iter_srt_cues",
+                        functools.partial(autocut_core._iter_srt_cues, chunk_size=chunk_size))
+    table = autocut_core.parse_srt(str(path))
+    # 内容末尾的空白 parse_srt 统一去掉，srt 库在多余空行时会保留一个换行
+    expected = [(s.index, s.start.total_seconds(), s.end.total_seconds(), s.content.rstrip())
+                for s in srt.parse(SRT_SAMPLE.replace("\r\n", "\n"))]
+    assert [(i, pytest.approx(a, abs=1e-9), pytest.approx(b, abs=1e-9), c) for i, a, b, c in table] == expected
+
+FILTER_TEXTS = ["嗯", " 嗯 ", "嗯。", "ＯＫ!", "ok", "好的，明白吗？", "明白", "第12句", "第1句", "", "呃呃"]
+
+@pytest.mark.parametrize("patterns, expected", [
+    (["嗯", "ok"], [1, 1, 0, 0, 1, 0, 0, 0, 0, 0, 0]),
+    (["norm:OK", "norm:嗯"], [1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0]),
+    (["sub:明白", "sub:呃"], [0, 0, 0, 0, 0, 1, 1, 0, 0, 0, 1]),
+    (["re:^第\\d{2}句$", "re:^嗯"], [1, 1, 1, 0, 0, 0, 0, 1, 0, 0, 0]),
+    (["嗯", "norm:ok", "sub:明白", "re:^第1句$"], [1, 1, 0, 1, 1, 1, 1, 0, 1, 0, 0]),
+])
+def test_filter_matcher_mask_agrees_with_matches(patterns, expected):
+    matcher = autocut_core.FilterMatcher(patterns)
+    mask = matcher.mask(FILTER_TEXTS)
+    assert mask.tolist() == [matcher.matches(t) for t in FILTER_TEXTS]
+    assert mask.tolist() == [bool(e) for e in expected]
+
+def _chunk(chunk_id, payload):
+    return struct.pack("<4sI", chunk_id, len(payload)) + payload + (b"\0" if len(payload) % 2 else b"")
+
+@pytest.mark.parametrize("format_tag, bits, dtype, name", [
+    (autocut_core.WAVE_FORMAT_PCM, 16, "<i2", "s16"),
+    (autocut_core.WAVE_FORMAT_IEEE_FLOAT, 32, "<f4", "f32"),
+])
+def test_read_wav_layout_skips_list_and_reads_extensible(tmp_path, format_tag, bits, dtype, name):
+    channels, rate = 2, 48000
+    samples = (np.arange(20, dtype=np.float64).reshape(10, 2) * 100).astype(dtype)
+    align = channels * bits // 8
+    # WAVE_FORMAT_EXTENSIBLE: 子格式 GUID 的前两个字节是实际格式码
+    fmt = (struct.pack("<HHIIHH", autocut_core.WAVE_FORMAT_EXTENSIBLE, channels, rate, rate * align, align, bits)
+           + struct.pack("<HHI", 22, bits, 3) + struct.pack("<H", format_tag)
+           + b"\x00\x00\x00\x00\x10\x00\x80\x00\x00\xaa\x00\x38\x9b\x71")
+    body = b"WAVE" + _chunk(b"fmt ", fmt) + _chunk(b"LIST", b"INFOISFT\x05\x00\x00\x00odd\0\0") \
+        + _chunk(b"data", samples.tobytes())
+    path = tmp_path / "extensible.wav"
+    path.write_bytes(b"RIFF" + struct.pack("<I", len(body)) + body)
+
+    layout = autocut_core.read_wav_layout(str(path))
+    assert (layout.sample_format, layout.channels, layout.sample_rate, layout.frames) == (name, 2, rate, 10)
+    _, frames = autocut_core.open_wav_frames(str(path), layout)
+    assert np.array_equal(np.asarray(frames), samples)
+
+class _SmallBatches(autocut_core.MemoryBudget):
+    """批次大小固定为指定帧数的预算，用来强制按不同位置切分批次"""
+    def __init__(self, frames, frame_bytes):
+        super().__init__(1 << 30)
+        self.frames, self.frame_bytes = frames, frame_bytes
+
+    def batch_bytes(self):
+        return self.frames * self.frame_bytes
+
+def _cut(audio, starts, ends, budget, max_ranges=None, splice=None):
+    return np.concatenate(list(autocut_core.iter_cut_batches(audio, starts, ends, budget, max_ranges, splice)))
+
+@pytest.mark.parametrize("mode", ["crossfade", "zerocross"])
+def test_splices_do_not_depend_on_batch_split(mode):
+    rng = np.random.default_rng(0)
+    audio = (rng.standard_normal((20000, 2)) * 3000).astype(np.int16)
+    starts = np.array([100, 3000, 3400, 9000, 15000], dtype=np.int64)
+    ends = np.array([2500, 3300, 8000, 12000, 19990], dtype=np.int64)
+    starts, ends, plan = autocut_core.plan_splices(audio, starts, ends, 44100, mode, 0.01)
+    whole = _cut(audio, starts, ends, autocut_core.MemoryBudget(1 << 30), splice=plan)
+    assert len(whole) == int((ends - starts).sum())
+    if mode == "crossfade":
+        assert not np.array_equal(whole, _cut(audio, starts, ends, autocut_core.MemoryBudget(1 << 30)))
+    for frames in (1, 97, 441, 1000, 5000):
+        assert np.array_equal(_cut(audio, starts, ends, _SmallBatches(frames, 4), splice=plan), whole)
+    for max_ranges in (1, 2, 3):
+        assert np.array_equal(_cut(audio, starts, ends, autocut_core.MemoryBudget(1 << 30), max_ranges, plan), whole)
+
+def test_process_spawned_during_cancel_is_terminated(monkeypatch):
+    registry = autocut_core.ProcessRegistry()
+    started = []
+    real_popen = autocut_core.subprocess.Popen
+
+    def popen_then_cancel(*args, **kwargs):
+        # 模拟 cancel() 恰好在 Popen 与登记之间执行
+        proc = real_popen(*args, **kwargs)
+        started.append(proc)
+        registry.cancel()
+        return proc
+
+    monkeypatch.setattr(autocut_core.subprocess, "Popen", popen_then_cancel)
+    with pytest.raises(RuntimeError):
+        registry.spawn([sys.executable, "-c", "import time; time.sleep(30)"])
+    assert started[0].poll() is not None
+    assert not registry.processes